@@ -29,7 +29,11 @@ setup(
     install_requires=[
         'requests>=2.1',
         'six',
+        'futures; python_version < "3"',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+    },
     license='MIT License',
     keywords='ticketbis api',
     include_package_data=True,
@@ -3,44 +3,66 @@
 # (c) 2015 Ticketbis
 import logging; log = logging.getLogger(__name__)
 
-# Try to load JSON libraries in this order:
-# ujson -> simplejson -> json
-try:
-    import ujson as json
-except ImportError:
-    try:
-        import simplejson as json
-    except ImportError:
-        import json
-
-import inspect
+import importlib
+import itertools
 import math
+import re
+import threading
 import time
 import sys
+import types
+from collections import OrderedDict, deque, namedtuple
 from copy import copy
 
-# 3rd party libraries that might not be present during initial install
 try:
-    import requests
+    import contextvars
+except ImportError:
+    contextvars = None
 
+# 3rd party libraries that might not be present during initial install.
+# requests is imported by the first client, see ticketbis.transports
+try:
     from six.moves.urllib import parse
     from six.moves import xrange
     import six
-
-    # Monkey patch to requests' json using ujson when available;
-    # Otherwise it wouldn't affect anything
-    requests.models.json = json
 except ImportError:
     pass
 
 
+class _JSON(object):
+    """
+    JSON library, the first one available of ujson -> simplejson -> json.
+    Imported on first use, as looking for them slows down importing
+    """
+
+    def __getattr__(self, name):
+        try:
+            import ujson as module
+        except ImportError:
+            try:
+                import simplejson as module
+            except ImportError:
+                import json as module
+        value = getattr(module, name)
+        # Found right away from now on
+        setattr(self, name, value)
+        return value
+
+json = _JSON()
+
+from ticketbis.streaming import CHUNK_SIZE, iter_json_items
+from ticketbis.models import (Category, City, Event, Schema, SectionGroup,
+        Site, Venue)
+
+
 # Helpful for debugging what goes in and out
 NETWORK_DEBUG = False
 if NETWORK_DEBUG:
     # Enables debugging at httplib level (requests->urllib3->httplib)
     # The only thing missing will be the response.body which is not logged.
-    import httplib
-    httplib.HTTPConnection.debuglevel = 1
+    # See ticketbis.metrics for per-client instrumentation instead
+    from six.moves import http_client
+    http_client.HTTPConnection.debuglevel = 1
 
     # You must initialize logging, otherwise you'll not see debug output.
     logging.basicConfig()
@@ -50,6 +72,11 @@ if NETWORK_DEBUG:
     requests_log.propagate = True
 
 
+# Metadata of a response, see Ticketbis.last_meta
+ResponseMeta = namedtuple('ResponseMeta', ('site', 'rate_limit',
+        'rate_remaining', 'total_count', 'page_offset', 'page_max'))
+EMPTY_META = ResponseMeta(None, None, None, None, None, None)
+
 # Default API version.
 API_VERSION = 1
 
@@ -61,12 +88,21 @@ API_ENDPOINT = 'https://api.ticketbis.com/'
 AUTH_ENDPOINT = 'oauth/authorize/'
 TOKEN_ENDPOINT = 'oauth/token/'
 
-# Number of times to retry http requests
-NUM_REQUEST_RETRIES = 1
+# Number of attempts of http requests (see ticketbis.retry)
+NUM_REQUEST_RETRIES = 3
 
 # Max number of sub-requests per multi request
 MAX_MULTI_REQUESTS = 5
 
+# Connection pooling defaults: number of per-host pools to keep and max number
+# of connections kept alive in each one of them
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Calls buffered ahead of the consumer, per worker, when fetching pages or
+# multi requests concurrently (see pagination_workers and multi_workers)
+IN_FLIGHT_PER_WORKER = 2
+
 # Change this if your Python distribution has issues with Ticketbis's SSL cert
 VERIFY_SSL = True
 
@@ -76,7 +112,9 @@ CLIENT_CRED_GRANT_TYPE = 'client_credentials'
 
 
 # Exceptions
-class TicketbisException(RuntimeError): pass
+class TicketbisException(RuntimeError):
+    # Headers of the response that raised the exception, if any
+    headers = None
 class InvalidAuth(TicketbisException): pass
 class ParamError(TicketbisException): pass
 class EndpointError(TicketbisException): pass
@@ -104,38 +142,162 @@ error_types = {
 
 class Ticketbis(object):
     """Ticketbis API wrapper"""
+    # Client whose connections are shared by this one, see localized
+    _parent = None
 
     def __init__(self, client_id=None, client_secret=None, access_token=None,
             redirect_uri=None, version=None, site=None, lang='en-gb',
-            grant_type=AUTH_CODE_GRANT_TYPE, api_endpoint=API_ENDPOINT, auth=None):
+            grant_type=AUTH_CODE_GRANT_TYPE, api_endpoint=API_ENDPOINT, auth=None,
+            pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            pagination_workers=0, pagination_in_flight=None, multi_workers=0,
+            cache=None, rate_limiter=None, retry_policy=None, stream=False,
+            models=False, metrics=None, bulk_workers=0, coalesce=False,
+            auto_batch=False, batch_window=None, token_manager=None,
+            json_loads=None, catalogue=None, compression=False,
+            compress_min_size=None, transport=None):
         """Sets up the api object"""
-        self.oauth = self.OAuth(api_endpoint, client_id, client_secret,
-                redirect_uri, grant_type)
+        # Clients sharing a ticketbis.tokens.TokenManager get its token on
+        # their first request, and every new one
+        self.token_manager = token_manager
         # Set up endpoints
         self.base_requester = self.Requester(api_endpoint, client_id, client_secret,
-                access_token, version, site, lang, auth)
+                access_token, version, site, lang, auth,
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                keep_alive=keep_alive, pagination_workers=pagination_workers,
+                pagination_in_flight=pagination_in_flight,
+                multi_workers=multi_workers, cache=cache,
+                rate_limiter=rate_limiter, retry_policy=retry_policy,
+                stream=stream, models=models, metrics=metrics,
+                bulk_workers=bulk_workers, coalesce=coalesce,
+                auto_batch=auto_batch, batch_window=batch_window,
+                token_manager=token_manager, json_loads=json_loads,
+                catalogue=catalogue, compression=compression,
+                compress_min_size=compress_min_size, transport=transport)
+        # OAuth shares the requester's connection pool
+        self.oauth = self.OAuth(api_endpoint, client_id, client_secret,
+                redirect_uri, grant_type, requester=self.base_requester)
 
         # Dynamically enable endpoints
         self._attach_endpoints()
 
-        # resolves site
-        if not site and access_token:
-            # forces API to return site according to lang
-            # (gets site from response header)
-            self.sites(params={'max': 1})
+        if token_manager is not None:
+            token_manager.subscribe(self.set_access_token)
+
+        # The site is resolved by the first response, or on first use of
+        # the site property if asked for before any request
+
+    def _resolve_site(self):
+        """Forces API to return site according to lang"""
+        # (gets site from response header, never batched)
+        self.base_requester.GET(self.Sites.endpoint, params={'max': 1})
 
     def _attach_endpoints(self):
-        """Dynamically attach endpoint callables to this client"""
-        for name, endpoint in inspect.getmembers(self):
-            if inspect.isclass(endpoint) and issubclass(endpoint,
-                    self._Endpoint) and (endpoint is not self._Endpoint):
-                endpoint_instance = endpoint(self.base_requester)
-                setattr(self, endpoint_instance.endpoint, endpoint_instance)
+        """
+        Dynamically attach endpoint callables to this client. Endpoints
+        are found once per class, and created on first use by __getattr__
+        """
+        self._endpoint_classes()
+
+    @classmethod
+    def _endpoint_classes(cls):
+        """Endpoint classes of this client class by attribute name"""
+        endpoints = cls.__dict__.get('_endpoints')
+        if endpoints is None:
+            import inspect
+            endpoints = {}
+            for name, endpoint in inspect.getmembers(cls):
+                if inspect.isclass(endpoint) and issubclass(endpoint,
+                        cls._Endpoint) and (endpoint is not cls._Endpoint):
+                    endpoints[endpoint.endpoint] = endpoint
+            cls._endpoints = endpoints
+        return endpoints
+
+    def __getattr__(self, name):
+        """Creates endpoints on first use"""
+        endpoint = None
+        if not name.startswith('_') and 'base_requester' in self.__dict__:
+            endpoint = self._endpoint_classes().get(name)
+        if endpoint is None:
+            raise AttributeError(name)
+        endpoint_instance = endpoint(self.base_requester)
+        setattr(self, name, endpoint_instance)
+        return endpoint_instance
 
     def set_access_token(self, access_token):
         """Update the access token to use"""
         self.base_requester.set_token(access_token)
 
+    def close(self):
+        """Closes the pooled connections held by this client"""
+        if self.token_manager is not None:
+            self.token_manager.unsubscribe(self.set_access_token)
+        # Localized clients leave them to the client they come from
+        if self._parent is None:
+            self.base_requester.close()
+
+    def localized(self, site=None, lang=None):
+        """
+        Client of another site, or of the site of another lang, sharing the
+        connections, rate limiter, cache, metrics and catalogue of this one
+        """
+        client = copy(self)
+        # Endpoints are created again for the new requester
+        for name in self._endpoint_classes():
+            client.__dict__.pop(name, None)
+        client.base_requester = self.base_requester.localized(site, lang)
+        client.token_manager = None
+        client._parent = self._parent or self
+        return client
+
+    def fan_out(self, call, sites=None, langs=None, workers=None):
+        """
+        Calls call with a localized client of every site and lang given, all
+        at once unless workers is given (0 for one after another). Returns
+        the results by site or lang, in the order given, the
+        TicketbisException raised instead for those failing. Listings
+        returned are read by the worker.
+        """
+        clients = self._localized_clients(sites, langs)
+        workers = len(clients) if workers is None else workers
+
+        def run(target):
+            key, client = target
+            try:
+                result = call(client)
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)
+                return key, result
+            except TicketbisException as e:
+                return key, e
+        if not workers:
+            return OrderedDict(run(target) for target in clients)
+        return OrderedDict(_ordered_map(run, clients, workers))
+
+    def _localized_clients(self, sites, langs):
+        """Localized clients of sites and langs, with their key"""
+        return [(site, self.localized(site=site)) for site in sites or ()] + \
+            [(lang, self.localized(lang=lang)) for lang in langs or ()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def metrics(self):
+        """Returns the ticketbis.metrics.Metrics of this client, if any"""
+        return self.base_requester.metrics
+
+    @property
+    def last_meta(self):
+        """
+        Returns the ResponseMeta of the last API call made by the current
+        thread or coroutine, see Requester.last_meta
+        """
+        return self.base_requester.last_meta
+
     @property
     def rate_limit(self):
         """Returns the maximum rate limit for the last API call"""
@@ -158,10 +320,12 @@ class Ticketbis(object):
 
     @property
     def site(self):
-        """Returns site name"""
+        """Returns site name, resolving it if no response told it yet"""
+        if self.base_requester.site is None and \
+                not self.base_requester.userless:
+            self._resolve_site()
         return self.base_requester.site
 
-
     @property
     def rate_remaining(self):
         """
@@ -173,12 +337,13 @@ class Ticketbis(object):
     class OAuth(object):
         """Handles OAuth authentication procedures and helps retrieve tokens"""
         def __init__(self, api_endpoint, client_id, client_secret, redirect_uri,
-                grant_type):
+                grant_type, requester=None):
             self.api_endpoint = api_endpoint
             self.client_id = client_id
             self.client_secret = client_secret
             self.redirect_uri = redirect_uri
             self.grant_type = grant_type
+            self.requester = requester
 
         def auth_url(self):
             """Gets the url a user needs to access to give up a user token"""
@@ -194,6 +359,33 @@ class Ticketbis(object):
 
         def get_token(self, code=None, scope='read write'):
             """Gets the auth token from a user's response"""
+            data = self.request_token(code, scope)
+            if data is None:
+                return None
+            return data['access_token']
+
+        def request_token(self, code=None, scope='read write'):
+            """
+            Gets the token response (access_token, expires_in...) from a
+            user's response, None if code is missing
+            """
+            params = self._token_params(code, scope)
+            if params is None:
+                return None
+
+            # Get the response from the token uri and attempt to parse
+            if self.requester is not None:
+                res = _request(self.requester.transport, 'POST',
+                        self._token_url(), data=params)
+            else:
+                res = _post(self._token_url(), data=params)
+            return res['data']
+
+        def _token_url(self):
+            return '{0}{1}'.format(self.api_endpoint, TOKEN_ENDPOINT)
+
+        def _token_params(self, code=None, scope='read write'):
+            """Builds the token request params, None if code is missing"""
             params = {
                 'client_id': self.client_id,
                 'client_secret': self.client_secret,
@@ -209,46 +401,192 @@ class Ticketbis(object):
                     params['code'] = six.u(code)
             elif self.grant_type == CLIENT_CRED_GRANT_TYPE:
                 params['scope'] = scope
-
-
-            # Get the response from the token uri and attempt to parse
-            token_endpoint = '{0}{1}'.format(self.api_endpoint, TOKEN_ENDPOINT)
-            res = _post(token_endpoint, data=params)
-            return res['data']['access_token']
+            return params
 
     class Requester(object):
         """Api requesting object"""
         def __init__(self, api_endpoint, client_id=None, client_secret=None,
-                access_token=None, version=None, site=None, lang=None, auth=None):
+                access_token=None, version=None, site=None, lang=None, auth=None,
+                pool_connections=DEFAULT_POOL_CONNECTIONS,
+                pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+                pagination_workers=0, pagination_in_flight=None,
+                multi_workers=0, cache=None, rate_limiter=None,
+                retry_policy=None, stream=False, models=False, metrics=None,
+                bulk_workers=0, coalesce=False, auto_batch=False,
+                batch_window=None, token_manager=None, json_loads=None,
+                catalogue=None, compression=False, compress_min_size=None,
+                transport=None):
             """Sets up the api object"""
             self.client_id = client_id
             self.client_secret = client_secret
+            # Gives the token on first use, and renews the token of requests
+            # failing with InvalidAuth
+            self.token_manager = token_manager
             self.set_token(access_token)
             self.version = version or API_VERSION
-            self.site = site
             self.lang = lang
-            self.multi_requests = list()
-            self.rate_limit = None
-            self.rate_remaining = None
-            self.rate_remaining = None
             self.api_endpoint = api_endpoint
+            # Sites resolved by other clients with the same token and lang
+            # are reused
+            self.site = site or _site_cache.get(self._site_key())
+            # Response metadata and multi requests are kept per thread (and
+            # coroutine), so a requester can be shared by a pool of workers
+            self._meta = _ContextValue('ticketbis_meta')
+            self._multi_requests = _ContextValue('ticketbis_multi_requests')
+            # Multi request chunks are sent concurrently when there are workers
+            self.multi_workers = multi_workers
+            # Records of bulk writes are sent concurrently when there are
+            # workers
+            self.bulk_workers = bulk_workers
             self.auth = auth
+            # Opt-in ticketbis.cache.ResponseCache for GET requests
+            self.cache = cache
+            # Opt-in ticketbis.ratelimit.RateLimiter shared by every request
+            self.rate_limiter = rate_limiter
+            # ticketbis.retry.RetryPolicy deciding which failures are retried
+            self.retry_policy = retry_policy or RetryPolicy()
+            # Opt-in ticketbis.metrics.Metrics, nothing is measured otherwise
+            self.metrics = metrics
+            # Decodes the bodies of responses, json.loads by default
+            self.json_loads = json_loads
+            # Opt-in ticketbis.store.CatalogueStore every result is upserted to
+            self.catalogue = catalogue
+            # Identical concurrent GETs share a request when coalescing
+            self.single_flight = self._create_single_flight() if coalesce \
+                else None
+            # Endpoint GETs by id return futures, gathered into /multi calls
+            self.batcher = None
+            if auto_batch:
+                self.batcher = self._create_batcher(batch_window)
+            # ticketbis.transports.RequestsTransport unless given one
+            self.transport = transport or self._create_transport(
+                    pool_connections, pool_maxsize, keep_alive)
+            # The requests session of the default transport, if any
+            self.session = getattr(self.transport, 'session', None)
 
             """ pagination """
-            self.total_count = None
-            self.page_offset = None
-            self.page_max = None
+            # Remaining pages are fetched concurrently when there are workers
+            self.pagination_workers = pagination_workers
+            self.pagination_in_flight = pagination_in_flight or \
+                IN_FLIGHT_PER_WORKER * pagination_workers
+            # Decode the items of each page as they arrive when paginating
+            # one page after another
+            self.stream = stream
+            # Wrap results in the compact ticketbis.models classes
+            self.models = models
 
             api_v = 'application/vnd.ticketbis.v{0}+json'.format(self.version)
             self.base_headers = {
                 'Accept': '{0}, application/json'.format(api_v),
                 'Content-Type': 'application/json',
             }
+            # Left to the HTTP library unless asked for, see
+            # ticketbis.compression
+            if compression:
+                from ticketbis.compression import accept_encoding
+                self.base_headers['Accept-Encoding'] = compression \
+                    if isinstance(compression, six.string_types) else \
+                    accept_encoding()
+            # Bodies of writes at least this long are sent gzipped
+            self.compress_min_size = compress_min_size
 
         def set_token(self, access_token):
             """Set the OAuth token for this requester"""
             self.oauth_token = access_token
-            self.userless = not bool(access_token) # Userless if no access_token
+            # Userless if no access_token, nor a token manager to get it from
+            self.userless = not (access_token or self.token_manager)
+
+        def _needs_token(self):
+            return not self.oauth_token and self.token_manager is not None
+
+        def localized(self, site=None, lang=None):
+            """
+            Copy of this requester sending requests for site, or for the
+            site of lang, through the same transport. Its GETs are never
+            auto batched, as the batcher sends /multi calls for this site.
+            """
+            requester = copy(self)
+            if lang:
+                requester.lang = lang
+            if site or lang:
+                requester.site = site or _site_cache.get(
+                        requester._site_key())
+            requester._meta = _ContextValue('ticketbis_meta')
+            requester._multi_requests = _ContextValue(
+                    'ticketbis_multi_requests')
+            requester.batcher = None
+            return requester
+
+        def _site_key(self):
+            return self.api_endpoint, self.oauth_token, self.lang
+
+        @property
+        def last_meta(self):
+            """
+            ResponseMeta of the last response received by the current thread
+            or coroutine
+            """
+            return self._meta.get() or EMPTY_META
+
+        @property
+        def total_count(self):
+            return self.last_meta.total_count
+
+        @property
+        def page_offset(self):
+            return self.last_meta.page_offset
+
+        @property
+        def page_max(self):
+            return self.last_meta.page_max
+
+        @property
+        def rate_limit(self):
+            return self.last_meta.rate_limit
+
+        @property
+        def rate_remaining(self):
+            return self.last_meta.rate_remaining
+
+        @property
+        def multi_requests(self):
+            """Multi requests queued by the current thread or coroutine"""
+            requests = self._multi_requests.get()
+            if requests is None:
+                requests = []
+                self._multi_requests.set(requests)
+            return requests
+
+        def _create_transport(self, pool_connections, pool_maxsize,
+                keep_alive):
+            from ticketbis.transports import RequestsTransport
+            # Connections only time their set up when instrumented
+            adapter_class = None
+            if self.metrics is not None:
+                from ticketbis.adapters import InstrumentedAdapter
+                adapter_class = InstrumentedAdapter
+            return RequestsTransport(pool_connections, pool_maxsize,
+                    keep_alive, adapter_class)
+
+        def _create_single_flight(self):
+            from ticketbis.coalesce import SingleFlight
+            return SingleFlight()
+
+        def _create_batcher(self, window):
+            from ticketbis.batching import (Batcher, DEFAULT_BATCH_WINDOW,
+                    DEFAULT_BATCH_WORKERS)
+            if window is None:
+                window = DEFAULT_BATCH_WINDOW
+            return Batcher(self._get_batch, window,
+                    workers=self.multi_workers or DEFAULT_BATCH_WORKERS)
+
+        def close(self):
+            """Releases every pooled connection, and the cache backend"""
+            if self.batcher is not None:
+                self.batcher.close()
+            self.transport.close()
+            if self.cache is not None:
+                self.cache.close()
 
         def GET(self, path, params={}, **kwargs):
             """GET request that returns processed data"""
@@ -261,10 +599,33 @@ class Ticketbis(object):
             params = self._enrich_params(params)
             url = self._get_url(path)
 
-            result = _get(url, headers=headers, params=params, auth=self.auth)
+            result = self._fetch(url, headers, params)
             self._set_header_properties(result)
 
-            return result['data']
+            if self.catalogue is not None:
+                self.catalogue.apply(kwargs.get('model'), result['data'])
+            return self._as_model(result['data'], kwargs.get('model'))
+
+        def GET_BATCHED(self, path, params={}, **kwargs):
+            """
+            Queues the GET into the next /multi call, returning a future of
+            its data
+            """
+            model = kwargs.get('model')
+
+            def parse(response):
+                _raise_error_from_response(response)
+                if self.catalogue is not None:
+                    self.catalogue.apply(model, response['response'])
+                return self._as_model(response['response'], model)
+            return self.batcher.submit(self._multi_request_url(path, params),
+                    parse)
+
+        def _get_batch(self, requests):
+            """Sends sub-requests in a /multi call, returning its responses"""
+            return self.GET('multi', params={
+                'requests': ','.join(requests),
+            })['responses']
 
         def GET_PAGINATED(self, path, params={}, **kwargs):
             """GET request that returns data iterating over pagination"""
@@ -273,71 +634,281 @@ class Ticketbis(object):
             headers = self._create_headers()
             params = self._enrich_params(params)
             url = self._get_url(path)
+            model = kwargs.get('model')
 
+            if self.pagination_workers:
+                items = (r for page in self._get_pages_concurrently(url,
+                        headers, params) for r in page)
+            else:
+                items = self._get_items(url, headers, params)
+            if self.catalogue is not None:
+                items = self._catalogued(items, model)
+            for r in items:
+                yield self._as_model(r, model)
+
+        def _catalogued(self, items, model):
+            """Upserts the items of a listing to the catalogue as they come"""
+            buffer = self.catalogue.buffer(model)
+            try:
+                for r in items:
+                    if buffer is not None:
+                        buffer.add(r)
+                    yield r
+            finally:
+                if buffer is not None:
+                    buffer.flush()
+
+        def _get_items(self, url, headers, params):
+            """Yields the items of every page, requested one after another"""
             pending_pages = True
             while pending_pages:
-                result = _get(url, headers=headers, params=params, auth=self.auth)
-                self._set_header_properties(result)
-                pending_pages = \
-                    self.page_offset + len(result['data']) < self.total_count
-                params['offset'] = self.page_offset + self.page_max
+                result = self._fetch(url, headers, params, stream=self.stream)
+                meta = self._set_header_properties(result)
+                # Items might be decoded as they arrive, count them on the go
+                page_size = 0
                 for r in result['data']:
+                    page_size += 1
                     yield r
+                pending_pages = meta.page_offset + page_size < meta.total_count
+                params['offset'] = meta.page_offset + meta.page_max
+
+        def _get_pages_concurrently(self, url, headers, params):
+            """
+            Yields pages in offset order. The first page tells the total count,
+            so every remaining page gets fetched ahead by the pagination workers
+            """
+            result = self._fetch(url, headers, params)
+            meta = self._set_header_properties(result)
+            yield result['data']
+            offsets = self._pending_offsets(meta, len(result['data']))
+            if not offsets:
+                return
+
+            def fetch(offset):
+                page_params = params.copy()
+                page_params['offset'] = offset
+                return self._fetch(url, headers, page_params)
+
+            for result in _ordered_map(fetch, offsets, self.pagination_workers,
+                    self.pagination_in_flight):
+                self._set_header_properties(result)
+                yield result['data']
+
+        def _pending_offsets(self, meta, first_page_size):
+            """Offsets of the pages left after the one meta belongs to"""
+            if meta.total_count is None or not meta.page_max or \
+                    meta.page_offset + first_page_size >= meta.total_count:
+                return xrange(0)
+            return xrange(meta.page_offset + meta.page_max, meta.total_count,
+                    meta.page_max)
+
+        def _as_model(self, data, model):
+            """Wraps items in model when models are enabled"""
+            if not self.models or model is None:
+                return data
+            if isinstance(data, list):
+                return [model(r) for r in data]
+            if isinstance(data, dict):
+                return model(data)
+            return data
+
+        def _fetch(self, url, headers, params, stream=False):
+            """
+            GETs the url, through the response cache when enabled and shared
+            with identical GETs in flight when coalescing
+            """
+            if stream or self.single_flight is None:
+                return self._fetch_once(url, headers, params, stream)
+            from ticketbis.coalesce import request_key
+            result, shared = self.single_flight.do(
+                    request_key(url, params, headers), self._fetch_once, url,
+                    headers, params)
+            if shared:
+                self._count('coalesced', url)
+            return result
+
+        def _fetch_once(self, url, headers, params, stream=False):
+            if stream:
+                # Streamed items are never cached
+                return self._send('GET', url, headers=headers, params=params,
+                        stream=True)
+            ttl = self._cache_ttl(url)
+            if ttl is None:
+                return self._send('GET', url, headers=headers, params=params)
+            key = self.cache.key(url, params, headers)
+            entry = self.cache.lookup(key)
+            if entry is not None and entry.is_fresh():
+                self._count('cache_hits', url)
+                return entry.result()
+            self._count('cache_misses', url)
+            result = self._send('GET', url, params=params,
+                    headers=self.cache.conditional_headers(entry, headers))
+            if result.get('not_modified'):
+                self._count('cache_revalidations', url)
+            return self.cache.store(key, ttl, result, entry)
+
+        def _send(self, method, url, **kwargs):
+            """
+            Makes a request through its network helper, throttled if needed
+            and retried according to the retry policy
+            """
+            metrics = self.metrics
+            endpoint = None if metrics is None else self._endpoint_name(url)
+            started = time.time()
+            renewed = False
+            for attempt in itertools.count(1):
+                if self.rate_limiter is not None:
+                    wait = self.rate_limiter.acquire()
+                    if metrics is not None and wait > 0:
+                        metrics.increment('rate_limit_waits', endpoint)
+                        metrics.observe('rate_limit_wait_seconds', wait,
+                                endpoint)
+                if metrics is not None:
+                    info = metrics.request_started(method, url, endpoint,
+                            attempt, kwargs.get('headers'))
+                try:
+                    result = _request(self.transport, method, url,
+                            auth=self.auth, loads=self.json_loads, **kwargs)
+                except TicketbisException as e:
+                    if metrics is not None:
+                        metrics.request_finished(info, error=e)
+                    self._update_rate_limiter(e.headers)
+                    if not renewed and self._can_renew_token(e, kwargs):
+                        # Expired token, sent once more with a new one
+                        renewed = True
+                        kwargs['headers'] = self._renew_token(kwargs['headers'])
+                        continue
+                    delay = self.retry_policy.delay(method, attempt, e, started)
+                    if delay is None:
+                        raise
+                    if metrics is not None:
+                        metrics.increment('retries', endpoint)
+                    time.sleep(delay)
+                else:
+                    if metrics is not None:
+                        metrics.request_finished(info, result=result)
+                    self._update_rate_limiter(result['headers'])
+                    return result
+                finally:
+                    if metrics is not None:
+                        metrics.stop_timing(info)
+
+        def _can_renew_token(self, error, kwargs):
+            return isinstance(error, InvalidAuth) and \
+                self.token_manager is not None and \
+                'Authorization' in (kwargs.get('headers') or {})
+
+        def _renew_token(self, headers):
+            """Refreshes the token, returning the headers carrying it"""
+            stale = headers['Authorization'][len('Bearer '):]
+            log.info(u'Token rejected, refreshing it')
+            self.set_token(self.token_manager.refresh(stale=stale))
+            return dict(headers,
+                    Authorization='Bearer {0}'.format(self.oauth_token))
+
+        def _endpoint_name(self, url):
+            """Name of the endpoint of an url, i.e. events"""
+            return url[len(self.api_endpoint):].strip('/').split('/', 1)[0]
+
+        def _count(self, name, url):
+            if self.metrics is not None:
+                self.metrics.increment(name, self._endpoint_name(url))
+
+        def _update_rate_limiter(self, headers):
+            if self.rate_limiter is not None and headers is not None:
+                self.rate_limiter.update(headers)
+
+        def _cache_ttl(self, url):
+            """Time to live of the url responses, None if not cached"""
+            if self.cache is None:
+                return None
+            return self.cache.ttl_for(url[len(self.api_endpoint):])
 
         def _set_header_properties(self, result):
-            self.site = result['headers']['X-ticketbis-site']
-
-            self.rate_limit = result['headers'].get('X-RateLimit-Limit', None)
-            self.rate_remaining = result['headers'].get('X-RateLimit-Remaining', None)
-
-            if 'X-ticketbis-totalCount' in result['headers']:
-                self.total_count = \
-                    int(result['headers']['X-ticketbis-totalCount'])
-                self.page_offset = \
-                    int(result['headers']['X-ticketbis-pageOffset'])
-                self.page_max = \
-                    int(result['headers']['X-ticketbis-pageMaxSize'])
-            else:
-                self.total_count = None
-                self.page_offset = None
-                self.page_max = None
+            """
+            Keeps the metadata of a GET response as the last one of the
+            current thread or coroutine, and returns it
+            """
+            meta = _response_meta(result['headers'])
+            # The site is shared, as it only depends on the lang
+            if meta.site != self.site:
+                self.site = meta.site
+                _cache_site(self._site_key(), meta.site)
+            self._meta.set(meta)
+            return meta
+
+        def _set_rate_limit_properties(self, result):
+            """Updates the rate limit of the last metadata with a response"""
+            headers = result['headers']
+            self._meta.set(self.last_meta._replace(
+                rate_limit=headers.get('X-RateLimit-Limit', None),
+                rate_remaining=headers.get('X-RateLimit-Remaining', None)))
 
         def add_multi_request(self, path, params={}):
             """Add multi request to list and return number of requests added"""
+            self.multi_requests.append(self._multi_request_url(path, params))
+            return len(self.multi_requests)
+
+        def _multi_request_url(self, path, params):
             url = path
             if params:
                 url += '?{0}'.format(parse.quote_plus(parse.urlencode(params)))
-            self.multi_requests.append(url)
-            return len(self.multi_requests)
+            return url
 
         def POST(self, path, data={}, files=None):
             """POST request that returns processed data"""
-            if data is not None:
-                data = data.copy()
-            if files is not None:
-                files = files.copy()
-            headers = self._create_headers()
-            data = self._enrich_params(data)
-            url = self._get_url(path)
-            result = _post(url, headers=headers, data=json.dumps(data), files=files, auth=self.auth)
-            self.rate_limit = result['headers'].get('X-RateLimit-Limit', None)
-            self.rate_remaining = result['headers'].get('X-RateLimit-Remaining', None)
-            return result['data']
+            return self._write('POST', path, data, files)
 
         def PUT(self, path, data={}, files=None):
             """PUT request that returns processed data"""
-            if data is not None:
-                data = data.copy()
-            if files is not None:
-                files = files.copy()
+            return self._write('PUT', path, data, files)
+
+        def _write(self, method, path, data, files):
             headers = self._create_headers()
-            data = self._enrich_params(data)
             url = self._get_url(path)
-            result = _put(url, headers=headers, data=json.dumps(data), files=files, auth=self.auth)
-            self.rate_limit = result['headers'].get('X-RateLimit-Limit', None)
-            self.rate_remaining = result['headers'].get('X-RateLimit-Remaining', None)
+            result = self._send(method, url, headers=headers,
+                    data=self._encode_data(data, headers, files), files=files)
+            self._set_rate_limit_properties(result)
             return result['data']
 
+        def _encode_data(self, data, headers=None, files=None):
+            """
+            JSON body of a write, the caller's data is left untouched. Long
+            bodies are gzipped if compress_min_size is set, along with their
+            headers.
+            """
+            if self.userless and data is not None:
+                data = self._enrich_params(dict(data))
+            body = json.dumps(data)
+            if self.compress_min_size is None or headers is None or files or \
+                    len(body) < self.compress_min_size:
+                return body
+            from ticketbis.compression import gzip_compress
+            if isinstance(body, six.text_type):
+                body = body.encode('utf-8')
+            headers['Content-Encoding'] = 'gzip'
+            return gzip_compress(body)
+
+        def bulk(self, write, records, workers=None, start=0):
+            """
+            Lazily calls write (i.e. an endpoint's create) with every record
+            but the first start ones, on bulk_workers threads unless workers
+            is given. Yields results in order, or the TicketbisException
+            raised by the record.
+            """
+            records = itertools.islice(records, start, None)
+            workers = self.bulk_workers if workers is None else workers
+
+            def call(record):
+                try:
+                    return write(record)
+                except TicketbisException as e:
+                    return e
+            if not workers:
+                return (call(record) for record in records)
+            return _ordered_map(call, records, workers,
+                    IN_FLIGHT_PER_WORKER * workers)
+
         def _get_url(self, path):
             return '{API_ENDPOINT}{path}'.format(
                 API_ENDPOINT=self.api_endpoint,
@@ -355,6 +926,9 @@ class Ticketbis(object):
             """Get the headers we need"""
             headers = self.base_headers.copy()
 
+            if self._needs_token():
+                # Requested now rather than when the client is built
+                self.set_token(self.token_manager.token())
             if not self.userless:
                 headers['Authorization'] = 'Bearer {0}'.format(self.oauth_token)
             if self.site:
@@ -366,6 +940,12 @@ class Ticketbis(object):
 
     class _Endpoint(object):
         """Generic endpoint class"""
+        # ticketbis.models class of the items returned, if any
+        model = None
+        # GETs of a resource by id are gathered into /multi calls when auto
+        # batching
+        batchable = True
+
         def __init__(self, requester):
             """Stores the request function for retrieving data"""
             self.requester = requester
@@ -386,8 +966,26 @@ class Ticketbis(object):
         def update(self, params={}):
             return self.PUT('{0}'.format(params['id']), params)
 
+        def bulk_create(self, records, workers=None, start=0):
+            """
+            Creates every record, see Requester.bulk. The results of an
+            interrupted batch can be resumed passing the number of results
+            already read as start.
+            """
+            return self.requester.bulk(self.create, records, workers, start)
+
+        def bulk_update(self, records, workers=None, start=0):
+            """Updates every record (by its id), see bulk_create"""
+            return self.requester.bulk(self.update, records, workers, start)
+
         def GET(self, path=None, auto_pagination=False, *args, **kwargs):
             """Use the requester to get the data"""
+            kwargs.setdefault('model', self.model)
+            if self.batchable and self.requester.batcher is not None and \
+                    not auto_pagination and not kwargs.get('multi') and \
+                    _names_resource(path):
+                return self.requester.GET_BATCHED(self._expanded_path(path),
+                        *args, **kwargs)
             if not auto_pagination:
                 return self.requester.GET(self._expanded_path(path),
                         *args, **kwargs)
@@ -407,6 +1005,7 @@ class Ticketbis(object):
 
     class Events(_Endpoint):
         endpoint = 'events'
+        model = Event
 
         def __call__(self, event_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -416,10 +1015,11 @@ class Ticketbis(object):
         def section_groups(self, event_id, auto_pagination=False,
                 params={}, multi=False):
             return self.GET('{0}/section_groups'.format(event_id), auto_pagination,
-                   params=params, multi=multi)
+                   params=params, multi=multi, model=SectionGroup)
 
     class Categories(_Endpoint):
         endpoint = 'categories'
+        model = Category
 
         def __call__(self, category_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -429,10 +1029,11 @@ class Ticketbis(object):
         def events(self, category_id, auto_pagination=False,
                 params={}, multi=False):
             return self.GET('{0}/events'.format(category_id), auto_pagination,
-                   params=params, multi=multi)
+                   params=params, multi=multi, model=Event)
 
     class Sites(_Endpoint):
         endpoint = 'sites'
+        model = Site
 
         def __call__(self, site_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -442,6 +1043,7 @@ class Ticketbis(object):
 
     class Cities(_Endpoint):
         endpoint = 'cities'
+        model = City
 
         def __call__(self, city_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -450,6 +1052,7 @@ class Ticketbis(object):
 
     class Venues(_Endpoint):
         endpoint = 'venues'
+        model = Venue
 
         def __call__(self, venue_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -459,10 +1062,11 @@ class Ticketbis(object):
         def schemas(self, venue_id, auto_pagination=False,
                 params={}, multi=False):
             return self.GET('{0}/schemas'.format(venue_id), auto_pagination,
-                   params=params, multi=multi)
+                   params=params, multi=multi, model=Schema)
 
     class Schemas(_Endpoint):
         endpoint = 'schemas'
+        model = Schema
 
         def __call__(self, schema_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -471,6 +1075,7 @@ class Ticketbis(object):
 
     class SectionGroups(_Endpoint):
         endpoint = 'section_groups'
+        model = SectionGroup
 
         def __call__(self, schema_id=u'', auto_pagination=False,
                 params={}, multi=False):
@@ -481,6 +1086,7 @@ class Ticketbis(object):
     class Multi(_Endpoint):
         """Multi request endpoint handler"""
         endpoint = 'multi'
+        batchable = False
 
         def __len__(self):
           return len(self.requester.multi_requests)
@@ -494,22 +1100,83 @@ class Ticketbis(object):
             The exceptions should be handled by the calling code, or raised.
             """
             while self.requester.multi_requests:
-                # Pull n requests from the multi-request queue
-                requests = self.requester.multi_requests[:MAX_MULTI_REQUESTS]
-                del(self.requester.multi_requests[:MAX_MULTI_REQUESTS])
-                # Process the 4sq multi request
-                params = {
-                    'requests': ','.join(requests),
-                }
-                responses = self.GET(params=params)['responses']
-                # ... and yield out each individual response
-                for response in responses:
-                    # Make sure the response was valid
-                    try:
-                        _raise_error_from_response(response)
-                        yield response['response']
-                    except TicketbisException as e:
-                        yield e
+                if self.requester.multi_workers:
+                    # Chunks are independent, send them all concurrently
+                    results = self._get_chunks_concurrently(
+                            self.requester.multi_workers)
+                else:
+                    results = (self._get_chunk(chunk)
+                            for chunk in self._pop_chunks(MAX_MULTI_REQUESTS))
+                try:
+                    for responses in results:
+                        for response in self._process_responses(responses):
+                            yield response
+                finally:
+                    results.close()
+
+        def _get_chunks_concurrently(self, workers):
+            """
+            Yields the responses of the queued chunks in order, sending them
+            on workers threads. Chunks are pulled from the queue as they are
+            submitted, and those left unsent when the iteration is abandoned
+            are put back.
+            """
+            queue = self.requester.multi_requests
+            unsent = {}
+            lock = threading.Lock()
+
+            def chunks():
+                for number in itertools.count():
+                    if not queue:
+                        return
+                    chunk = self._pop_chunks(MAX_MULTI_REQUESTS)[0]
+                    with lock:
+                        unsent[number] = chunk
+                    yield number, chunk
+
+            def get_chunk(item):
+                number, chunk = item
+                with lock:
+                    # Put back already
+                    if unsent.pop(number, None) is None:
+                        return None
+                return self._get_chunk(chunk)
+
+            results = _ordered_map(get_chunk, chunks(), workers,
+                    IN_FLIGHT_PER_WORKER * workers)
+            try:
+                for responses in results:
+                    yield responses
+            finally:
+                # Cancels the chunks not started yet
+                results.close()
+                with lock:
+                    for number in sorted(unsent, reverse=True):
+                        queue[:0] = unsent.pop(number)
+
+        def _pop_chunks(self, count):
+            """Pulls up to count requests from the multi-request queue"""
+            requests = self.requester.multi_requests[:count]
+            del(self.requester.multi_requests[:count])
+            return [requests[i:i + MAX_MULTI_REQUESTS]
+                    for i in xrange(0, len(requests), MAX_MULTI_REQUESTS)]
+
+        def _get_chunk(self, requests):
+            """Process the multi request"""
+            params = {
+                'requests': ','.join(requests),
+            }
+            return self.GET(params=params)['responses']
+
+        def _process_responses(self, responses):
+            # ... and yield out each individual response
+            for response in responses:
+                # Make sure the response was valid
+                try:
+                    _raise_error_from_response(response)
+                    yield response['response']
+                except TicketbisException as e:
+                    yield e
 
         @property
         def num_required_api_calls(self):
@@ -517,6 +1184,87 @@ class Ticketbis(object):
             return int(math.ceil(
                 len(self.requester.multi_requests) / float(MAX_MULTI_REQUESTS)))
 
+        @property
+        def num_required_rounds(self):
+            """
+            Returns the expected number of wall-clock rounds of API calls,
+            i.e. the API calls that can't be sent concurrently
+            """
+            calls = self.num_required_api_calls
+            if not self.requester.multi_workers:
+                return calls
+            return int(math.ceil(calls / float(self.requester.multi_workers)))
+
+# Sites resolved in this process by (api endpoint, token, lang)
+_site_cache = {}
+
+# Max number of sites remembered
+SITE_CACHE_SIZE = 1024
+
+def _cache_site(key, site):
+    if len(_site_cache) >= SITE_CACHE_SIZE:
+        _site_cache.clear()
+    _site_cache[key] = site
+
+def _names_resource(path):
+    """
+    Whether an endpoint path is a resource id (i.e. 3), not a listing (i.e.
+    empty or 3/events) whose pagination metadata a /multi call would lose
+    """
+    return bool(path) and '/' not in path
+
+class _ContextValue(object):
+    """Value local to the current thread, and coroutine when available"""
+
+    def __init__(self, name):
+        if contextvars is not None:
+            self._var = contextvars.ContextVar(name, default=None)
+        else:
+            self._local = threading.local()
+
+    def get(self):
+        if contextvars is not None:
+            return self._var.get()
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        if contextvars is not None:
+            return self._var.set(value)
+        previous = self.get()
+        self._local.value = value
+        return previous
+
+    def reset(self, token):
+        if contextvars is not None:
+            self._var.reset(token)
+        else:
+            self._local.value = token
+
+def _ordered_map(fn, iterable, workers, in_flight=None):
+    """
+    Lazily maps fn over iterable on a pool of workers, yielding results in
+    order with at most in_flight calls buffered ahead of the consumer
+    """
+    # Backported as 'futures' on Python 2
+    from concurrent.futures import ThreadPoolExecutor
+    in_flight = in_flight or workers
+    pending = iter(iterable)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = deque()
+    try:
+        for item in itertools.islice(pending, in_flight):
+            futures.append(executor.submit(fn, item))
+        while futures:
+            result = futures.popleft().result()
+            for item in itertools.islice(pending, 1):
+                futures.append(executor.submit(fn, item))
+            yield result
+    finally:
+        # Abandoned iteration, don't make calls nobody will read
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
 def _log_and_raise_exception(msg, data, cls=TicketbisException):
   """Calls log.error() then raises an exception of class cls"""
   data = u'{0}'.format(data)
@@ -528,63 +1276,121 @@ def _log_and_raise_exception(msg, data, cls=TicketbisException):
 """
 Network helper functions
 """
-def _get(url, headers={}, params=None, auth=None):
-    """Tries to GET data from an endpoint using retries"""
-    param_string = _ticketbis_urlencode(params)
-    for i in xrange(NUM_REQUEST_RETRIES):
-        try:
-            try:
-                response = requests.get(url, headers=headers,
-                        params=param_string, verify=VERIFY_SSL, auth=auth)
-                return _process_response(response)
-            except requests.exceptions.RequestException as e:
-                _log_and_raise_exception('Error connecting with ticketbis API',
-                        e)
-        except TicketbisException as e:
-            # Some errors don't bear repeating
-            if e.__class__ in [InvalidAuth, ParamError, EndpointError,
-                    NotAuthorized, Deprecated]: raise
-            # If we've reached our last try, re-raise
-            if ((i + 1) == NUM_REQUEST_RETRIES): raise
-        time.sleep(1)
-
-def _post(url, headers={}, data=None, files=None, auth=None):
-    """Tries to POST data to an endpoint"""
+def _request(transport, method, url, headers={}, params=None, data=None,
+        files=None, auth=None, stream=False, loads=None):
+    """Makes a request through transport, mapping any connection error"""
+    query = _ticketbis_urlencode(params) if params else None
     try:
-        response = requests.post(url, headers=headers, data=data, files=files,
-                verify=VERIFY_SSL, auth=auth)
-        return _process_response(response)
-    except requests.exceptions.RequestException as e:
+        response = transport.request(method, url, headers=headers,
+                query=query, data=data, files=files, auth=auth, stream=stream)
+        return _process_response(response, stream, loads, transport.errors)
+    except transport.errors as e:
         _log_and_raise_exception('Error connecting with ticketbis API', e)
 
-def _put(url, headers={}, data=None, files=None, auth=None):
-    """Tries to PUT data to an endpoint"""
-    try:
-        response = requests.put(url, headers=headers, data=data, files=files,
-                verify=VERIFY_SSL, auth=auth)
-        return _process_response(response)
-    except requests.exceptions.RequestException as e:
-        _log_and_raise_exception('Error connecting with ticketbis API', e)
+def _one_off_transport(session=None):
+    """Transport of session, or of one-off connections if none is given"""
+    from ticketbis.transports import RequestsTransport
+    if session is None:
+        import requests as session
+    return RequestsTransport(session=session)
+
+def _get(url, headers={}, params=None, auth=None, session=None, stream=False,
+        loads=None):
+    """Tries to GET data from an endpoint"""
+    return _request(_one_off_transport(session), 'GET', url, headers, params,
+            auth=auth, stream=stream, loads=loads)
+
+def _post(url, headers={}, data=None, files=None, auth=None, session=None,
+        loads=None):
+    """Tries to POST data to an endpoint"""
+    return _request(_one_off_transport(session), 'POST', url, headers,
+            data=data, files=files, auth=auth, loads=loads)
 
-def _process_response(response):
-    """Make the request and handle exception processing"""
+def _put(url, headers={}, data=None, files=None, auth=None, session=None,
+        loads=None):
+    """Tries to PUT data to an endpoint"""
+    return _request(_one_off_transport(session), 'PUT', url, headers,
+            data=data, files=files, auth=auth, loads=loads)
+
+def _response_meta(headers):
+    """Builds the ResponseMeta of the headers of a GET response"""
+    total_count = page_offset = page_max = None
+    if 'X-ticketbis-totalCount' in headers:
+        total_count = int(headers['X-ticketbis-totalCount'])
+        page_offset = int(headers['X-ticketbis-pageOffset'])
+        page_max = int(headers['X-ticketbis-pageMaxSize'])
+    return ResponseMeta(headers['X-ticketbis-site'],
+            headers.get('X-RateLimit-Limit', None),
+            headers.get('X-RateLimit-Remaining', None),
+            total_count, page_offset, page_max)
+
+def _process_response(response, stream=False, loads=None, errors=None):
+    """
+    Make the request and handle exception processing. Bodies are decoded
+    with loads, json.loads by default, and errors are the exceptions of
+    streamed bodies failing to arrive (requests' by default)
+    """
+    loads = loads or json.loads
     # Read the response as JSON
     try:
         if response.status_code in (200, 201):
-            data = response.json()
+            timings = active_timings()
+            if timings is not None:
+                _time_response(response, timings)
+            if stream:
+                data = _iter_response_items(response, loads, errors)
+            elif timings is not None:
+                start = clock()
+                data = loads(response.content)
+                timings['decode'] = clock() - start
+            else:
+                data = loads(response.content)
             return { 'headers': response.headers, 'data': data }
 
+        if response.status_code == 304:
+            # Revalidated cached response, see ticketbis.cache
+            return { 'headers': response.headers, 'data': None,
+                    'not_modified': True }
+
         if response.status_code == 412:
             # Especial case
             _log_and_raise_exception('Precondition failed', response.text,
                     cls=PreconditionFailed)
 
         # Default case, Got proper response
-        data = response.json()
+        data = loads(response.content)
         return _raise_error_from_response(data)
 
     except ValueError:
         _log_and_raise_exception('Invalid response', response.text)
+    except TicketbisException as e:
+        # i.e. Retry-After
+        e.headers = response.headers
+        raise
+
+
+def _time_response(response, timings):
+    """Records when the response headers arrived, if known"""
+    elapsed = getattr(response, 'elapsed', None)
+    if elapsed is not None:
+        # Time between sending the request and parsing the headers
+        timings['first_byte'] = max(0.0, elapsed.total_seconds() -
+                timings.get('connect', 0) - timings.get('tls', 0))
+
+def _iter_response_items(response, loads, errors=None):
+    """Yields the items of a listing as they are read from the network"""
+    if errors is None:
+        import requests
+        errors = (requests.exceptions.RequestException, )
+    try:
+        for item in iter_json_items(response.iter_content(CHUNK_SIZE), loads):
+            yield item
+    except ValueError as e:
+        _log_and_raise_exception('Invalid response', e)
+    except errors as e:
+        _log_and_raise_exception('Error connecting with ticketbis API', e)
+    finally:
+        response.close()
 
 
 def _raise_error_from_response(data):
@@ -610,7 +1416,57 @@ def _as_utf8(s):
     except UnicodeEncodeError:
         return unicode(s).encode('utf8')
 
+# Max number of strings remembered by each _Quoter
+QUOTER_CACHE_SIZE = 1024
+
+class _Quoter(object):
+    """
+    parse.quote of values as their _as_utf8 string. Strings made only of
+    safe ASCII characters are left as they are and the quoting of strings is
+    remembered, as the same keys and values are sent over and over.
+    """
+
+    def __init__(self, safe):
+        self.safe = safe
+        safe_chars = ''.join(c for c in map(chr, range(128))
+                if parse.quote(c, safe=safe) == c)
+        self._all_safe = re.compile('[{0}]*\\Z'.format(
+                re.escape(safe_chars)))
+        self._cache = {}
+
+    def __call__(self, value):
+        cls = type(value)
+        if cls is str or cls is six.text_type:
+            quoted = self._cache.get(value)
+            if quoted is None:
+                quoted = self._quote(value)
+                if len(self._cache) < QUOTER_CACHE_SIZE:
+                    self._cache[value] = quoted
+            return quoted
+        if cls in six.integer_types:
+            # Digits and minus signs are always safe
+            return str(value)
+        return self._quote(value)
+
+    def _quote(self, value):
+        value = _as_utf8(value)
+        if self._all_safe.match(value):
+            return value
+        return parse.quote(value, safe=self.safe)
+
+_quoters = {}
+
+def _quoter(safe):
+    quoter = _quoters.get(safe)
+    if quoter is None:
+        quoter = _quoters[safe] = _Quoter(safe)
+    return quoter
+
 def _ticketbis_urlencode(query, doseq=0, safe_chars="&/,+"):
+    """
+    Urlencodes a dict or sequence of pairs leaving safe_chars unquoted.
+    With doseq, every item of sequence values is sent under its key.
+    """
     # Courtesy of github.com/iambibhas
     if hasattr(query,"items"):
         query = query.items()
@@ -620,31 +1476,55 @@ def _ticketbis_urlencode(query, doseq=0, safe_chars="&/,+"):
                 raise TypeError
         except TypeError:
             ty,va,tb = sys.exc_info()
-            raise TypeError("not valid non-string sequence").with_traceback(tb)
+            six.reraise(TypeError,
+                    TypeError("not valid non-string sequence"), tb)
 
+    quote = _quoter(safe_chars)
     l = []
-    if not doseq:
-        # preserve old behavior
-        for k, v in query:
-            k = parse.quote(_as_utf8(k), safe=safe_chars)
-            v = parse.quote(_as_utf8(v), safe=safe_chars)
-            l.append(k + '=' + v)
-    else:
-        for k, v in query:
-            k = parse.quote(_as_utf8(k), safe=safe_chars)
-            if isinstance(v, six.string_types):
-                v = parse.quote(_as_utf8(v), safe=safe_chars)
-                l.append(k + '=' + v)
-            else:
-                try:
-                    # is this a sufficient test for sequence-ness?
-                    len(v)
-                except TypeError:
-                    # not a sequence
-                    v = parse.quote(_as_utf8(v), safe=safe_chars)
-                    l.append(k + '=' + v)
-                else:
-                    # loop over the sequence
-                    for elt in v:
-                        l.append(k + '=' + parse.quote(_as_utf8(elt)))
+    for k, v in query:
+        k = quote(k)
+        if doseq and not isinstance(v, six.string_types) and \
+                hasattr(v, '__len__'):
+            # Items of sequences are quoted as parse.quote does by default
+            quote_item = _quoter('/')
+            l.extend(k + '=' + quote_item(elt) for elt in v)
+        else:
+            l.append(k + '=' + quote(v))
     return '&'.join(l)
+
+from ticketbis.retry import RetryPolicy
+from ticketbis.metrics import active_timings, clock
+
+# Imported on first use, as they need libraries that take long to import
+_LAZY_ATTRIBUTES = {
+    'ResponseCache': 'ticketbis.cache',
+    'RateLimiter': 'ticketbis.ratelimit',
+    'Metrics': 'ticketbis.metrics',
+    'StatsdExporter': 'ticketbis.metrics',
+    'InstrumentedAdapter': 'ticketbis.adapters',
+    # Asyncio flavour of the client, only available on Python 3.5+
+    'AsyncTicketbis': 'ticketbis.aio',
+}
+
+def __getattr__(name):
+    """Imports the attributes in _LAZY_ATTRIBUTES when first used"""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(
+                "module 'ticketbis' has no attribute '{0}'".format(name))
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+# Module __getattr__ is only supported since Python 3.7. Before, attributes
+# are imported right away, but for InstrumentedAdapter (import it from
+# ticketbis.adapters), which would import requests. Those needing missing
+# libraries are left out.
+if sys.version_info < (3, 7):
+    for _name in list(_LAZY_ATTRIBUTES):
+        if _name == 'InstrumentedAdapter' or (_name == 'AsyncTicketbis' and
+                sys.version_info < (3, 5)):
+            continue
+        try:
+            __getattr__(_name)
+        except ImportError:
+            pass
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Transport adapters of the requests session
+
+InstrumentedAdapter times the set up of new connections (DNS lookup, TCP
+connection and TLS handshake) while a request is measured by
+ticketbis.metrics. Clients with metrics mount it on their own:
+
+    client = Ticketbis(access_token=TOKEN, metrics=Metrics())
+
+Kept apart from ticketbis.metrics, so importing it doesn't import requests.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import socket
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3 import connection, connectionpool
+from requests.packages.urllib3.exceptions import NewConnectionError
+from requests.packages.urllib3.util.connection import allowed_gai_family
+
+from ticketbis.metrics import _active_timings, clock
+
+
+class _TimedConnectionMixin(object):
+    """Connection timing its set up while a request is instrumented"""
+    is_tls = False
+
+    def _new_conn(self):
+        timings = _active_timings.get()
+        if timings is None:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        host = self._dns_host
+        start = clock()
+        try:
+            addresses = _resolve(host, self.port)
+        except socket.error:
+            # Raised by urllib3 as usual when connecting
+            addresses = [host]
+        timings['dns'] = timings.get('dns', 0) + clock() - start
+        start = clock()
+        try:
+            # Every address resolved is tried, as urllib3 does
+            for address in addresses[:-1]:
+                self._dns_host = address
+                try:
+                    return super(_TimedConnectionMixin, self)._new_conn()
+                except NewConnectionError:
+                    pass
+            self._dns_host = addresses[-1]
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = host
+            timings['connect'] = timings.get('connect', 0) + \
+                clock() - start
+
+    def connect(self):
+        timings = _active_timings.get()
+        if timings is None or not self.is_tls:
+            return super(_TimedConnectionMixin, self).connect()
+        opened = timings.get('dns', 0) + timings.get('connect', 0)
+        start = clock()
+        super(_TimedConnectionMixin, self).connect()
+        # Whatever connecting took but resolving and opening the socket
+        timings['tls'] = timings.get('tls', 0) + clock() - start - \
+            (timings.get('dns', 0) + timings.get('connect', 0) - opened)
+
+
+def _resolve(host, port):
+    """Addresses of a host, in the order urllib3 would connect to them"""
+    addresses = []
+    for _, _, _, _, address in socket.getaddrinfo(host.strip('[]'), port,
+            allowed_gai_family(), socket.SOCK_STREAM):
+        if address[0] not in addresses:
+            addresses.append(address[0])
+    return addresses
+
+class _TimedHTTPConnection(_TimedConnectionMixin,
+        connection.HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectionMixin,
+        connection.HTTPSConnection):
+    is_tls = True
+
+class _TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class InstrumentedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections time their set up"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(InstrumentedAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,781 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Asyncio flavour of the Ticketbis API wrapper (Python 3.5+)
+
+Every endpoint of AsyncTicketbis mirrors the one in Ticketbis but returns an
+awaitable, and auto_pagination=True returns an async iterator:
+
+    async with AsyncTicketbis(access_token=TOKEN, site='ticketbisES') as api:
+        event = await api.events(1)
+        async for event in api.events(auto_pagination=True):
+            ...
+"""
+import logging; log = logging.getLogger(__name__)
+
+import asyncio
+import functools
+import itertools
+import time
+from collections import OrderedDict, deque
+
+# 3rd party libraries that might not be present during initial install
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+import ticketbis
+from ticketbis import (Ticketbis, TicketbisException, MAX_MULTI_REQUESTS,
+        IN_FLIGHT_PER_WORKER, DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE,
+        json, _log_and_raise_exception, _raise_error_from_response,
+        _ticketbis_urlencode)
+from ticketbis.batching import Batcher, DEFAULT_BATCH_WINDOW
+from ticketbis.coalesce import SingleFlight, request_key
+from ticketbis.metrics import active_timings, clock
+from ticketbis.streaming import CHUNK_SIZE, JSONArrayDecoder
+from ticketbis.transports import Transport
+
+
+class AsyncTicketbis(Ticketbis):
+    """Asyncio Ticketbis API wrapper"""
+
+    def _resolve_site(self):
+        # Can't block here, the site gets resolved from the headers of the
+        # first response (or explicitly through resolve_site)
+        pass
+
+    async def resolve_site(self):
+        """Forces API to return site according to lang"""
+        if not self.site:
+            await self.base_requester.GET(self.sites.endpoint,
+                    params={'max': 1})
+        return self.site
+
+    async def close(self):
+        """Closes the pooled connections held by this client"""
+        if self.token_manager is not None:
+            self.token_manager.unsubscribe(self.set_access_token)
+        if self._parent is None:
+            await self.base_requester.close()
+
+    async def fan_out(self, call, sites=None, langs=None, workers=None):
+        """
+        Awaits call with a localized client of every site and lang given
+        (see Ticketbis.fan_out). Async iterators returned are read into
+        lists.
+        """
+        clients = self._localized_clients(sites, langs)
+        # One after another without workers
+        workers = (len(clients) if workers is None else workers) or 1
+
+        async def run(target):
+            key, client = target
+            try:
+                result = call(client)
+                if hasattr(result, '__aiter__'):
+                    return key, [item async for item in result]
+                return key, await result
+            except TicketbisException as e:
+                return key, e
+        results = OrderedDict()
+        async for key, result in _ordered_map(run, clients, workers):
+            results[key] = result
+        return results
+
+    def __enter__(self):
+        raise TypeError('Use "async with" instead')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    class OAuth(Ticketbis.OAuth):
+        """Handles OAuth authentication procedures and helps retrieve tokens"""
+
+        async def get_token(self, code=None, scope='read write'):
+            """Gets the auth token from a user's response"""
+            data = await self.request_token(code, scope)
+            if data is None:
+                return None
+            return data['access_token']
+
+        async def request_token(self, code=None, scope='read write'):
+            """
+            Gets the token response (access_token, expires_in...) from a
+            user's response, None if code is missing
+            """
+            params = self._token_params(code, scope)
+            if params is None:
+                return None
+
+            res = await _request(self.requester.transport, 'POST',
+                    self._token_url(), data=params)
+            return res['data']
+
+    class Requester(Ticketbis.Requester):
+        """Async api requesting object"""
+
+        def _create_transport(self, pool_connections, pool_maxsize,
+                keep_alive):
+            # Connections only time their set up when instrumented
+            trace_configs = None
+            if self.metrics is not None and aiohttp is not None:
+                trace_configs = [_trace_config()]
+            return AiohttpTransport(pool_connections, pool_maxsize,
+                    keep_alive, trace_configs)
+
+        def _create_single_flight(self):
+            return AsyncSingleFlight()
+
+        def _create_batcher(self, window):
+            return AsyncBatcher(self._get_batch, DEFAULT_BATCH_WINDOW
+                    if window is None else window)
+
+        def get_session(self):
+            """Returns the aiohttp session of the default transport"""
+            return self.transport.get_session()
+
+        async def close(self):
+            """Releases every pooled connection, and the cache backend"""
+            if self.batcher is not None:
+                await self.batcher.close()
+            await self.transport.close()
+            if self.cache is not None:
+                self.cache.close()
+
+        async def _get_token(self):
+            """
+            Gets the token of the token manager on first use, on a thread as
+            the token manager blocks
+            """
+            if self._needs_token():
+                self.set_token(await asyncio.get_event_loop().run_in_executor(
+                        None, self.token_manager.token))
+
+        async def GET(self, path, params={}, **kwargs):
+            """GET request that returns processed data"""
+            params = params.copy()
+            # Short-circuit multi requests
+            if kwargs.get('multi') is True:
+                return self.add_multi_request(path, params)
+            # Continue processing normal requests
+            await self._get_token()
+            headers = self._create_headers()
+            params = self._enrich_params(params)
+            url = self._get_url(path)
+
+            result = await self._fetch(url, headers, params)
+            self._set_header_properties(result)
+
+            if self.catalogue is not None:
+                self.catalogue.apply(kwargs.get('model'), result['data'])
+            return self._as_model(result['data'], kwargs.get('model'))
+
+        async def _get_batch(self, requests):
+            """Sends sub-requests in a /multi call, returning its responses"""
+            return (await self.GET('multi', params={
+                'requests': ','.join(requests),
+            }))['responses']
+
+        async def GET_PAGINATED(self, path, params={}, **kwargs):
+            """GET request that returns data iterating over pagination"""
+            params = params.copy()
+
+            await self._get_token()
+            headers = self._create_headers()
+            params = self._enrich_params(params)
+            url = self._get_url(path)
+            model = kwargs.get('model')
+
+            if self.pagination_workers:
+                items = (r async for page in self._get_pages_concurrently(url,
+                        headers, params) for r in page)
+            else:
+                items = self._get_items(url, headers, params)
+            if self.catalogue is not None:
+                items = self._catalogued(items, model)
+            async for r in items:
+                yield self._as_model(r, model)
+
+        async def _catalogued(self, items, model):
+            """Upserts the items of a listing to the catalogue as they come"""
+            buffer = self.catalogue.buffer(model)
+            try:
+                async for r in items:
+                    if buffer is not None:
+                        buffer.add(r)
+                    yield r
+            finally:
+                if buffer is not None:
+                    buffer.flush()
+
+        async def _get_items(self, url, headers, params):
+            """Yields the items of every page, requested one after another"""
+            pending_pages = True
+            while pending_pages:
+                result = await self._fetch(url, headers, params,
+                        stream=self.stream)
+                meta = self._set_header_properties(result)
+                page_size = 0
+                if self.stream:
+                    # Items are decoded as they arrive
+                    async for r in result['data']:
+                        page_size += 1
+                        yield r
+                else:
+                    for r in result['data']:
+                        page_size += 1
+                        yield r
+                pending_pages = meta.page_offset + page_size < meta.total_count
+                params['offset'] = meta.page_offset + meta.page_max
+
+        async def _get_pages_concurrently(self, url, headers, params):
+            """
+            Yields pages in offset order. The first page tells the total count,
+            so every remaining page gets fetched ahead as concurrent tasks
+            """
+            result = await self._fetch(url, headers, params)
+            meta = self._set_header_properties(result)
+            yield result['data']
+            offsets = self._pending_offsets(meta, len(result['data']))
+            if not offsets:
+                return
+
+            async def fetch(offset):
+                page_params = params.copy()
+                page_params['offset'] = offset
+                return await self._fetch(url, headers, page_params)
+
+            async for result in _ordered_map(fetch, offsets,
+                    self.pagination_workers, self.pagination_in_flight):
+                self._set_header_properties(result)
+                yield result['data']
+
+        async def _fetch(self, url, headers, params, stream=False):
+            """
+            GETs the url, through the response cache when enabled and shared
+            with identical GETs in flight when coalescing
+            """
+            if stream or self.single_flight is None:
+                return await self._fetch_once(url, headers, params, stream)
+            result, shared = await self.single_flight.do(
+                    request_key(url, params, headers), self._fetch_once, url,
+                    headers, params)
+            if shared:
+                self._count('coalesced', url)
+            return result
+
+        async def _fetch_once(self, url, headers, params, stream=False):
+            if stream:
+                # Streamed items are never cached
+                return await self._send('GET', url, headers=headers,
+                        params=params, stream=True)
+            ttl = self._cache_ttl(url)
+            if ttl is None:
+                return await self._send('GET', url, headers=headers,
+                        params=params)
+            key = self.cache.key(url, params, headers)
+            entry = self.cache.lookup(key)
+            if entry is not None and entry.is_fresh():
+                self._count('cache_hits', url)
+                return entry.result()
+            self._count('cache_misses', url)
+            result = await self._send('GET', url, params=params,
+                    headers=self.cache.conditional_headers(entry, headers))
+            if result.get('not_modified'):
+                self._count('cache_revalidations', url)
+            return self.cache.store(key, ttl, result, entry)
+
+        async def _send(self, method, url, **kwargs):
+            """
+            Makes a request through its network helper, throttled if needed
+            and retried according to the retry policy
+            """
+            metrics = self.metrics
+            endpoint = None if metrics is None else self._endpoint_name(url)
+            started = time.time()
+            renewed = False
+            for attempt in itertools.count(1):
+                if self.rate_limiter is not None:
+                    wait = self.rate_limiter.reserve()
+                    if wait > 0:
+                        if metrics is not None:
+                            metrics.increment('rate_limit_waits', endpoint)
+                            metrics.observe('rate_limit_wait_seconds', wait,
+                                    endpoint)
+                        await asyncio.sleep(wait)
+                if metrics is not None:
+                    info = metrics.request_started(method, url, endpoint,
+                            attempt, kwargs.get('headers'))
+                try:
+                    result = await _request(self.transport, method, url,
+                            auth=self.auth, loads=self.json_loads, **kwargs)
+                except TicketbisException as e:
+                    if metrics is not None:
+                        metrics.request_finished(info, error=e)
+                    self._update_rate_limiter(e.headers)
+                    if not renewed and self._can_renew_token(e, kwargs):
+                        # Expired token, sent once more with a new one. The
+                        # token manager blocks, so it runs on a thread
+                        renewed = True
+                        kwargs['headers'] = await asyncio.get_event_loop() \
+                            .run_in_executor(None, self._renew_token,
+                                    kwargs['headers'])
+                        continue
+                    delay = self.retry_policy.delay(method, attempt, e, started)
+                    if delay is None:
+                        raise
+                    if metrics is not None:
+                        metrics.increment('retries', endpoint)
+                    await asyncio.sleep(delay)
+                else:
+                    if metrics is not None:
+                        metrics.request_finished(info, result=result)
+                    self._update_rate_limiter(result['headers'])
+                    return result
+                finally:
+                    if metrics is not None:
+                        metrics.stop_timing(info)
+
+        async def _write(self, method, path, data, files):
+            await self._get_token()
+            headers = self._create_headers()
+            url = self._get_url(path)
+            result = await self._send(method, url, headers=headers,
+                    data=self._encode_data(data, headers, files), files=files)
+            self._set_rate_limit_properties(result)
+            return result['data']
+
+        async def bulk(self, write, records, workers=None, start=0):
+            """
+            Async iterator over the results of awaiting write with every
+            record, bulk_workers at once (see Ticketbis.Requester.bulk)
+            """
+            records = itertools.islice(records, start, None)
+            # One record at a time without workers
+            workers = (self.bulk_workers if workers is None else workers) or 1
+
+            async def call(record):
+                try:
+                    return await write(record)
+                except TicketbisException as e:
+                    return e
+            async for result in _ordered_map(call, records, workers,
+                    IN_FLIGHT_PER_WORKER * workers):
+                yield result
+
+    class Multi(Ticketbis.Multi):
+        """Multi request endpoint handler"""
+
+        async def __call__(self):
+            """
+            Async generator to process the current queue of multi's
+
+            note: This generator will yield both data and TicketbisException's
+            Code processing this sequence must check the yields for their type.
+            The exceptions should be handled by the calling code, or raised.
+            """
+            while self.requester.multi_requests:
+                if self.requester.multi_workers:
+                    # Chunks are independent, send them all concurrently
+                    results = self._get_chunks_concurrently(
+                            self.requester.multi_workers)
+                else:
+                    results = _ordered_map(self._get_chunk,
+                            self._pop_chunks(MAX_MULTI_REQUESTS), 1)
+                try:
+                    async for responses in results:
+                        for response in self._process_responses(responses):
+                            yield response
+                finally:
+                    await results.aclose()
+
+        async def _get_chunks_concurrently(self, workers):
+            """
+            Yields the responses of the queued chunks in order, sending
+            workers at once (see Ticketbis.Multi._get_chunks_concurrently)
+            """
+            queue = self.requester.multi_requests
+            unsent = {}
+
+            def chunks():
+                for number in itertools.count():
+                    if not queue:
+                        return
+                    unsent[number] = self._pop_chunks(MAX_MULTI_REQUESTS)[0]
+                    yield number
+
+            async def get_chunk(number):
+                return await self._get_chunk(unsent.pop(number))
+
+            results = _ordered_map(get_chunk, chunks(), workers,
+                    IN_FLIGHT_PER_WORKER * workers)
+            try:
+                async for responses in results:
+                    yield responses
+            finally:
+                # Cancels the chunks not started yet
+                await results.aclose()
+                for number in sorted(unsent, reverse=True):
+                    queue[:0] = unsent.pop(number)
+
+        async def _get_chunk(self, requests):
+            """Process the multi request"""
+            params = {
+                'requests': ','.join(requests),
+            }
+            return (await self.GET(params=params))['responses']
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight sharing the outcome of coroutines among coroutines"""
+
+    async def do(self, key, fn, *args):
+        """
+        Awaits fn(*args), or the call with the same key in flight. Calls run
+        in their own task, so cancelling one of its callers, the first one
+        included, leaves the others waiting for it.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(functools.partial(self._done, key))
+        return (await asyncio.shield(task)), shared
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieved, so failures nobody is waiting for aren't logged
+        if not task.cancelled():
+            task.exception()
+
+
+class AsyncBatcher(Batcher):
+    """
+    Batcher of coroutines, gathering the sub-requests of an event loop tick
+    (or window seconds) into /multi calls sent as tasks
+    """
+
+    def __init__(self, send, window=0, size=MAX_MULTI_REQUESTS):
+        super(AsyncBatcher, self).__init__(send, window, size)
+        self._tasks = set()
+
+    def submit(self, request, parse):
+        """Queues a sub-request, returning a future of parse(response)"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((request, parse, future))
+        if len(self._pending) >= self.size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush) \
+                if self.window else loop.call_soon(self.flush)
+        return future
+
+    async def close(self):
+        """Sends the pending sub-requests and waits for every batch"""
+        self.flush()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def _dispatch(self, batch):
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        # Sub-requests whose future was cancelled aren't sent
+        batch = [item for item in batch if not item[2].cancelled()]
+        if not batch:
+            return
+        try:
+            responses = await self.send([request for request, _, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._resolve(batch, responses)
+
+
+async def _ordered_map(fn, iterable, workers, in_flight=None):
+    """
+    Lazily maps coroutine function fn over iterable running at most workers
+    at once, yielding results in order with at most in_flight calls buffered
+    ahead of the consumer
+    """
+    in_flight = in_flight or workers
+    pending = iter(iterable)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def call(item):
+        async with semaphore:
+            return await fn(item)
+
+    tasks = deque()
+    try:
+        for item in itertools.islice(pending, in_flight):
+            tasks.append(asyncio.ensure_future(call(item)))
+        while tasks:
+            result = await tasks.popleft()
+            for item in itertools.islice(pending, 1):
+                tasks.append(asyncio.ensure_future(call(item)))
+            yield result
+    finally:
+        # Abandoned iteration, don't make calls nobody will read
+        for task in tasks:
+            task.cancel()
+
+
+class AiohttpTransport(Transport):
+    """
+    Keep-alive connections pooled by an aiohttp session, the default of
+    AsyncTicketbis. Asyncio transports have the interface of
+    ticketbis.transports.Transport, but request and close are coroutines,
+    and responses are read with the read and release coroutines, or
+    iter_chunks(chunk_size) when streamed.
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            trace_configs=None, session=None):
+        self.errors = (aiohttp.ClientError, ) if aiohttp is not None else ()
+        self.trace_configs = trace_configs
+        self.session = session
+        self._options = {
+            'limit': pool_connections * pool_maxsize,
+            'limit_per_host': pool_maxsize,
+            'force_close': not keep_alive,
+        }
+
+    def get_session(self):
+        """Returns the pooled session, creating it on first use"""
+        # aiohttp sessions must be created within the running event loop
+        if self.session is None:
+            if aiohttp is None:
+                raise ImportError('aiohttp is required by AsyncTicketbis')
+            self.session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(**self._options),
+                    trace_configs=self.trace_configs)
+        return self.session
+
+    async def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        if query:
+            url = '{0}?{1}'.format(url, query)
+        # The query is already encoded, don't let aiohttp requote it
+        response = await self.get_session().request(method,
+                yarl.URL(url, encoded=True), headers=headers,
+                data=_as_aiohttp_data(data, files),
+                auth=_as_aiohttp_auth(auth), ssl=ticketbis.VERIFY_SSL)
+        return _AiohttpResponse(response)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncHTTP2Transport(Transport):
+    """
+    Requests multiplexed over one HTTP/2 connection per host, shared by
+    every coroutine of the client (see ticketbis.transports.HTTP2Transport)
+    """
+
+    def __init__(self, pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            timeout=None, http1=True, client=None):
+        import httpx
+        self.errors = (httpx.HTTPError, httpx.StreamError)
+        if client is None:
+            client = httpx.AsyncClient(http1=http1, http2=True,
+                    verify=ticketbis.VERIFY_SSL, timeout=timeout,
+                    limits=httpx.Limits(max_connections=None,
+                        max_keepalive_connections=pool_maxsize if keep_alive
+                        else 0))
+        self.client = client
+
+    async def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        if query:
+            url = '{0}?{1}'.format(url, query)
+        # Forms are encoded by httpx, JSON bodies are sent as they are
+        if files or isinstance(data, dict):
+            request = self.client.build_request(method, url, headers=headers,
+                    data=data, files=files)
+        else:
+            request = self.client.build_request(method, url, headers=headers,
+                    content=data)
+        # Bodies are read apart, so errors reading them are mapped as well
+        return _AsyncHTTPXResponse(await self.client.send(request, auth=auth,
+                stream=True))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class _AiohttpResponse(object):
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status
+        self.headers = response.headers
+
+    async def read(self):
+        try:
+            return await self.response.read()
+        finally:
+            self.response.release()
+
+    def iter_chunks(self, chunk_size):
+        return self.response.content.iter_chunked(chunk_size)
+
+    async def release(self):
+        self.response.release()
+
+
+class _AsyncHTTPXResponse(object):
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.http_version = response.http_version
+
+    async def read(self):
+        try:
+            return await self.response.aread()
+        finally:
+            await self.response.aclose()
+
+    def iter_chunks(self, chunk_size):
+        return self.response.aiter_bytes(chunk_size)
+
+    async def release(self):
+        await self.response.aclose()
+
+
+"""
+Network helper functions
+"""
+class _BufferedResponse(object):
+    """Fully read aiohttp response, as expected by ticketbis._process_response"""
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+def _as_aiohttp_auth(auth):
+    if isinstance(auth, tuple):
+        return aiohttp.BasicAuth(*auth)
+    return auth
+
+def _as_aiohttp_data(data, files):
+    if not files:
+        return data
+    form = aiohttp.FormData()
+    for name, value in files.items():
+        if isinstance(value, tuple):
+            form.add_field(name, value[1], filename=value[0])
+        else:
+            form.add_field(name, value)
+    return form
+
+async def _request(transport, method, url, headers={}, params=None,
+        data=None, files=None, auth=None, stream=False, loads=None):
+    """
+    Makes a request through transport, mapping any connection error. The
+    body of successful streamed responses is decoded as it arrives.
+    """
+    query = _ticketbis_urlencode(params) if params else None
+    try:
+        response = await transport.request(method, url, headers=headers,
+                query=query, data=data, files=files, auth=auth, stream=stream)
+    except transport.errors as e:
+        _log_and_raise_exception('Error connecting with ticketbis API', e)
+    if stream and response.status_code in (200, 201):
+        return {'headers': response.headers,
+                'data': _iter_response_items(response, loads,
+                    transport.errors)}
+    return await _process_response(response, loads, transport.errors)
+
+async def _iter_response_items(response, loads=None, errors=()):
+    """Yields the items of a listing as they are read from the network"""
+    decoder = JSONArrayDecoder(loads or json.loads)
+    try:
+        async for chunk in response.iter_chunks(CHUNK_SIZE):
+            for item in decoder.feed(chunk):
+                yield item
+        for item in decoder.close():
+            yield item
+    except ValueError as e:
+        _log_and_raise_exception('Invalid response', e)
+    except errors as e:
+        _log_and_raise_exception('Error connecting with ticketbis API', e)
+    finally:
+        await response.release()
+
+async def _process_response(response, loads=None, errors=()):
+    """Reads the whole body and handles exception processing"""
+    timings = active_timings()
+    start = clock()
+    try:
+        content = await response.read()
+    except errors as e:
+        _log_and_raise_exception('Error connecting with ticketbis API', e)
+    if timings is not None:
+        timings['body'] = clock() - start
+    return ticketbis._process_response(
+            _BufferedResponse(response.status_code, response.headers, content),
+            loads=loads)
+
+
+def _trace_config():
+    """Times the connections and response headers of instrumented requests"""
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = clock()
+        context.dns = 0
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_started = clock()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        elapsed = clock() - context.dns_started
+        context.dns = getattr(context, 'dns', 0) + elapsed
+        timings = active_timings()
+        if timings is not None:
+            timings['dns'] = timings.get('dns', 0) + elapsed
+
+    async def on_connection_create_end(session, context, params):
+        timings = active_timings()
+        if timings is not None:
+            # TLS handshake included, DNS lookup timed apart
+            timings['connect'] = timings.get('connect', 0) + \
+                clock() - context.connect_started - context.dns
+
+    async def on_request_start(session, context, params):
+        context.request_started = clock()
+
+    async def on_request_end(session, context, params):
+        timings = active_timings()
+        if timings is not None:
+            timings['first_byte'] = max(0.0, clock() -
+                    context.request_started - timings.get('dns', 0) -
+                    timings.get('connect', 0))
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    return config
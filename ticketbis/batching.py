@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Automatic batching of GETs into /multi calls
+
+With auto_batch, endpoint GETs of a resource by id return a future instead
+of blocking. GETs made
+within batch_window seconds of each other are sent together, up to
+MAX_MULTI_REQUESTS per /multi call, so pages showing many events along with
+their venues don't pay a round trip per item:
+
+    client = Ticketbis(access_token=TOKEN, auto_batch=True)
+    venues = [client.venues(e['venue_id']) for e in events]
+    venues = [future.result() for future in venues]
+
+Every future gets its own response or exception. Responses of /multi calls
+carry no pagination headers, so listings are always sent apart.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import threading
+
+# 3rd party libraries that might not be present during initial install
+try:
+    # Backported as 'futures' on Python 2
+    from concurrent.futures import Future, ThreadPoolExecutor
+except ImportError:
+    pass
+
+from ticketbis import MAX_MULTI_REQUESTS, TicketbisException
+
+# Seconds a GET waits for others to share its /multi call
+DEFAULT_BATCH_WINDOW = 0.005
+
+# /multi calls sent at once by the threaded client when there are no
+# multi_workers
+DEFAULT_BATCH_WORKERS = 4
+
+
+class Batcher(object):
+    """Gathers sub-requests into /multi calls sent on a pool of threads"""
+
+    def __init__(self, send, window=DEFAULT_BATCH_WINDOW,
+            size=MAX_MULTI_REQUESTS, workers=DEFAULT_BATCH_WORKERS):
+        """
+        send is called with a list of up to size sub-requests and returns
+        the list of their /multi responses. A batch is sent once it is full,
+        or window seconds after its first sub-request.
+        """
+        self.send = send
+        self.window = window
+        self.size = size
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+        self._executor = None
+
+    def __len__(self):
+        """Sub-requests waiting for their batch to be sent"""
+        return len(self._pending)
+
+    def submit(self, request, parse):
+        """
+        Queues a sub-request, returning a future of parse(response). parse
+        raises the error of failed sub-requests.
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((request, parse, future))
+            batch = self._take() if len(self._pending) >= self.size else None
+            if batch is None and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._dispatch(batch)
+        return future
+
+    def flush(self):
+        """Sends the pending sub-requests right away"""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._dispatch(batch)
+
+    def close(self):
+        """Sends the pending sub-requests and waits for every batch"""
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _dispatch(self, batch):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+        executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        # Sub-requests whose future was cancelled aren't sent
+        batch = [item for item in batch
+                if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            responses = self.send([request for request, _, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        self._resolve(batch, responses)
+
+    def _resolve(self, batch, responses):
+        """Completes the future of every sub-request with its response"""
+        for i, (_, parse, future) in enumerate(batch):
+            if future.done():
+                # Cancelled while its batch was in flight
+                continue
+            if i >= len(responses):
+                future.set_exception(TicketbisException(
+                        u'Missing response in /multi call'))
+                continue
+            try:
+                result = parse(responses[i])
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Benchmarks, run as modules:
+
+    python -m ticketbis.benchmarks.api --output results.json
+    python -m ticketbis.benchmarks.models
+
+Results are JSON documents, so they can be compared across releases.
+"""
+import gc
+import json
+import platform
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+import ticketbis
+
+# Monotonic clock when available
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(fraction * (len(values) - 1)))
+    return values[rank]
+
+
+def measure(operation, repeat, warmup=1, memory_repeat=10):
+    """
+    Runs operation repeat times, returning its throughput and latency
+    percentiles (in seconds). Peak memory (in bytes) is measured apart, over
+    memory_repeat more runs, as tracing allocations slows everything down.
+    Operations may return how many items they processed.
+    """
+    for _ in range(warmup):
+        operation()
+    gc.collect()
+    latencies, items, errors = [], 0, 0
+    started = clock()
+    for _ in range(repeat):
+        start = clock()
+        try:
+            items += operation() or 0
+        except ticketbis.TicketbisException:
+            errors += 1
+        latencies.append(clock() - start)
+    elapsed = clock() - started
+    return {
+        'operations': repeat,
+        'errors': errors,
+        'items': items,
+        'elapsed': elapsed,
+        'throughput': repeat / elapsed if elapsed else None,
+        'items_per_second': items / elapsed if elapsed and items else None,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies) if latencies else None,
+        'memory_peak': measure_memory(operation, memory_repeat),
+    }
+
+
+def measure_memory(operation, repeat=1):
+    """Peak bytes allocated while running operation, None if unknown"""
+    if tracemalloc is None or not repeat:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            try:
+                operation()
+            except ticketbis.TicketbisException:
+                pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def environment():
+    """Describes what the results were measured with"""
+    return {
+        'ticketbis': ticketbis.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'json': ticketbis.json.__name__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def dump(results, output=None):
+    """Writes the results as JSON to output, a path, or stdout"""
+    document = json.dumps(results, indent=2, sort_keys=True)
+    if output in (None, '-'):
+        sys.stdout.write(document + '\n')
+    else:
+        with open(output, 'w') as f:
+            f.write(document + '\n')
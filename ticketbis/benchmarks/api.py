@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Client overhead against the local stub API (see ticketbis.benchmarks.server)
+
+    python -m ticketbis.benchmarks.api --requests 500 --output results.json
+    python -m ticketbis.benchmarks.api --latency 0.02 --error-rate 0.05 \\
+            --scenario get --scenario get_paginated
+
+Measures throughput, p50/p99 latency and peak memory of every scenario.
+Requests go through the default requests transport, HTTP/2 (httpx) or an
+in-process stub transport, as given by --transport.
+"""
+import argparse
+import itertools
+
+from ticketbis import Ticketbis, Metrics, MAX_MULTI_REQUESTS
+from ticketbis.retry import RetryPolicy
+from ticketbis.benchmarks import dump, environment, measure
+from ticketbis.benchmarks.server import StubServer, StubTransport
+
+
+def scenario_get(client, options):
+    ids = itertools.cycle(range(options.total))
+
+    def operation():
+        client.events(next(ids))
+        return 1
+    return operation
+
+
+def scenario_get_paginated(client, options):
+    def operation():
+        return sum(1 for _ in client.events(auto_pagination=True,
+                params={'max': options.page_size}))
+    return operation
+
+
+def scenario_multi(client, options):
+    ids = itertools.cycle(range(options.total))
+
+    def operation():
+        for _ in range(options.multi_size):
+            client.events(next(ids), multi=True)
+        return sum(1 for _ in client.multi())
+    return operation
+
+
+def scenario_post(client, options):
+    def operation():
+        client.events.create({'name': u'New event', 'venue_id': 1})
+        return 1
+    return operation
+
+
+def scenario_put(client, options):
+    ids = itertools.cycle(range(options.total))
+
+    def operation():
+        client.events.update({'id': next(ids), 'name': u'Updated event'})
+        return 1
+    return operation
+
+
+def scenario_bulk_update(client, options):
+    ids = itertools.cycle(range(options.total))
+
+    def operation():
+        records = [{'id': next(ids), 'name': u'Updated event'}
+                for _ in range(options.bulk_size)]
+        return sum(1 for _ in client.events.bulk_update(records))
+    return operation
+
+
+def scenario_oauth(client, options):
+    def operation():
+        client.oauth.get_token(u'code')
+        return 1
+    return operation
+
+
+def create_transport(name, server):
+    """Transport of the client, None for the default one"""
+    if name == 'http2':
+        # The stub server speaks HTTP/2 over cleartext, with prior knowledge
+        from ticketbis.transports import HTTP2Transport
+        return HTTP2Transport(http1=False)
+    if name == 'stub':
+        return StubTransport(server)
+    return None
+
+TRANSPORTS = ('requests', 'http2', 'stub')
+
+
+SCENARIOS = {
+    'get': scenario_get,
+    'get_paginated': scenario_get_paginated,
+    'multi': scenario_multi,
+    'post': scenario_post,
+    'put': scenario_put,
+    'bulk_update': scenario_bulk_update,
+    'oauth': scenario_oauth,
+}
+
+
+def run(options):
+    """Runs the chosen scenarios against a fresh stub server"""
+    results = {}
+    server = StubServer(total=options.total, latency=options.latency,
+            jitter=options.jitter, error_rate=options.error_rate,
+            error_type=options.error_type, http2=options.transport == 'http2',
+            seed=options.seed)
+    retry_policy = RetryPolicy(max_attempts=options.max_attempts,
+            backoff=options.backoff)
+    with server:
+        for name in options.scenario or sorted(SCENARIOS):
+            server.reset()
+            with Ticketbis(client_id='id', client_secret='secret',
+                    redirect_uri='http://localhost', access_token='token',
+                    site='ticketbisES', api_endpoint=server.url,
+                    pagination_workers=options.pagination_workers,
+                    multi_workers=options.multi_workers,
+                    bulk_workers=options.bulk_workers,
+                    retry_policy=retry_policy, stream=options.stream,
+                    metrics=Metrics() if options.metrics else None,
+                    transport=create_transport(options.transport, server)) \
+                    as client:
+                operation = SCENARIOS[name](client, options)
+                results[name] = measure(operation, options.requests)
+            results[name]['http_requests'] = sum(server.hits.values())
+    return {
+        'environment': environment(),
+        'options': vars(options),
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', action='append',
+            choices=sorted(SCENARIOS),
+            help='scenario to run, can be repeated (default: all)')
+    parser.add_argument('--requests', type=int, default=200,
+            help='operations measured per scenario')
+    parser.add_argument('--total', type=int, default=1000,
+            help='items in every listing')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--multi-size', type=int, default=MAX_MULTI_REQUESTS,
+            help='requests queued per multi operation')
+    parser.add_argument('--bulk-size', type=int, default=20,
+            help='records written per bulk operation')
+    parser.add_argument('--latency', type=float, default=0,
+            help='seconds the server waits before answering')
+    parser.add_argument('--jitter', type=float, default=0,
+            help='up to this many more seconds of latency')
+    parser.add_argument('--error-rate', type=float, default=0,
+            help='probability of answering with an error')
+    parser.add_argument('--error-type', default='server_error')
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=0.01)
+    parser.add_argument('--pagination-workers', type=int, default=0)
+    parser.add_argument('--multi-workers', type=int, default=0)
+    parser.add_argument('--bulk-workers', type=int, default=0)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--transport', choices=TRANSPORTS,
+            default='requests', help='stub answers in process, measuring '
+            'the client alone (default: requests)')
+    parser.add_argument('--metrics', action='store_true',
+            help='attach ticketbis.metrics to measure its overhead')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    dump(run(options), options.output)
+
+
+if __name__ == '__main__':
+    main()
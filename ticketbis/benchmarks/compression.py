@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Bytes on the wire and decode cost of compressed transfers, against the local
+stub API
+
+    python -m ticketbis.benchmarks.compression --total 2000 --latency 0.01
+
+Listings are paginated and events written in bulk with each Accept-Encoding,
+request bodies being gzipped unless identity, counting the body bytes the
+server sent and received. Decoding is timed
+apart, per page: decompressing it and then parsing its JSON.
+"""
+import argparse
+import itertools
+import timeit
+
+from ticketbis import Ticketbis, json
+from ticketbis.benchmarks import dump, environment, measure
+from ticketbis.benchmarks.server import StubServer, event
+from ticketbis.compression import brotli_module, decompress, gzip_compress
+
+# Accept-Encoding of each scenario
+ENCODINGS = {
+    'identity': 'identity',
+    'gzip': 'gzip',
+    'br': 'br',
+}
+
+
+def decode_costs(options):
+    """Seconds taken to decode a page of events, per encoding"""
+    page = json.dumps([event(i) for i in range(options.page_size)]) \
+        .encode('utf-8')
+    bodies = {'identity': page, 'gzip': gzip_compress(page)}
+    if brotli_module() is not None:
+        bodies['br'] = brotli_module().compress(page, quality=4)
+    results = {}
+    for encoding, body in sorted(bodies.items()):
+        number = options.number
+        decompress_time = timeit.timeit(lambda: decompress(body, encoding),
+                number=number) / number
+        total_time = timeit.timeit(
+                lambda: json.loads(decompress(body, encoding)),
+                number=number) / number
+        results[encoding] = {
+            'bytes': len(body),
+            'ratio': float(len(body)) / len(page),
+            'decompress': decompress_time,
+            'decompress_and_parse': total_time,
+        }
+    return results
+
+
+def run(options):
+    results = {}
+    with StubServer(total=options.total, latency=options.latency,
+            compression=True) as server:
+        for name in options.scenario or sorted(ENCODINGS):
+            if name == 'br' and brotli_module() is None:
+                continue
+            client = Ticketbis(access_token='token', site='ticketbisES',
+                    api_endpoint=server.url, stream=options.stream,
+                    compression=ENCODINGS[name],
+                    compress_min_size=None if name == 'identity' else
+                    options.compress_min_size)
+            ids = itertools.cycle(range(options.total))
+
+            def paginate():
+                return sum(1 for _ in client.events(auto_pagination=True,
+                        params={'max': options.page_size}))
+
+            def bulk_update():
+                records = [{'id': next(ids), 'name': u'Updated event',
+                        'description': u'Description of the updated event'}
+                        for _ in range(options.bulk_size)]
+                return sum(1 for _ in client.events.bulk_update(records))
+            for scenario, operation in (('get_paginated', paginate),
+                    ('bulk_update', bulk_update)):
+                server.reset()
+                result = measure(operation, options.requests, memory_repeat=0)
+                # Warm up runs included
+                result['bytes_sent'] = server.bytes_sent
+                result['bytes_received'] = server.bytes_received
+                results['{0}_{1}'.format(scenario, name)] = result
+            client.close()
+    return {
+        'environment': environment(),
+        'options': vars(options),
+        'results': results,
+        'decode': decode_costs(options),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', action='append',
+            choices=sorted(ENCODINGS),
+            help='encoding to run, can be repeated (default: all)')
+    parser.add_argument('--requests', type=int, default=10,
+            help='operations per scenario')
+    parser.add_argument('--total', type=int, default=1000,
+            help='events listed by the stub server')
+    parser.add_argument('--page-size', type=int, default=100,
+            help='events per page')
+    parser.add_argument('--bulk-size', type=int, default=20,
+            help='events per bulk update')
+    parser.add_argument('--compress-min-size', type=int, default=64,
+            help='bytes from which request bodies are gzipped')
+    parser.add_argument('--latency', type=float, default=0,
+            help='seconds the server waits before answering')
+    parser.add_argument('--stream', action='store_true',
+            help='decode pages as they arrive')
+    parser.add_argument('--number', type=int, default=200,
+            help='decodings timed per encoding')
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    options = parser.parse_args(argv)
+    dump(run(options), options.output)
+
+
+if __name__ == '__main__':
+    main()
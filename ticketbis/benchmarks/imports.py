@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Time taken to import the client, in fresh interpreters
+
+    python -m ticketbis.benchmarks.imports --repeat 20
+
+Every scenario runs in new processes with -X importtime (Python 3.7+),
+reporting their wall time, the import time of ticketbis and the slowest
+modules imported. Heavy dependencies (requests, aiohttp) should only show up
+once a client uses them.
+"""
+import argparse
+import subprocess
+import sys
+
+from ticketbis.benchmarks import dump, environment, percentile
+
+# What is imported by each scenario
+SCENARIOS = {
+    'package': 'import ticketbis',
+    'client': 'import ticketbis; ticketbis.Ticketbis(access_token="token")',
+    'aio': 'import ticketbis.aio',
+}
+
+# Modules whose import is reported per scenario
+HEAVY_MODULES = ('requests', 'aiohttp', 'six', 'concurrent.futures',
+        'inspect', 'ujson', 'simplejson', 'json')
+
+
+def import_times(statement):
+    """
+    Runs statement in a new interpreter, returning the cumulative import time
+    (in seconds) of every module it imported, by name
+    """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+            statement], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    if process.returncode:
+        raise RuntimeError(err.decode('utf-8', 'replace'))
+    times = {}
+    for line in err.decode('utf-8', 'replace').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def wall_time(statement):
+    """Seconds taken by a new interpreter running statement"""
+    timer = 'import time; start = time.time(); {0}; ' \
+        'print(time.time() - start)'.format(statement)
+    return float(subprocess.check_output([sys.executable, '-c', timer]))
+
+
+def run(options):
+    results = {}
+    # Imported by the interpreter itself (site, .pth files...)
+    startup = import_times('pass')
+    for name in options.scenario or sorted(SCENARIOS):
+        statement = SCENARIOS[name]
+        walls = [wall_time(statement) for _ in range(options.repeat)]
+        times = import_times(statement)
+        # Top-level modules only, their import time includes their children
+        top = sorted(((module, seconds) for module, seconds in times.items()
+                if '.' not in module and module not in startup),
+                key=lambda item: -item[1])
+        results[name] = {
+            'statement': statement,
+            'wall_p50': percentile(walls, 0.5),
+            'wall_max': max(walls),
+            'import_time': times.get('ticketbis'),
+            'slowest': top[:options.top],
+            'heavy_modules': dict((module, times[module])
+                    for module in HEAVY_MODULES if module in times),
+        }
+    return {
+        'environment': environment(),
+        'options': vars(options),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', action='append',
+            choices=sorted(SCENARIOS),
+            help='scenario to run, can be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=10,
+            help='interpreters started per scenario to time the import')
+    parser.add_argument('--top', type=int, default=10,
+            help='slowest modules reported per scenario')
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    options = parser.parse_args(argv)
+    dump(run(options), options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Memory and attribute access of ticketbis.models against plain dicts
+
+    python -m ticketbis.benchmarks.models --events 100000
+"""
+import argparse
+import gc
+import timeit
+
+from ticketbis import json
+from ticketbis.models import Event
+from ticketbis.benchmarks import dump, environment, tracemalloc
+from ticketbis.benchmarks.server import event
+
+
+def retained_memory(build):
+    """Bytes held by what build returns, None if unknown"""
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def run(count=100000):
+    # Decoded anew every time, so strings aren't shared as in a real listing
+    data = json.dumps([event(i) for i in range(count)])
+    results = {
+        'memory_dicts': retained_memory(lambda: json.loads(data)),
+        'memory_models': retained_memory(
+            lambda: [Event(r) for r in json.loads(data)]),
+    }
+
+    dicts = json.loads(data)
+    models = [Event(r) for r in json.loads(data)]
+    number = max(1, 1000000 // count)
+    results['access_dicts'] = timeit.timeit(
+        lambda: [r['name'] for r in dicts], number=number) / number
+    results['access_models'] = timeit.timeit(
+        lambda: [r.name for r in models], number=number) / number
+    results['access_models_items'] = timeit.timeit(
+        lambda: [r['name'] for r in models], number=number) / number
+    results['build_models'] = timeit.timeit(
+        lambda: [Event(r) for r in dicts], number=1)
+    results['parse_dates_first'] = timeit.timeit(
+        lambda: [r.start_date for r in models], number=1)
+    results['parse_dates_cached'] = timeit.timeit(
+        lambda: [r.start_date for r in models], number=1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    options = parser.parse_args(argv)
+    dump({
+        'environment': environment(),
+        'options': vars(options),
+        'results': run(options.events),
+    }, options.output)
+
+
+if __name__ == '__main__':
+    main()
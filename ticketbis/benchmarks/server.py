@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Local stand-in of the Ticketbis API
+
+Serves generated events, categories and venues (plus sites, cities, schemas
+and section groups) with the pagination, site and rate limit headers of the
+real API, /multi and /oauth/token/. Latency and errors can be injected:
+
+    with StubServer(total=1000, latency=0.01, error_rate=0.05) as server:
+        client = Ticketbis(access_token='token', api_endpoint=server.url)
+        client.events(auto_pagination=True)
+
+With http2, HTTP/2 is spoken over cleartext instead of HTTP/1.1, to clients
+knowing it beforehand (requires the h2 library):
+
+    with StubServer(http2=True) as server:
+        client = Ticketbis(access_token='token', api_endpoint=server.url,
+                transport=HTTP2Transport(http1=False))
+
+StubTransport answers from a StubServer in process, without sockets:
+
+    client = Ticketbis(access_token='token', transport=StubTransport(
+            StubServer(total=1000)))
+"""
+import hashlib
+import random
+import socket
+import threading
+import time
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib import parse
+
+from ticketbis import json
+from ticketbis.compression import brotli_module, decompress, gzip_compress
+from ticketbis.transports import Transport
+
+SITE = 'ticketbisES'
+# Site answered for each Accept-Language without X-ticketbis-site, SITE for
+# any other lang
+LANG_SITES = {
+    'es': 'ticketbisES',
+    'fr': 'ticketbisFR',
+    'de': 'ticketbisDE',
+    'it': 'ticketbisIT',
+    'pt': 'ticketbisPT',
+}
+ACCESS_TOKEN = 'stub-access-token'
+DEFAULT_PAGE_SIZE = 10
+
+CITIES = ('Madrid', 'Barcelona', 'Paris', 'Rome', 'London', 'Bilbao')
+CURRENCIES = ('EUR', 'GBP')
+
+# Status code answered for each error type, injected or not
+ERROR_CODES = {
+    'server_error': 500,
+    'rate_limit_exceeded': 429,
+    'not_authorized': 403,
+    'param_error': 400,
+    'invalid_auth': 401,
+}
+
+
+def event(i):
+    return {
+        'id': i,
+        'name': u'Event {0}'.format(i),
+        'description': u'Description of event {0}'.format(i),
+        'start_date': '2016-{0:02d}-{1:02d}T21:00:00Z'.format(
+            i % 12 + 1, i % 28 + 1),
+        'end_date': '2016-{0:02d}-{1:02d}T23:30:00Z'.format(
+            i % 12 + 1, i % 28 + 1),
+        'category_id': i % 50,
+        'venue_id': i % 500,
+        'city': CITIES[i % len(CITIES)],
+        'country': 'ES',
+        'currency': CURRENCIES[i % len(CURRENCIES)],
+        'site': SITE,
+        'min_price': 10.0 + i % 90,
+        'url': u'https://www.ticketbis.com/event/{0}'.format(i),
+    }
+
+
+def category(i):
+    return {'id': i, 'name': u'Category {0}'.format(i), 'parent_id': None,
+            'site': SITE}
+
+
+def venue(i):
+    return {'id': i, 'name': u'Venue {0}'.format(i),
+            'address': u'{0} Main Street'.format(i),
+            'city': CITIES[i % len(CITIES)], 'country': 'ES', 'site': SITE}
+
+
+def generic(i):
+    return {'id': i, 'name': u'Item {0}'.format(i), 'site': SITE}
+
+
+# Item builders of each resource
+RESOURCES = {
+    'events': event,
+    'categories': category,
+    'venues': venue,
+    'sites': generic,
+    'cities': generic,
+    'schemas': generic,
+    'section_groups': generic,
+}
+
+
+class StubServer(object):
+    """Threaded HTTP server emulating the Ticketbis API on localhost"""
+
+    def __init__(self, total=1000, latency=0, jitter=0, error_rate=0,
+            error_type='server_error', rate_limit=5000, rate_window=3600,
+            token_lifetime=3600, compression=False, http2=False, seed=None,
+            host='127.0.0.1', port=0):
+        """
+        Listings have total items. Every request is delayed latency seconds,
+        plus up to jitter more, and fails with error_type with probability
+        error_rate. Once rate_limit requests are made within rate_window
+        seconds, requests fail with rate_limit_exceeded. Tokens expire in
+        token_lifetime seconds. With compression, responses are encoded as
+        the client's Accept-Encoding asks for (br or gzip). With http2,
+        requests are answered over HTTP/2 with prior knowledge.
+        """
+        self.total = total
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_type = error_type
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.token_lifetime = token_lifetime
+        self.compression = compression
+        self.http2 = http2
+        # Tokens issued so far, requests made with a revoked one fail with
+        # invalid_auth
+        self.tokens = []
+        self.revoked = set()
+        self.random = random.Random(seed)
+        self.address = (host, port)
+        self.hits = {}
+        # Body bytes sent and received, as on the wire
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Fields overriding the generated ones, by (resource, id)
+        self.overrides = {}
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_used = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """API endpoint to give to the client"""
+        host, port = self._httpd.server_address[:2]
+        return 'http://{0}:{1}/'.format(host, port)
+
+    def start(self):
+        if self.http2:
+            self._httpd = _H2Server(self.address, _H2Handler)
+        else:
+            self._httpd = _HTTPServer(self.address, _Handler)
+        self._httpd.stub = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def reset(self):
+        """Forgets the requests made so far"""
+        with self._lock:
+            self.hits = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self._window_start = time.time()
+            self._window_used = 0
+
+    def _count(self, path):
+        """Counts a request, returning the remaining rate limit"""
+        with self._lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            now = time.time()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_used = now, 0
+            self._window_used += 1
+            return self.rate_limit - self._window_used
+
+    def _transferred(self, sent, received):
+        with self._lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def _encode(self, content, accept_encoding):
+        """Compresses a body as asked for, returning it and its encoding"""
+        if not self.compression or not content:
+            return content, None
+        accepted = [e.split(';')[0].strip()
+                for e in (accept_encoding or '').split(',')]
+        if 'br' in accepted and brotli_module() is not None:
+            # Fast setting, as servers use for dynamic content
+            return brotli_module().compress(content, quality=4), 'br'
+        if 'gzip' in accepted:
+            return gzip_compress(content), 'gzip'
+        return content, None
+
+    def _retry_after(self):
+        with self._lock:
+            return max(0, self._window_start + self.rate_window - time.time())
+
+    def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            with self._lock:
+                delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _inject_error(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def respond(self, method, path, headers, content=b''):
+        """
+        Answers a request to path (query string included) with the given
+        headers and body, returning its status, headers and body
+        """
+        url = parse.urlparse(path)
+        query = dict(parse.parse_qsl(url.query))
+        body = _decode_body(content, headers)
+        self._delay()
+        remaining = self._count(url.path)
+        extra = {}
+        if remaining < 0:
+            status, data, extra = _error('rate_limit_exceeded',
+                    ERROR_CODES['rate_limit_exceeded'], u'Rate limit exceeded')
+            extra['Retry-After'] = '{0:.0f}'.format(self._retry_after())
+        elif _token(headers) in self.revoked:
+            status, data, extra = _error('invalid_auth', 401,
+                    u'Invalid or expired token')
+        elif self._inject_error():
+            status, data, extra = _error(self.error_type,
+                    ERROR_CODES.get(self.error_type, 500), u'Injected error')
+            if self.error_type == 'rate_limit_exceeded':
+                extra['Retry-After'] = '0'
+        else:
+            status, data, extra = self.handle(method, url.path, query, body)
+
+        response = json.dumps(data).encode('utf-8')
+        response_headers = {
+            'Content-Type': 'application/json',
+            'X-ticketbis-site': _site(headers),
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(max(0, remaining)),
+        }
+        if method == 'GET' and status == 200:
+            response_headers['ETag'] = '"{0}"'.format(
+                    hashlib.sha1(response).hexdigest())
+            if headers.get('If-None-Match') == response_headers['ETag']:
+                status, response = 304, b''
+        response_headers.update(extra)
+        response, encoding = self._encode(response,
+                headers.get('Accept-Encoding'))
+        if encoding is not None:
+            response_headers['Content-Encoding'] = encoding
+            response_headers['Vary'] = 'Accept-Encoding'
+        response_headers['Content-Length'] = str(len(response))
+        self._transferred(len(response), len(content))
+        return status, response_headers, response
+
+    def handle(self, method, path, query, body=None):
+        """Returns the status, body and extra headers answering a request"""
+        parts = [p for p in path.split('/') if p]
+        if method == 'POST' and parts == ['oauth', 'token']:
+            return 200, {'access_token': self._issue_token(),
+                    'token_type': 'bearer',
+                    'expires_in': self.token_lifetime}, {}
+        if method == 'GET' and parts == ['multi']:
+            return 200, self._multi(query), {}
+        if not parts or parts[0] not in RESOURCES:
+            return _error('endpoint_error', 404, u'Unknown endpoint')
+        if method == 'GET':
+            return self._get(parts, query)
+        if method in ('POST', 'PUT'):
+            item = dict(body or {})
+            item.setdefault('id', int(parts[1]) if len(parts) > 1 and
+                    parts[1].isdigit() else self.total + 1)
+            return (201 if method == 'POST' else 200), item, {}
+        return _error('endpoint_error', 405, u'Method not allowed')
+
+    def _issue_token(self):
+        with self._lock:
+            token = ACCESS_TOKEN if not self.tokens else \
+                '{0}-{1}'.format(ACCESS_TOKEN, len(self.tokens))
+            self.tokens.append(token)
+            return token
+
+    def item(self, resource, item_id):
+        """Item of a resource, as served"""
+        item = RESOURCES.get(resource, generic)(item_id)
+        item.update(self.overrides.get((resource, item_id), {}))
+        return item
+
+    def _get(self, parts, query):
+        resource = parts[0]
+        if len(parts) == 2:
+            if not parts[1].isdigit() or int(parts[1]) >= self.total:
+                return _error('param_error', 404, u'Not found')
+            return 200, self.item(resource, int(parts[1])), {}
+        if len(parts) == 3:
+            # Sub-resources, i.e. /categories/1/events
+            resource = parts[2]
+        try:
+            offset = int(query.get('offset', 0))
+            page_size = int(query.get('max', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return _error('param_error', 400, u'Invalid offset or max')
+        items = [self.item(resource, i) for i in
+                range(offset, min(offset + page_size, self.total))]
+        return 200, items, {
+            'X-ticketbis-totalCount': str(self.total),
+            'X-ticketbis-pageOffset': str(offset),
+            'X-ticketbis-pageMaxSize': str(page_size),
+        }
+
+    def _multi(self, query):
+        responses = []
+        for request in query.get('requests', '').split(','):
+            url = parse.urlparse(parse.unquote_plus(request))
+            sub_query = dict(parse.parse_qsl(url.query))
+            status, data, headers = self.handle('GET', url.path, sub_query)
+            if status == 200:
+                responses.append({'meta': {'code': 200}, 'response': data})
+            else:
+                responses.append(data)
+        return {'responses': responses}
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep-alive, as the real API
+    protocol_version = 'HTTP/1.1'
+    # Headers and body in a single write, avoiding delayed ACK stalls
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_PUT(self):
+        self._respond('PUT')
+
+    def _respond(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        content = self.rfile.read(length) if length else b''
+        status, headers, content = self.server.stub.respond(method,
+                self.path, self.headers, content)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class _H2Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _H2Handler(socketserver.BaseRequestHandler):
+    """
+    HTTP/2 connection, every stream answered by a thread of its own as its
+    request ends
+    """
+
+    def handle(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connection = h2.connection.H2Connection(h2.config.H2Configuration(
+                client_side=False, header_encoding='utf-8'))
+        # Guards the connection, notified as flow control windows open
+        self.condition = threading.Condition()
+        self.closed = False
+        requests = {}
+        with self.condition:
+            self.connection.initiate_connection()
+            self._flush()
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                with self.condition:
+                    events = self.connection.receive_data(data)
+                    self._flush()
+                    self.condition.notify_all()
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = (dict(event.headers), [])
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id][1].append(event.data)
+                        with self.condition:
+                            self.connection.acknowledge_received_data(
+                                    event.flow_controlled_length,
+                                    event.stream_id)
+                            self._flush()
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = requests.pop(event.stream_id)
+                        thread = threading.Thread(target=self._respond,
+                                args=(event.stream_id, headers, b''.join(body)))
+                        thread.daemon = True
+                        thread.start()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+        except (socket.error, h2.exceptions.ProtocolError):
+            return
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+
+    def _flush(self):
+        data = self.connection.data_to_send()
+        if data:
+            self.request.sendall(data)
+
+    def _respond(self, stream_id, headers, content):
+        from requests.structures import CaseInsensitiveDict
+        import h2.exceptions
+        status, response_headers, body = self.server.stub.respond(
+                headers[':method'], headers[':path'],
+                CaseInsensitiveDict(headers), content)
+        try:
+            with self.condition:
+                self.connection.send_headers(stream_id,
+                        [(':status', str(status))] +
+                        [(k.lower(), v) for k, v in response_headers.items()],
+                        end_stream=not body)
+                self._flush()
+            while body:
+                with self.condition:
+                    # Sent as the client opens its flow control window
+                    size = min(len(body),
+                            self.connection.local_flow_control_window(
+                                stream_id),
+                            self.connection.max_outbound_frame_size)
+                    if size <= 0:
+                        if self.closed:
+                            return
+                        self.condition.wait(1)
+                        continue
+                    self.connection.send_data(stream_id, body[:size],
+                            end_stream=size == len(body))
+                    self._flush()
+                body = body[size:]
+        except (socket.error, h2.exceptions.StreamClosedError,
+                h2.exceptions.ProtocolError):
+            # Reset by the client, or the connection is gone
+            pass
+
+
+class StubTransport(Transport):
+    """
+    Transport answering requests from a StubServer in process, without
+    opening sockets (see ticketbis.transports), so benchmarks measure the
+    client alone. The server needn't be started.
+    """
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        from requests.structures import CaseInsensitiveDict
+        path = parse.urlparse(url).path
+        if query:
+            path = '{0}?{1}'.format(path, query)
+        headers = CaseInsensitiveDict(headers or {})
+        if isinstance(data, dict):
+            # Forms, as requests would send them
+            data = parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        status, response_headers, content = self.stub.respond(method, path,
+                headers, data or b'')
+        # Decompressed, as HTTP libraries do
+        content = decompress(content, response_headers.get('Content-Encoding'))
+        return _StubResponse(status, response_headers, content)
+
+
+class _StubResponse(object):
+    """Response of StubTransport, read as requests' ones"""
+
+    def __init__(self, status_code, headers, content):
+        from requests.structures import CaseInsensitiveDict
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def _token(headers):
+    authorization = headers.get('Authorization') or ''
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    return None
+
+
+def _site(headers):
+    """Site asked for, or the one of the lang asked for"""
+    site = headers.get('X-ticketbis-site')
+    if site:
+        return site
+    lang = (headers.get('Accept-Language') or '').split(',')[0].strip()
+    return LANG_SITES.get(lang.lower(), SITE)
+
+
+def _decode_body(content, headers):
+    """Request body as JSON or form, None if empty"""
+    if not content:
+        return None
+    content = decompress(content, headers.get('Content-Encoding'))
+    if 'json' in (headers.get('Content-Type') or ''):
+        try:
+            return json.loads(content.decode('utf-8'))
+        except ValueError:
+            return None
+    return dict(parse.parse_qsl(content.decode('utf-8')))
+
+
+def _error(error_type, status, detail):
+    return status, {'meta': {'code': status, 'errorType': error_type,
+            'errorDetail': detail}}, {}
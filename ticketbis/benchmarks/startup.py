@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Cost of creating short-lived clients against the local stub API
+
+    python -m ticketbis.benchmarks.startup --clients 200 --latency 0.01
+
+Clients are created with a token and no site, then make one request. eager
+reproduces what creating a client used to do: resolve the site with a
+request and create every endpoint.
+"""
+import argparse
+import itertools
+
+from ticketbis import Ticketbis
+from ticketbis.benchmarks import dump, environment, measure
+from ticketbis.benchmarks.server import StubServer
+
+
+def scenario_create(server, tokens):
+    def operation():
+        Ticketbis(access_token=next(tokens), api_endpoint=server.url).close()
+        return 1
+    return operation
+
+
+def scenario_eager(server, tokens):
+    def operation():
+        client = Ticketbis(access_token=next(tokens), api_endpoint=server.url)
+        client._resolve_site()
+        for name in client._endpoint_classes():
+            getattr(client, name)
+        client.events(1)
+        client.close()
+        return 1
+    return operation
+
+
+def scenario_first_request(server, tokens):
+    def operation():
+        client = Ticketbis(access_token=next(tokens), api_endpoint=server.url)
+        client.events(1)
+        client.close()
+        return 1
+    return operation
+
+
+def scenario_first_request_cached_site(server, tokens):
+    def operation():
+        # The same token every time, its site is known after the first one
+        client = Ticketbis(access_token='token', api_endpoint=server.url)
+        client.events(1)
+        client.close()
+        return 1
+    return operation
+
+
+SCENARIOS = {
+    'create': scenario_create,
+    'eager': scenario_eager,
+    'first_request': scenario_first_request,
+    'first_request_cached_site': scenario_first_request_cached_site,
+}
+
+
+def run(options):
+    results = {}
+    with StubServer(total=10, latency=options.latency) as server:
+        for name in options.scenario or sorted(SCENARIOS):
+            server.reset()
+            # A new token per client, so sites aren't known beforehand
+            tokens = ('token-{0}-{1}'.format(name, i)
+                    for i in itertools.count())
+            results[name] = measure(SCENARIOS[name](server, tokens),
+                    options.clients)
+            results[name]['http_requests'] = sum(server.hits.values())
+    return {
+        'environment': environment(),
+        'options': vars(options),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', action='append',
+            choices=sorted(SCENARIOS),
+            help='scenario to run, can be repeated (default: all)')
+    parser.add_argument('--clients', type=int, default=200,
+            help='clients created per scenario')
+    parser.add_argument('--latency', type=float, default=0.01,
+            help='seconds the server waits before answering')
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    options = parser.parse_args(argv)
+    dump(run(options), options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Query string encoding of ticketbis._ticketbis_urlencode against the encoder
+it replaced, kept here as legacy_urlencode
+
+    python -m ticketbis.benchmarks.urlencode --number 100000
+"""
+import argparse
+import sys
+import timeit
+
+import six
+from six.moves.urllib import parse
+
+from ticketbis import _as_utf8, _ticketbis_urlencode
+from ticketbis.benchmarks import dump, environment
+
+# Queries of typical requests
+QUERIES = {
+    'page': {'offset': 200, 'max': 100},
+    'filters': {'offset': 0, 'max': 50, 'category_id': 12,
+            'start_date': '2016-01-01T00:00:00Z', 'city': u'Madrid',
+            'fields': 'id,name,start_date,venue'},
+    'unicode': {'q': u'Málaga & Córdoba', 'city': u'São Paulo'},
+    'multi': {'requests': '/events/1,/events/2,/events/3,/events/4,'
+            '/events/5'},
+}
+
+
+def legacy_urlencode(query, doseq=0, safe_chars="&/,+"):
+    """The encoder before it was optimized, the reference of its output"""
+    if hasattr(query,"items"):
+        query = query.items()
+    else:
+        try:
+            if len(query) and not isinstance(query[0], tuple):
+                raise TypeError
+        except TypeError:
+            ty,va,tb = sys.exc_info()
+            six.reraise(TypeError,
+                    TypeError("not valid non-string sequence"), tb)
+
+    l = []
+    if not doseq:
+        for k, v in query:
+            k = parse.quote(_as_utf8(k), safe=safe_chars)
+            v = parse.quote(_as_utf8(v), safe=safe_chars)
+            l.append(k + '=' + v)
+    else:
+        for k, v in query:
+            k = parse.quote(_as_utf8(k), safe=safe_chars)
+            if isinstance(v, six.string_types):
+                v = parse.quote(_as_utf8(v), safe=safe_chars)
+                l.append(k + '=' + v)
+            else:
+                try:
+                    len(v)
+                except TypeError:
+                    v = parse.quote(_as_utf8(v), safe=safe_chars)
+                    l.append(k + '=' + v)
+                else:
+                    for elt in v:
+                        l.append(k + '=' + parse.quote(_as_utf8(elt)))
+    return '&'.join(l)
+
+
+def run(number=100000):
+    """Seconds per call of both encoders for every query"""
+    results = {}
+    for name, query in sorted(QUERIES.items()):
+        legacy = timeit.timeit(lambda: legacy_urlencode(query),
+                number=number) / number
+        fast = timeit.timeit(lambda: _ticketbis_urlencode(query),
+                number=number) / number
+        results[name] = {
+            'legacy': legacy,
+            'fast': fast,
+            'speedup': legacy / fast if fast else None,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--number', type=int, default=100000,
+            help='calls timed per query and encoder')
+    parser.add_argument('--output', default='-',
+            help='file the JSON results are written to (default: stdout)')
+    options = parser.parse_args(argv)
+    dump({
+        'environment': environment(),
+        'options': vars(options),
+        'results': run(options.number),
+    }, options.output)
+
+
+if __name__ == '__main__':
+    main()
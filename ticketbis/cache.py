@@ -0,0 +1,506 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Opt-in cache for GET responses
+
+Responses are kept for a per endpoint TTL. Once expired they are revalidated
+with If-None-Match/If-Modified-Since, so unchanged data costs a 304 instead
+of the whole body:
+
+    cache = ResponseCache(ttl=60, ttls={'sites': 3600, 'events': None})
+    client = Ticketbis(access_token=TOKEN, cache=cache)
+
+Entries are kept by a pluggable backend, an in-memory LRU by default.
+SQLiteBackend and MmapBackend persist them as compressed JSON in a file that
+survives restarts and can be shared by several processes on the same host:
+
+    cache = ResponseCache(backend=SQLiteBackend('/var/cache/ticketbis.db'))
+
+Any object implementing CacheBackend's get/set/delete/clear can be used. The
+backend is closed along with the client.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, files won't be shared safely
+    fcntl = None
+
+from ticketbis import json
+
+# Default time to live of cached responses, in seconds
+DEFAULT_TTL = 300
+
+# Default max number of responses kept by the cache
+DEFAULT_MAX_ENTRIES = 1024
+
+# Default max size of a memory-mapped cache file before it gets compacted
+DEFAULT_MAX_FILE_SIZE = 64 * 1024 * 1024
+
+# Request headers that make a response different for the same url. Tokens
+# are part of keys, so a cache shared by clients never serves the responses
+# of one user to another.
+VARY_HEADERS = ('X-ticketbis-site', 'Accept-Language', 'Authorization')
+
+
+class CacheEntry(object):
+    """Cached response along with its validators"""
+    __slots__ = ('headers', 'data', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, headers, data, expires, etag=None, last_modified=None):
+        self.headers = headers
+        self.data = data
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires
+
+    def result(self):
+        """Returns the entry as a network helper result"""
+        return {'headers': self.headers, 'data': self.data}
+
+    def copy(self):
+        """Shallow copy, sharing the headers and data"""
+        return CacheEntry(self.headers, self.data, self.expires, self.etag,
+                self.last_modified)
+
+    def dumps(self):
+        """Serializes the entry as compressed JSON"""
+        return zlib.compress(json.dumps({
+            'headers': dict(self.headers),
+            'data': self.data,
+            'expires': self.expires,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+        }).encode('utf8'))
+
+    @classmethod
+    def loads(cls, value):
+        # Imported here, so importing the cache doesn't import requests
+        from requests.structures import CaseInsensitiveDict
+        entry = json.loads(zlib.decompress(value).decode('utf8'))
+        return cls(CaseInsensitiveDict(entry['headers']), entry['data'],
+                entry['expires'], entry['etag'], entry['last_modified'])
+
+
+class ResponseCache(object):
+    """Cache of GET responses with per endpoint TTLs"""
+
+    def __init__(self, ttl=DEFAULT_TTL, ttls=None,
+            max_entries=DEFAULT_MAX_ENTRIES, backend=None):
+        """
+        ttl is the default time to live in seconds, and ttls overrides it per
+        endpoint name (i.e. {'sites': 3600}). A None TTL disables caching.
+        Entries are kept in memory unless another backend is given.
+        """
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.backend = backend if backend is not None else \
+            MemoryBackend(max_entries)
+
+    def ttl_for(self, path):
+        """Time to live for the given path, according to its endpoint"""
+        endpoint = path.strip('/').split('/', 1)[0]
+        return self.ttls.get(endpoint, self.ttl)
+
+    def key(self, url, params, headers):
+        """Key of a request: url, sorted params and site/lang/token headers"""
+        parts = [url]
+        parts.extend(u'{0}={1}'.format(k, v)
+                for k, v in sorted((params or {}).items()))
+        parts.extend(u'{0}:{1}'.format(h, headers.get(h, ''))
+                for h in VARY_HEADERS)
+        # Hashed, as params and headers carry the client secret or token
+        return hashlib.sha1(u'\n'.join(parts).encode('utf8')).hexdigest()
+
+    def lookup(self, key):
+        """Returns the cached entry, fresh or not, if any"""
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        if isinstance(value, CacheEntry):
+            # Kept as is by in-process backends, copied so it can be updated
+            return value.copy()
+        try:
+            return CacheEntry.loads(value)
+        except (ValueError, KeyError, zlib.error) as e:
+            log.warning(u'Dropping unreadable cache entry %s: %s', key, e)
+            self.backend.delete(key)
+            return None
+
+    def conditional_headers(self, entry, headers):
+        """Adds the validators of a stale entry to the request headers"""
+        if entry is None or not (entry.etag or entry.last_modified):
+            return headers
+        headers = headers.copy()
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def store(self, key, ttl, result, entry=None):
+        """
+        Caches a network helper result and returns the one to use, which is
+        the cached one if the server answered 304 Not Modified
+        """
+        if result.get('not_modified') and entry is not None:
+            entry.expires = time.time() + ttl
+            self._set(key, entry)
+            return entry.result()
+
+        headers = result['headers']
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return result
+        self._set(key, CacheEntry(headers, result['data'], time.time() + ttl,
+                headers.get('ETag'), headers.get('Last-Modified')))
+        return result
+
+    def _set(self, key, entry):
+        """Stores an entry, serialized unless the backend keeps objects"""
+        if getattr(self.backend, 'serialized', True):
+            self.backend.set(key, entry.dumps())
+        else:
+            self.backend.set(key, entry.copy())
+
+    def invalidate(self, key=None):
+        """Drops an entry, or every entry if no key is given"""
+        if key is None:
+            self.backend.clear()
+        else:
+            self.backend.delete(key)
+
+    def close(self):
+        """Releases the files and connections held by the backend"""
+        # Backends predating close don't need to implement it
+        close = getattr(self.backend, 'close', None)
+        if close is not None:
+            close()
+
+
+class CacheBackend(object):
+    """
+    Storage of serialized cache entries. Keys are strings and values bytes,
+    so anything able to store them (i.e. Redis) can be plugged in.
+    """
+    # Whether values are bytes, or CacheEntry objects kept as they are
+    serialized = True
+
+    def get(self, key):
+        """Returns the stored value or None"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Releases whatever the storage holds, nothing by default"""
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU storage, keeping CacheEntry objects so hits are neither
+    decompressed nor parsed
+    """
+    serialized = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    LRU storage in a SQLite file, which can be shared by several processes
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, timeout=10):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                check_same_thread=False, isolation_level=None)
+        with self._lock:
+            # Readers don't block the writer (nor the other way round)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                    'key TEXT PRIMARY KEY, value BLOB, accessed REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                    'ON responses (accessed)')
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                    'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM responses WHERE key = ?',
+                    (key, )).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?',
+                    (time.time(), key))
+            return bytes(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('INSERT OR REPLACE INTO responses '
+                        '(key, value, accessed) VALUES (?, ?, ?)',
+                        (key, sqlite3.Binary(value), time.time()))
+                self._db.execute('DELETE FROM responses WHERE key IN ('
+                        'SELECT key FROM responses ORDER BY accessed DESC '
+                        'LIMIT -1 OFFSET ?)', (self.max_entries, ))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key, ))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MmapBackend(CacheBackend):
+    """
+    Append-only storage in a memory-mapped file, which can be shared by
+    several processes. Every process keeps an index of the records in the
+    file, and reads the ones appended by others as the file grows. Once the
+    file exceeds max_size it gets compacted, dropping overwritten records and
+    expired responses, and then evicting the oldest written ones.
+
+    Each record is the key and value lengths followed by both of them.
+    Deletions are recorded as values of length DELETED.
+    """
+    RECORD_HEADER = struct.Struct('>II')
+    DELETED = 0xffffffff
+
+    def __init__(self, path, max_size=DEFAULT_MAX_FILE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._lock_file = open(path + '.lock', 'a+b')
+        self._file = None
+        self._map = None
+        self._inode = None
+        self._size = 0
+        self._index = {}
+        with self._lock, self._file_lock(exclusive=True):
+            open(path, 'a+b').close()
+            self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def _file_lock(self, exclusive=False):
+        return _FileLock(self._lock_file, exclusive)
+
+    def _reopen(self):
+        """Reopens the file if it was replaced by a compaction"""
+        if self._file is not None and \
+                os.stat(self.path).st_ino == self._inode:
+            return
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'a+b')
+        self._map = None
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._size = 0
+        self._index = {}
+
+    def _refresh(self):
+        """Indexes the records appended since the last refresh"""
+        self._reopen()
+        size = os.fstat(self._file.fileno()).st_size
+        if size == self._size:
+            return
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), size,
+                access=mmap.ACCESS_READ)
+        offset = self._size
+        while offset + self.RECORD_HEADER.size <= size:
+            key_length, value_length = \
+                self.RECORD_HEADER.unpack_from(self._map, offset)
+            start = offset + self.RECORD_HEADER.size
+            end = start + key_length
+            if value_length != self.DELETED:
+                end += value_length
+            if end > size:
+                # Truncated record, i.e. a writer died half way
+                break
+            key = self._map[start:start + key_length].decode('utf8')
+            start += key_length
+            if value_length == self.DELETED:
+                self._index.pop(key, None)
+                offset = start
+            else:
+                self._index[key] = (start, value_length)
+                offset = start + value_length
+        self._size = offset
+
+    def get(self, key):
+        with self._lock, self._file_lock():
+            self._refresh()
+            location = self._index.get(key)
+            if location is None:
+                return None
+            start, length = location
+            return self._map[start:start + length]
+
+    def set(self, key, value):
+        self._append(key, value)
+
+    def delete(self, key):
+        self._append(key, None)
+
+    def _append(self, key, value):
+        key = key.encode('utf8')
+        if value is None:
+            record = self.RECORD_HEADER.pack(len(key), self.DELETED) + key
+        else:
+            record = self.RECORD_HEADER.pack(len(key), len(value)) + key + value
+        with self._lock, self._file_lock(exclusive=True):
+            self._reopen()
+            if self._size + len(record) > self.max_size:
+                self._compact()
+            self._file.write(record)
+            self._file.flush()
+            self._refresh()
+
+    def _compact(self):
+        """
+        Rewrites the file with the live records only. Expired responses are
+        dropped, and then the oldest written ones until the file is under
+        half max_size, so it isn't compacted again on every write.
+        """
+        self._refresh()
+        now = time.time()
+        records = []
+        size = 0
+        # In the order they were written
+        for key, (start, length) in sorted(self._index.items(),
+                key=lambda item: item[1][0]):
+            value = self._map[start:start + length]
+            if _expires(value) <= now:
+                continue
+            key = key.encode('utf8')
+            records.append((key, value))
+            size += self.RECORD_HEADER.size + len(key) + len(value)
+        evicted = 0
+        while evicted < len(records) and size > self.max_size // 2:
+            key, value = records[evicted]
+            size -= self.RECORD_HEADER.size + len(key) + len(value)
+            evicted += 1
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'wb') as tmp:
+            for key, value in records[evicted:]:
+                tmp.write(self.RECORD_HEADER.pack(len(key), len(value)))
+                tmp.write(key)
+                tmp.write(value)
+        os.rename(tmp_path, self.path)
+        self._reopen()
+        self._refresh()
+
+    def clear(self):
+        with self._lock, self._file_lock(exclusive=True):
+            tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+            open(tmp_path, 'wb').close()
+            os.rename(tmp_path, self.path)
+            self._reopen()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._file.close()
+            self._lock_file.close()
+
+
+def _expires(value):
+    """
+    Expiration time of a serialized CacheEntry, never for values that aren't
+    one
+    """
+    try:
+        return json.loads(zlib.decompress(value).decode('utf8'))['expires']
+    except (ValueError, KeyError, TypeError, zlib.error):
+        return float('inf')
+
+
+class _FileLock(object):
+    """Advisory lock on a file shared by several processes"""
+
+    def __init__(self, lock_file, exclusive=False):
+        self.lock_file = lock_file
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.lock_file.fileno(),
+                    fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Request coalescing
+
+Concurrent identical GETs (same url, params, site, lang and token) share a
+single request in flight, and every caller gets its result or exception.
+Traffic spikes on a popular event turn into one request per event:
+
+    client = Ticketbis(access_token=TOKEN, coalesce=True)
+    # Called by many workers at once
+    client.events(event_id)
+
+Callers of a shared request get the very same response objects, which they
+shouldn't modify.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import threading
+
+from ticketbis.cache import VARY_HEADERS
+
+# Request headers that make otherwise identical requests different, the
+# same ones the cache keys responses by
+COALESCE_HEADERS = VARY_HEADERS
+
+
+def request_key(url, params, headers):
+    """Identifies a GET among the requests in flight"""
+    # Values as sent, so unhashable ones (i.e. lists) can be part of it
+    return (url, tuple(sorted((k, u'{0}'.format(v))
+            for k, v in (params or {}).items())),
+            tuple(headers.get(h) for h in COALESCE_HEADERS))
+
+
+class _Call(object):
+    """Outcome of a call in flight, set once done is"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Runs one call per key at a time, sharing its outcome among threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        """Calls in flight"""
+        return len(self._calls)
+
+    def do(self, key, fn, *args):
+        """
+        Returns fn(*args), or the result of the call with the same key
+        already in flight, along with whether it was shared. Exceptions are
+        shared as well.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(threading.Event())
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Compressed transfers
+
+With compression, clients ask for brotli (when the brotli library is
+installed) or gzip responses, which requests and aiohttp decompress as they
+are read, streamed listings included. Bodies of writes of at least
+compress_min_size bytes are sent gzipped:
+
+    client = Ticketbis(access_token=TOKEN, compression=True,
+            compress_min_size=DEFAULT_COMPRESS_MIN_SIZE)
+
+An explicit Accept-Encoding can be given instead, i.e. compression='gzip',
+or 'identity' to have responses sent uncompressed.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import zlib
+
+# Smaller bodies rarely compress enough to pay for it
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+# zlib's default, a good trade-off between ratio and speed
+DEFAULT_COMPRESS_LEVEL = 6
+
+# Response encodings understood when the compression libraries are there
+_accept_encoding = None
+
+
+def brotli_module():
+    """brotli or its cffi flavour (as used by urllib3), None if missing"""
+    try:
+        import brotli
+    except ImportError:
+        try:
+            import brotlicffi as brotli
+        except ImportError:
+            return None
+    return brotli
+
+
+def accept_encoding():
+    """Accept-Encoding preferring brotli if it can be decoded"""
+    global _accept_encoding
+    if _accept_encoding is None:
+        _accept_encoding = 'br, gzip' if brotli_module() is not None \
+            else 'gzip'
+    return _accept_encoding
+
+
+def gzip_compress(data, level=DEFAULT_COMPRESS_LEVEL):
+    """Gzip member of data, as gzip.compress (not available on Python 2)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, encoding):
+    """Decompresses a whole body given its Content-Encoding"""
+    if encoding == 'gzip':
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompress(data)
+    if encoding == 'br':
+        return brotli_module().decompress(data)
+    return data
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Per-client instrumentation
+
+Timers for every phase of a request, counters for retries, cache hits and
+rate limit waits, and histograms per endpoint name (events, venues, multi,
+...). Nothing is measured unless a Metrics instance is attached:
+
+    metrics = Metrics(exporters=[StatsdExporter(('localhost', 8125))])
+    metrics.before_request.append(lambda info: log.info(info.url))
+    client = Ticketbis(access_token=TOKEN, metrics=metrics)
+    client.events()
+    print(metrics.prometheus())
+
+Request phases, in seconds: dns, connect, tls, first_byte, body and decode.
+Connection phases are only measured for new connections, and the asyncio
+client reports TLS handshakes as part of connect. DNS lookups answered by
+the aiohttp cache aren't timed. Streamed
+bodies are read after the request is recorded, so they aren't timed.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import socket
+import threading
+import time
+
+from ticketbis import _ContextValue
+
+# Monotonic clock when available
+clock = getattr(time, 'perf_counter', time.time)
+
+PHASES = ('dns', 'connect', 'tls', 'first_byte', 'body', 'decode')
+
+# Upper bounds (in seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# Timings of the request being made by the current thread or coroutine
+_active_timings = _ContextValue('ticketbis_timings')
+
+
+def active_timings():
+    """Phase timings of the request in progress, None if not instrumented"""
+    return _active_timings.get()
+
+
+class Histogram(object):
+    """Cumulative histogram of observed values"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RequestInfo(object):
+    """
+    Request attempt given to the hooks. Before request hooks may change its
+    headers, after request hooks get its result or error as well.
+    """
+    __slots__ = ('method', 'url', 'endpoint', 'attempt', 'headers',
+            'timings', 'started', 'duration', 'result', 'error', '_token')
+
+    def __init__(self, method, url, endpoint, attempt, headers):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.attempt = attempt
+        self.headers = headers
+        self.timings = {}
+        self.started = None
+        self.duration = None
+        self.result = None
+        self.error = None
+        self._token = None
+
+
+class Metrics(object):
+    """Hooks, counters and histograms of the requests made by a client"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, exporters=None,
+            namespace='ticketbis'):
+        """
+        exporters are callables pushed every measurement as (kind, name,
+        value, endpoint), kind being COUNTER or HISTOGRAM (see
+        StatsdExporter). Metrics are named after namespace when exported.
+        """
+        self.buckets = buckets
+        self.exporters = list(exporters or [])
+        self.namespace = namespace
+        # Callables given the RequestInfo before and after every attempt
+        self.before_request = []
+        self.after_request = []
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, endpoint=None, value=1):
+        with self._lock:
+            key = (name, endpoint)
+            self.counters[key] = self.counters.get(key, 0) + value
+        for exporter in self.exporters:
+            exporter(COUNTER, name, value, endpoint)
+
+    def observe(self, name, value, endpoint=None):
+        with self._lock:
+            histogram = self.histograms.get((name, endpoint))
+            if histogram is None:
+                histogram = self.histograms[(name, endpoint)] = \
+                    Histogram(self.buckets)
+            histogram.observe(value)
+        for exporter in self.exporters:
+            exporter(HISTOGRAM, name, value, endpoint)
+
+    def counter(self, name, endpoint=None):
+        """Value of a counter, summed over every endpoint if none is given"""
+        if endpoint is not None:
+            return self.counters.get((name, endpoint), 0)
+        return sum(v for (n, _), v in self.counters.items() if n == name)
+
+    def histogram(self, name, endpoint):
+        return self.histograms.get((name, endpoint))
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def request_started(self, method, url, endpoint, attempt, headers=None):
+        """Runs the before request hooks and starts timing an attempt"""
+        info = RequestInfo(method, url, endpoint, attempt, headers)
+        for hook in self.before_request:
+            hook(info)
+        info._token = _active_timings.set(info.timings)
+        info.started = clock()
+        return info
+
+    def stop_timing(self, info):
+        """
+        Stops timing an attempt, if not done yet. Called whatever the attempt
+        raised, so its timings don't outlive it.
+        """
+        if info._token is not None:
+            _active_timings.reset(info._token)
+            info._token = None
+
+    def request_finished(self, info, result=None, error=None):
+        """Records a finished attempt and runs the after request hooks"""
+        info.duration = clock() - info.started
+        self.stop_timing(info)
+        info.result, info.error = result, error
+        timings = info.timings
+        if 'first_byte' in timings and 'body' not in timings:
+            # Whatever happened after the headers arrived, but decoding
+            timings['body'] = max(0.0, info.duration - sum(
+                timings.get(phase, 0) for phase in PHASES))
+
+        endpoint = info.endpoint
+        self.increment('requests', endpoint)
+        if error is not None:
+            self.increment('errors', endpoint)
+        self.observe('request_seconds', info.duration, endpoint)
+        for phase in PHASES:
+            if phase in timings:
+                self.observe(phase + '_seconds', timings[phase], endpoint)
+        for hook in self.after_request:
+            hook(info)
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items(), key=_sort_key)
+            histograms = sorted(((key, (h.buckets, list(h.counts), h.sum,
+                    h.count)) for key, h in self.histograms.items()),
+                    key=_sort_key)
+        typed = set()
+        for (name, endpoint), value in counters:
+            metric = '{0}_{1}_total'.format(self.namespace, name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append('# TYPE {0} counter'.format(metric))
+            lines.append('{0}{1} {2}'.format(metric, _labels(endpoint),
+                    value))
+        for (name, endpoint), (buckets, counts, total, count) in histograms:
+            metric = '{0}_{1}'.format(self.namespace, name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append('# TYPE {0} histogram'.format(metric))
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append('{0}_bucket{1} {2}'.format(metric,
+                        _labels(endpoint, le=repr(float(bound))), bucket_count))
+            lines.append('{0}_bucket{1} {2}'.format(metric,
+                    _labels(endpoint, le='+Inf'), count))
+            lines.append('{0}_sum{1} {2!r}'.format(metric, _labels(endpoint),
+                    total))
+            lines.append('{0}_count{1} {2}'.format(metric, _labels(endpoint),
+                    count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdExporter(object):
+    """Pushes every measurement to StatsD over UDP, timers in milliseconds"""
+
+    def __init__(self, address=('localhost', 8125), prefix='ticketbis',
+            send=None):
+        """send, if given, is called with every line instead of sending it"""
+        self.address = address
+        self.prefix = prefix
+        self._send = send
+        self._socket = None
+        if send is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, kind, name, value, endpoint):
+        if name.endswith('_seconds'):
+            name = name[:-len('_seconds')]
+        parts = [p for p in (self.prefix, endpoint, name) if p]
+        if kind == COUNTER:
+            line = '{0}:{1}|c'.format('.'.join(parts), value)
+        else:
+            line = '{0}:{1:.3f}|ms'.format('.'.join(parts), value * 1000)
+        if self._send is not None:
+            self._send(line)
+            return
+        try:
+            self._socket.sendto(line.encode('ascii'), self.address)
+        except socket.error as e:
+            log.debug(u'Could not send %s to StatsD: %s', line, e)
+
+
+def _sort_key(item):
+    (name, endpoint), _ = item
+    return name, endpoint or ''
+
+
+def _labels(endpoint, **labels):
+    if endpoint is not None:
+        labels['endpoint'] = endpoint
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, v)
+            for k, v in sorted(labels.items())) + '}'
+
+
+# Moved to ticketbis.adapters, which imports requests. Only found here on
+# Python 3.7+, as importing it right away would import requests.
+def __getattr__(name):
+    if name == 'InstrumentedAdapter':
+        from ticketbis.adapters import InstrumentedAdapter
+        return InstrumentedAdapter
+    raise AttributeError(
+            "module 'ticketbis.metrics' has no attribute '{0}'".format(name))
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Compact typed results
+
+Opt-in alternative to the plain dicts returned by the endpoints (see the
+models argument of Ticketbis). Known fields live in __slots__ instead of a
+per object dict, repeated strings such as site, city or currency are
+interned, and dates or nested objects are only parsed on first access:
+
+    client = Ticketbis(access_token=TOKEN, models=True)
+    event = client.events(1)
+    event.start_date  # datetime, parsed now
+    event['name']     # dict-like access still works
+    event.raw         # the original dict
+"""
+from datetime import datetime
+
+try:
+    string_types = basestring
+    from __builtin__ import intern
+except NameError:
+    string_types = str
+    from sys import intern
+
+# Formats tried, in order, when parsing dates
+DATE_FORMATS = (
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+)
+
+# Python 3.7+
+_fromisoformat = getattr(datetime, 'fromisoformat', None)
+
+
+def parse_date(value):
+    """Parses API dates into datetimes, leaving unknown formats untouched"""
+    if not isinstance(value, string_types):
+        return value
+    # Offsets are dropped, dates are given in the site's timezone
+    if len(value) > 19 and value[19] in '+-':
+        value = value[:19]
+    if len(value) in (19, 20) and value[10] in 'T ':
+        # Fast path for the usual format, strptime is slow
+        try:
+            if _fromisoformat is not None:
+                return _fromisoformat(value[:19])
+            return datetime(int(value[0:4]), int(value[5:7]),
+                    int(value[8:10]), int(value[11:13]), int(value[14:16]),
+                    int(value[17:19]))
+        except ValueError:
+            pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return value
+
+
+class Field(object):
+    """
+    Model attribute holding the raw value of a key in its own slot. Fields
+    with a parser keep their parsed value in another slot once accessed.
+    """
+
+    def __init__(self, key=None, parse=None, interned=False):
+        self.key = key
+        self.parse = parse
+        self.interned = interned
+        # Set up by ModelMeta
+        self.name = None
+        self.raw_slot = None
+        self.parsed_slot = None
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        try:
+            return self.parsed_slot.__get__(obj, cls)
+        except AttributeError:
+            pass
+        value = self.raw_slot.__get__(obj, cls)
+        if value is not None:
+            value = self.parse(value)
+        self.parsed_slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        raise AttributeError('{0} is read-only'.format(self.name))
+
+    def __delete__(self, obj):
+        raise AttributeError('{0} is read-only'.format(self.name))
+
+
+class ModelMeta(type):
+    """Turns the Field attributes of a model into slots"""
+
+    def __new__(mcs, name, bases, attrs):
+        fields = []
+        slots = list(attrs.get('__slots__', ()))
+        for attr, field in sorted(attrs.items()):
+            if isinstance(field, Field):
+                field.name = attr
+                field.key = field.key or attr
+                if field.parse is None:
+                    # Plain slot, accessed at native speed
+                    del attrs[attr]
+                    slots.append(attr)
+                else:
+                    slots.extend(('_raw_' + attr, '_parsed_' + attr))
+                fields.append(field)
+        attrs['__slots__'] = tuple(slots)
+        cls = super(ModelMeta, mcs).__new__(mcs, name, bases, attrs)
+        for field in fields:
+            if field.parse is None:
+                field.raw_slot = cls.__dict__[field.name]
+            else:
+                field.raw_slot = cls.__dict__['_raw_' + field.name]
+                field.parsed_slot = cls.__dict__['_parsed_' + field.name]
+        inherited = tuple(field for base in bases
+                for field in getattr(base, '_fields', ()))
+        cls._fields = inherited + tuple(fields)
+        cls._field_names = frozenset(field.name for field in cls._fields)
+        cls._fields_by_key = dict((f.key, f) for f in cls._fields)
+        return cls
+
+
+# Python 2 and 3 compatible way of using a metaclass
+_ModelBase = ModelMeta('_ModelBase', (object, ), {'__slots__': ()})
+
+
+class Model(_ModelBase):
+    """Typed API result, built from the decoded JSON dict"""
+    __slots__ = ('_extra', )
+
+    def __init__(self, data):
+        fields_by_key = self._fields_by_key
+        extra = None
+        for key, value in data.items():
+            field = fields_by_key.get(key)
+            if field is None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                continue
+            if field.interned and isinstance(value, str):
+                value = intern(value)
+            field.raw_slot.__set__(self, value)
+        # Keys without a field are kept as they came
+        self._extra = extra
+
+    @property
+    def raw(self):
+        """The original dict"""
+        raw = dict(self._extra or {})
+        for field in self._fields:
+            try:
+                raw[field.key] = field.raw_slot.__get__(self)
+            except AttributeError:
+                pass
+        return raw
+
+    def __getattr__(self, name):
+        # Only called for keys without a field, or fields not in the data
+        if name in self._field_names:
+            return None
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._extra[name]
+        except (KeyError, TypeError):
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        field = self._fields_by_key.get(key)
+        if field is not None:
+            try:
+                return field.raw_slot.__get__(self)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            other = other.raw
+        return self.raw == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.raw
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                self.get('id', '?'))
+
+
+def model_of(cls):
+    """Parser turning nested dicts into models of cls"""
+    def parse(value):
+        if isinstance(value, dict):
+            return cls(value)
+        if isinstance(value, list):
+            return [cls(v) if isinstance(v, dict) else v for v in value]
+        return value
+    return parse
+
+
+class Site(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field(interned=True)
+    url = Field(interned=True)
+    lang = Field(interned=True)
+    currency = Field(interned=True)
+    country = Field(interned=True)
+
+
+class City(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field(interned=True)
+    country = Field(interned=True)
+    site = Field(interned=True)
+
+
+class Category(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field()
+    description = Field()
+    parent_id = Field()
+    site = Field(interned=True)
+
+
+class Venue(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field()
+    address = Field()
+    city = Field(interned=True)
+    country = Field(interned=True)
+    site = Field(interned=True)
+
+
+class Schema(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field()
+    venue_id = Field()
+    site = Field(interned=True)
+
+
+class SectionGroup(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field()
+    schema_id = Field()
+    event_id = Field()
+    min_price = Field()
+    max_price = Field()
+    currency = Field(interned=True)
+    site = Field(interned=True)
+
+
+class Event(Model):
+    __slots__ = ()
+    id = Field()
+    name = Field()
+    description = Field()
+    start_date = Field(parse=parse_date)
+    end_date = Field(parse=parse_date)
+    category_id = Field()
+    venue_id = Field()
+    category = Field(parse=model_of(Category))
+    venue = Field(parse=model_of(Venue))
+    city = Field(interned=True)
+    country = Field(interned=True)
+    currency = Field(interned=True)
+    site = Field(interned=True)
+    min_price = Field()
+    url = Field()
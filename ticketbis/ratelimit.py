@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Client-side rate limiting
+
+A token bucket seeded and re-synced from the X-RateLimit-Limit and
+X-RateLimit-Remaining headers of every response, so callers are slowed down
+before the API starts answering rate_limit_exceeded. Once a response tells
+no request is left, none is allowed until the API window resets, as told by
+Retry-After or X-RateLimit-Reset (a whole window later if neither is sent):
+
+    limiter = RateLimiter(window=3600)
+    client = Ticketbis(access_token=TOKEN, rate_limiter=limiter)
+
+Callers block until a request is allowed, unless they rather fail fast:
+
+    with limiter.blocking(False):
+        client.events()  # raises RateLimitExceeded instead of waiting
+"""
+import logging; log = logging.getLogger(__name__)
+
+import threading
+import time
+from contextlib import contextmanager
+
+from ticketbis import RateLimitExceeded, _ContextValue
+from ticketbis.retry import retry_after
+
+# Default length in seconds of the window X-RateLimit-Limit applies to
+DEFAULT_WINDOW = 3600
+
+
+class RateLimiter(object):
+    """Token bucket throttling requests across threads and coroutines"""
+
+    def __init__(self, limit=None, window=DEFAULT_WINDOW, block=True,
+            timeout=None):
+        """
+        limit is the number of requests allowed per window (in seconds). If
+        not given, it is learnt from the first response and nothing gets
+        throttled until then. Unless block is False, callers wait for up to
+        timeout seconds (forever if None) before RateLimitExceeded is raised.
+        """
+        self.window = window
+        self.block = block
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._blocking = _ContextValue('ticketbis_rate_limit')
+        self._limit = None
+        self._tokens = 0.0
+        self._updated = time.time()
+        # Time the API window resets at once no request is left, nothing is
+        # refilled until then
+        self._reset = None
+        if limit:
+            self._limit = int(limit)
+            self._tokens = float(limit)
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def tokens(self):
+        """Requests that can be made right now"""
+        with self._lock:
+            self._refill(time.time())
+            return self._tokens
+
+    def _refill(self, now):
+        if self._reset is not None:
+            if now < self._reset:
+                self._updated = now
+                return
+            # A new window, with its limit of requests
+            self._tokens = min(float(self._limit), self._tokens + self._limit)
+            self._updated = self._reset
+            self._reset = None
+        if self._limit:
+            rate = self._limit / float(self.window)
+            self._tokens = min(float(self._limit),
+                    self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    @contextmanager
+    def blocking(self, block=True, timeout=None):
+        """Overrides whether callers wait within the context"""
+        token = self._blocking.set((block, timeout))
+        try:
+            yield self
+        finally:
+            self._blocking.reset(token)
+
+    def reserve(self):
+        """
+        Takes a token, returning the seconds the caller must wait before
+        making its request. Raises RateLimitExceeded if the caller doesn't
+        block, or it would have to wait longer than its timeout.
+        """
+        block, timeout = self._blocking.get() or (self.block, self.timeout)
+        with self._lock:
+            if not self._limit:
+                return 0
+            self._refill(time.time())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            # Tokens go below zero as waiting callers reserve them
+            wait = self._wait(time.time())
+            if not block or (timeout is not None and wait > timeout):
+                raise RateLimitExceeded(u'Client-side rate limit reached, '
+                        u'next request allowed in {0:.2f}s'.format(wait))
+            self._tokens -= 1
+            return wait
+
+    def _wait(self, now):
+        """Seconds until there will be a token, given there's none now"""
+        tokens, start = self._tokens, now
+        if self._reset is not None:
+            tokens = min(float(self._limit), tokens + self._limit)
+            start = self._reset
+        rate = self._limit / float(self.window)
+        return start - now + max(0.0, 1 - tokens) / rate
+
+    def acquire(self):
+        """Waits until a request is allowed, returning the seconds waited"""
+        wait = self.reserve()
+        if wait > 0:
+            log.debug(u'Rate limited, waiting %.2fs', wait)
+            time.sleep(wait)
+        return wait
+
+    def update(self, headers):
+        """Re-syncs the bucket with the rate limit headers of a response"""
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        if limit is None or remaining is None:
+            return
+        try:
+            limit, remaining = int(limit), int(remaining)
+        except ValueError:
+            return
+        reset = _reset_in(headers) if remaining <= 0 else None
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            # Callers already waiting keep their reservations
+            backlog = max(0.0, -self._tokens)
+            self._limit = limit
+            self._tokens = min(remaining, limit) - backlog
+            if remaining > 0:
+                self._reset = None
+            else:
+                self._reset = now + (self.window if reset is None else reset)
+
+
+def _reset_in(headers):
+    """
+    Seconds until the API window resets according to Retry-After or
+    X-RateLimit-Reset (a delay, or a time since the epoch), None if unknown
+    """
+    delay = retry_after(headers)
+    if delay is not None:
+        return delay
+    try:
+        reset = float(headers.get('X-RateLimit-Reset'))
+    except (TypeError, ValueError):
+        return None
+    # Delays are way shorter than a year
+    if reset > 365 * 24 * 3600:
+        reset -= time.time()
+    return max(0.0, reset)
+
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Retry policies for failed requests
+
+Failed requests are retried with exponential backoff and full jitter, so
+workers hitting the same hiccup don't come back in lockstep. A Retry-After
+header in the failed response takes precedence over the backoff, and errors
+asking to wait longer than max_backoff are raised right away:
+
+    policy = RetryPolicy(max_attempts=5, deadline=30,
+            rules={ServerError: 10, RateLimitExceeded: 0})
+    client = Ticketbis(access_token=TOKEN, retry_policy=policy)
+"""
+import logging; log = logging.getLogger(__name__)
+
+import random
+import time
+
+from ticketbis import (NUM_REQUEST_RETRIES, RateLimitExceeded, InvalidAuth,
+        ParamError, EndpointError, NotAuthorized, Deprecated,
+        PreconditionFailed)
+
+# Some errors don't bear repeating
+NON_RETRYABLE_ERRORS = (InvalidAuth, ParamError, EndpointError, NotAuthorized,
+        Deprecated, PreconditionFailed)
+
+# Methods that can be repeated without side effects
+IDEMPOTENT_METHODS = ('GET', 'PUT')
+
+# Errors telling the request was rejected before being processed, which
+# makes retrying any method safe
+REJECTED_ERRORS = (RateLimitExceeded, )
+
+
+class RetryPolicy(object):
+    """Decides whether, and when, failed requests are retried"""
+
+    def __init__(self, max_attempts=NUM_REQUEST_RETRIES, backoff=0.5,
+            backoff_factor=2, max_backoff=30, jitter=True, deadline=None,
+            rules=None, retry_methods=IDEMPOTENT_METHODS):
+        """
+        Requests are made up to max_attempts times, waiting backoff *
+        backoff_factor ** retry seconds (up to max_backoff) between them, or
+        a random time up to that if jitter is set, or as long as the
+        Retry-After of the error. Errors with a Retry-After longer than
+        max_backoff aren't retried, nor any past deadline seconds since the
+        first attempt.
+
+        rules maps exception classes to their own max attempts, 0 meaning
+        they are never retried (see NON_RETRYABLE_ERRORS). Only
+        retry_methods are retried, unless the error tells the request was
+        rejected without being processed (i.e. RateLimitExceeded).
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.rules = dict((cls, 0) for cls in NON_RETRYABLE_ERRORS)
+        self.rules.update(rules or {})
+        self.retry_methods = retry_methods
+
+    def max_attempts_for(self, exc):
+        """Max attempts for an exception, according to its class rules"""
+        for cls in type(exc).__mro__:
+            if cls in self.rules:
+                return self.rules[cls]
+        return self.max_attempts
+
+    def backoff_for(self, attempt):
+        """Seconds to wait after the given (1-based) failed attempt"""
+        backoff = min(self.max_backoff,
+                self.backoff * self.backoff_factor ** (attempt - 1))
+        if self.jitter:
+            return random.uniform(0, backoff)
+        return backoff
+
+    def delay(self, method, attempt, exc, started):
+        """
+        Seconds to wait before retrying the failed attempt, or None if the
+        exception should be raised
+        """
+        if method not in self.retry_methods and \
+                not isinstance(exc, REJECTED_ERRORS):
+            return None
+        if attempt >= self.max_attempts_for(exc):
+            return None
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = self.backoff_for(attempt)
+        elif delay > self.max_backoff:
+            # i.e. the rest of an hourly rate limit window
+            log.debug(u'Not retrying %s, asked to wait %.2fs: %s', method,
+                    delay, exc)
+            return None
+        if self.deadline is not None and \
+                time.time() + delay - started > self.deadline:
+            return None
+        log.debug(u'Retrying %s in %.2fs after attempt %d failed: %s',
+                method, delay, attempt, exc)
+        return delay
+
+
+def _retry_after(exc):
+    """Seconds to wait according to the Retry-After header, if any"""
+    return retry_after(exc.headers or {})
+
+
+def retry_after(headers):
+    """
+    Seconds to wait according to the Retry-After header of a response, if
+    any
+    """
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # HTTP dates are rare, email.utils is slow to import
+        from email.utils import mktime_tz, parsedate_tz
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0.0, mktime_tz(date) - time.time())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Local catalogue store
+
+Events, categories, venues, cities, schemas, section groups and sites kept in
+SQLite (in memory by default), indexed by category, venue, city, site and
+start date, so listings can be filtered without calling the API:
+
+    store = CatalogueStore()
+    client = Ticketbis(access_token=TOKEN, catalogue=store)
+    client.categories.events(category_id, auto_pagination=True)
+    events = store.events(category_id=category_id, venue_id=venue_id,
+            start=datetime(2016, 3, 1), end=datetime(2016, 3, 8))
+
+Every endpoint result of a client given the store is upserted into it. Items
+can be loaded and removed directly as well, i.e. from an incremental sync:
+
+    store.upsert('events', sync.items('events'))
+    store.delete('events', result.deleted)
+
+Equality filters take a value or a list of values. Ranges on start_date
+include start and exclude end, given as datetimes, dates or API strings.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import sqlite3
+import threading
+from datetime import date, datetime
+
+import six
+
+from ticketbis import json
+from ticketbis.models import (Category, City, Event, Schema, SectionGroup,
+        Site, Venue)
+
+# Resource of the items returned with each ticketbis.models class
+MODEL_RESOURCES = {
+    Event: 'events',
+    Category: 'categories',
+    Venue: 'venues',
+    City: 'cities',
+    Schema: 'schemas',
+    SectionGroup: 'section_groups',
+    Site: 'sites',
+}
+
+# Item keys indexed by the store, besides id
+INDEXED_FIELDS = ('category_id', 'venue_id', 'city', 'site', 'start_date')
+
+# Items of paginated listings upserted at once
+DEFAULT_UPSERT_BATCH = 100
+
+
+class CatalogueStore(object):
+    """Catalogue items indexed in SQLite, queried offline"""
+
+    def __init__(self, path=':memory:', models=False, timeout=10):
+        """
+        Items are kept in the SQLite file at path, in memory by default.
+        With models, queries return ticketbis.models instances instead of
+        dicts.
+        """
+        self.path = path
+        self.models = models
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                check_same_thread=False, isolation_level=None)
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS catalogue ('
+                    'resource TEXT, id TEXT, category_id TEXT, '
+                    'venue_id TEXT, city TEXT, site TEXT, start_date TEXT, '
+                    'data TEXT, PRIMARY KEY (resource, id))')
+            # Dates last, so equality plus a date range is a single index
+            # range scan, ordered by date
+            for field in INDEXED_FIELDS[:-1]:
+                self._db.execute('CREATE INDEX IF NOT EXISTS catalogue_{0} '
+                        'ON catalogue (resource, {0}, start_date)'.format(
+                        field))
+            self._db.execute('CREATE INDEX IF NOT EXISTS catalogue_start_date '
+                    'ON catalogue (resource, start_date)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM catalogue') \
+                .fetchone()[0]
+
+    def upsert(self, resource, items):
+        """
+        Inserts or replaces items (dicts or models, or a single one) by id,
+        in a single transaction. Items without an id are skipped. Returns
+        how many were stored.
+        """
+        if isinstance(items, dict) or hasattr(items, 'raw'):
+            items = [items]
+        rows = [_row(resource, getattr(item, 'raw', item)) for item in items]
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany('INSERT OR REPLACE INTO catalogue '
+                        '(resource, id, category_id, venue_id, city, site, '
+                        'start_date, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def apply(self, model, data):
+        """
+        Upserts the result of an endpoint, given the ticketbis.models class
+        of its items. Results of other endpoints are ignored.
+        """
+        resource = MODEL_RESOURCES.get(model)
+        if resource is not None and isinstance(data, (dict, list)):
+            self.upsert(resource, data)
+
+    def buffer(self, model, size=DEFAULT_UPSERT_BATCH):
+        """
+        Buffer of the items of a listing, applied every size items and once
+        flushed. None if the store doesn't keep items of model.
+        """
+        resource = MODEL_RESOURCES.get(model)
+        if resource is None:
+            return None
+        return _UpsertBuffer(self, resource, size)
+
+    def delete(self, resource, item_ids):
+        """Removes items by id"""
+        if isinstance(item_ids, (six.string_types, six.integer_types)):
+            item_ids = [item_ids]
+        with self._lock:
+            self._db.executemany('DELETE FROM catalogue '
+                    'WHERE resource = ? AND id = ?',
+                    [(resource, u'{0}'.format(i)) for i in item_ids])
+
+    def clear(self, resource=None):
+        """Removes every item, or those of a resource"""
+        with self._lock:
+            if resource is None:
+                self._db.execute('DELETE FROM catalogue')
+            else:
+                self._db.execute('DELETE FROM catalogue WHERE resource = ?',
+                        (resource, ))
+
+    def get(self, resource, item_id):
+        """Item by id, None if unknown"""
+        with self._lock:
+            row = self._db.execute('SELECT data FROM catalogue '
+                    'WHERE resource = ? AND id = ?',
+                    (resource, u'{0}'.format(item_id))).fetchone()
+        return None if row is None else self._item(resource, row[0])
+
+    def query(self, resource, category_id=None, venue_id=None, city=None,
+            site=None, start=None, end=None, limit=None, offset=0):
+        """
+        Items matching every filter given, ordered by start date then id
+        (the order they were stored in if undated)
+        """
+        where, args = self._where(resource, category_id, venue_id, city, site,
+                start, end)
+        sql = 'SELECT data FROM catalogue WHERE {0} ' \
+            'ORDER BY start_date, rowid'.format(where)
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            args += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [self._item(resource, row[0]) for row in rows]
+
+    def count(self, resource, category_id=None, venue_id=None, city=None,
+            site=None, start=None, end=None):
+        """Number of items matching every filter given"""
+        where, args = self._where(resource, category_id, venue_id, city, site,
+                start, end)
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM catalogue '
+                    'WHERE {0}'.format(where), args).fetchone()[0]
+
+    def events(self, **filters):
+        return self.query('events', **filters)
+
+    def categories(self, **filters):
+        return self.query('categories', **filters)
+
+    def venues(self, **filters):
+        return self.query('venues', **filters)
+
+    def cities(self, **filters):
+        return self.query('cities', **filters)
+
+    def schemas(self, **filters):
+        return self.query('schemas', **filters)
+
+    def section_groups(self, **filters):
+        return self.query('section_groups', **filters)
+
+    def _where(self, resource, category_id, venue_id, city, site, start, end):
+        conditions, args = ['resource = ?'], [resource]
+        for field, value in (('category_id', category_id),
+                ('venue_id', venue_id), ('city', city), ('site', site)):
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set,
+                frozenset)) else [value]
+            conditions.append('{0} IN ({1})'.format(field,
+                    ', '.join('?' * len(values))))
+            args.extend(_key(v) for v in values)
+        if start is not None:
+            conditions.append('start_date >= ?')
+            args.append(_date_key(start))
+        if end is not None:
+            conditions.append('start_date < ?')
+            args.append(_date_key(end))
+        return ' AND '.join(conditions), args
+
+    def _item(self, resource, data):
+        item = json.loads(data)
+        if self.models:
+            for model, model_resource in MODEL_RESOURCES.items():
+                if model_resource == resource:
+                    return model(item)
+        return item
+
+
+class _UpsertBuffer(object):
+    """Items of a listing upserted in batches"""
+
+    def __init__(self, store, resource, size):
+        self.store = store
+        self.resource = resource
+        self.size = size
+        self.items = []
+
+    def add(self, item):
+        self.items.append(item)
+        if len(self.items) >= self.size:
+            self.flush()
+
+    def flush(self):
+        items, self.items = self.items, []
+        if items:
+            self.store.upsert(self.resource, items)
+
+
+def _row(resource, item):
+    """Values of the catalogue table for an item, None if it has no id"""
+    if not isinstance(item, dict) or item.get('id') is None:
+        return None
+    category = item.get('category')
+    venue = item.get('venue')
+    category = category if isinstance(category, dict) else {}
+    venue = venue if isinstance(venue, dict) else {}
+    return (resource, _key(item['id']),
+            _key(item.get('category_id', category.get('id'))),
+            _key(item.get('venue_id', venue.get('id'))),
+            _key(item.get('city', venue.get('city'))),
+            _key(item.get('site')),
+            _date_key(item.get('start_date')),
+            json.dumps(item))
+
+
+def _key(value):
+    """Indexed values are compared as text"""
+    return None if value is None else u'{0}'.format(value)
+
+
+def _date_key(value):
+    """
+    Dates as sortable text in the site's timezone, i.e. 2016-03-01T21:00:00.
+    Dates without a time sort before any time of the day.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    value = u'{0}'.format(value)
+    # Offsets and fractions are dropped, as ticketbis.models.parse_date does
+    return value[:19].replace(' ', 'T')
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Incremental decoding of JSON arrays
+
+Listings are decoded item by item as their chunks arrive, so memory depends
+on the size of an item instead of the size of the page. Items are located by
+scanning the raw bytes, and decoded by whichever JSON library ticketbis
+loaded (ujson -> simplejson -> json).
+"""
+import re
+
+# Bytes that change the nesting level or the item being scanned
+_STRUCTURE = re.compile(br'[\[\]{}",]')
+_STRING_END = re.compile(br'["\\]')
+_WHITESPACE = b' \t\r\n'
+
+# Size of the chunks read from the network
+CHUNK_SIZE = 16 * 1024
+
+
+class JSONArrayDecoder(object):
+    """
+    Decodes the items of a JSON array fed in chunks of bytes. Other JSON
+    documents are buffered and decoded as a whole once finished.
+    """
+
+    def __init__(self, loads):
+        self.loads = loads
+        self._buffer = b''
+        self._pos = 0
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._is_array = None
+        self._finished = False
+
+    def feed(self, chunk):
+        """Returns the items completed by the chunk"""
+        self._buffer += chunk
+        if self._is_array is None:
+            stripped = self._buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                return []
+            self._is_array = stripped[:1] == b'['
+        if not self._is_array or self._finished:
+            return []
+        return self._scan()
+
+    def close(self):
+        """Returns the remaining items, failing if the document is truncated"""
+        if self._is_array is False:
+            data = self.loads(self._buffer)
+            return data if isinstance(data, list) else [data]
+        if not self._finished:
+            raise ValueError('Truncated JSON array')
+        return []
+
+    def _scan(self):
+        items = []
+        buf, pos = self._buffer, self._pos
+        while True:
+            if self._in_string:
+                match = _STRING_END.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                    break
+                if match.group() == b'\\':
+                    if match.end() >= len(buf):
+                        # The escaped character is yet to come
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURE.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            char, pos = match.group(), match.end()
+            if self._depth == 0:
+                # Opening bracket of the array
+                self._depth = 1
+                self._start = pos
+            elif char == b'"':
+                self._in_string = True
+            elif char in (b'[', b'{'):
+                self._depth += 1
+            elif char in (b']', b'}'):
+                self._depth -= 1
+                if self._depth == 0:
+                    item = buf[self._start:match.start()]
+                    if item.strip(_WHITESPACE):
+                        items.append(self.loads(item))
+                    self._finished = True
+                    break
+            elif char == b',' and self._depth == 1:
+                items.append(self.loads(buf[self._start:match.start()]))
+                # Drop what has been decoded already
+                buf, pos = buf[pos:], 0
+                self._start = 0
+        self._buffer, self._pos = buf, pos
+        return items
+
+
+def iter_json_items(chunks, loads):
+    """Yields the items of the JSON array streamed in chunks"""
+    decoder = JSONArrayDecoder(loads)
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+    for item in decoder.close():
+        yield item
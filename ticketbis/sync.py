@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Incremental catalogue sync
+
+Keeps a local snapshot of listings (events, venues, section groups...) in a
+SQLite file, along with a checkpoint per listing: the offset reached, the
+modification watermark and a content hash per id. Every page is committed
+along with its checkpoint, so a sync interrupted halfway resumes where it
+stopped, and each run reports only what was created, updated or deleted:
+
+    sync = CatalogueSync(client, '/var/lib/ticketbis/catalogue.db')
+    result = sync.events()
+    for event_id in result.created + result.updated:
+        event = sync.get('events', event_id)
+
+When the API can filter listings by modification date, give its param name
+and the item field it applies to, so later runs only fetch what changed:
+
+    sync = CatalogueSync(client, path, since_param='updated_since',
+            modified_field='updated_at')
+
+Otherwise every run lists everything again. Pair the client with a
+persistent ResponseCache to have unchanged pages answered with a 304.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import hashlib
+import json as _json
+import sqlite3
+import threading
+import zlib
+from collections import namedtuple
+
+from ticketbis import json
+
+# Items requested per page
+DEFAULT_PAGE_SIZE = 100
+
+# Outcome of syncing a listing. created, updated and deleted are lists of ids
+SyncResult = namedtuple('SyncResult', ('resource', 'created', 'updated',
+        'deleted', 'unchanged', 'pages', 'resumed'))
+
+# Progress of the last (or current) run over a listing
+Checkpoint = namedtuple('Checkpoint', ('resource', 'run', 'offset',
+        'watermark', 'next_watermark', 'complete', 'pages'))
+
+class CatalogueSync(object):
+    """Syncs listings of a client into a local snapshot"""
+
+    def __init__(self, client, path, page_size=DEFAULT_PAGE_SIZE,
+            since_param=None, modified_field=None):
+        """
+        Snapshot and checkpoints are kept in the SQLite file at path. If
+        since_param is given, listings are filtered by the highest
+        modified_field seen in the previous complete run.
+        """
+        self.client = client
+        self.store = SyncStore(path)
+        self.page_size = page_size
+        self.since_param = since_param
+        self.modified_field = modified_field
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def events(self):
+        return self.run('events')
+
+    def venues(self):
+        return self.run('venues')
+
+    def section_groups(self):
+        return self.run('section_groups')
+
+    def category_events(self, category_id):
+        return self.run('categories/{0}/events'.format(category_id),
+                lambda params: self.client.categories.events(category_id,
+                        params=params))
+
+    def get(self, resource, item_id):
+        """Item of the snapshot, None if unknown"""
+        return self.store.get(resource, item_id)
+
+    def items(self, resource):
+        """Iterates over the items of the snapshot"""
+        return self.store.items(resource)
+
+    def run(self, resource, fetch=None):
+        """
+        Syncs a listing, resuming the last run if it didn't complete. fetch
+        is called with the params of every page (offset, max and the since
+        filter) and must return its items, the client endpoint named after
+        the resource being called by default.
+        """
+        if fetch is None:
+            endpoint = getattr(self.client, resource)
+            fetch = lambda params: endpoint(params=params)
+        checkpoint = self.store.checkpoint(resource)
+        resumed = checkpoint is not None and not checkpoint.complete
+        if not resumed:
+            checkpoint = self.store.start(resource, checkpoint)
+        else:
+            log.info(u'Resuming sync of %s from offset %d', resource,
+                    checkpoint.offset)
+
+        params = {'max': self.page_size}
+        if self.since_param and checkpoint.watermark:
+            params[self.since_param] = checkpoint.watermark
+        offset = checkpoint.offset
+        while True:
+            params['offset'] = offset
+            items = fetch(dict(params))
+            meta = self.client.last_meta
+            if meta.page_offset is not None and meta.page_max:
+                next_offset = meta.page_offset + meta.page_max
+            else:
+                next_offset = offset + len(items)
+            self.store.save_page(checkpoint, items, next_offset,
+                    self.modified_field)
+            if not items or meta.total_count is None or \
+                    next_offset >= meta.total_count:
+                break
+            offset = next_offset
+
+        # Only a full listing tells what is gone
+        full = not params.get(self.since_param)
+        return self.store.complete(checkpoint, resumed, delete_unseen=full)
+
+
+class SyncStore(object):
+    """Snapshot and checkpoints of CatalogueSync in a SQLite file"""
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout,
+                check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # run is the last run an item was seen by, changed_run the last
+            # one that created or updated it
+            self._db.execute('CREATE TABLE IF NOT EXISTS items ('
+                    'resource TEXT, id TEXT, hash TEXT, data BLOB, '
+                    'run INTEGER, changed_run INTEGER, change TEXT, '
+                    'PRIMARY KEY (resource, id))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                    'resource TEXT PRIMARY KEY, run INTEGER, offset INTEGER, '
+                    'watermark TEXT, next_watermark TEXT, complete INTEGER, '
+                    'pages INTEGER)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, resource, item_id):
+        with self._lock:
+            row = self._db.execute('SELECT data FROM items '
+                    'WHERE resource = ? AND id = ?',
+                    (resource, u'{0}'.format(item_id))).fetchone()
+        return None if row is None else _loads(row[0])
+
+    def items(self, resource):
+        with self._lock:
+            rows = self._db.execute('SELECT data FROM items '
+                    'WHERE resource = ? ORDER BY rowid', (resource, )).fetchall()
+        for row in rows:
+            yield _loads(row[0])
+
+    def checkpoint(self, resource):
+        with self._lock:
+            row = self._db.execute('SELECT resource, run, offset, watermark, '
+                    'next_watermark, complete, pages FROM checkpoints '
+                    'WHERE resource = ?', (resource, )).fetchone()
+        if row is None:
+            return None
+        row = list(row)
+        row[5] = bool(row[5])
+        return Checkpoint(*row)
+
+    def start(self, resource, previous=None):
+        """Starts a new run, filtered by the watermark of the previous one"""
+        watermark = previous.next_watermark if previous else None
+        checkpoint = Checkpoint(resource, (previous.run if previous else 0) + 1,
+                0, watermark, watermark, False, 0)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO checkpoints (resource, '
+                    'run, offset, watermark, next_watermark, complete, pages) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', (resource, checkpoint.run,
+                    0, watermark, watermark, 0, 0))
+        return checkpoint
+
+    def save_page(self, checkpoint, items, next_offset, modified_field=None):
+        """
+        Stores the new or changed items of a page along with the progress of
+        the run, in a single transaction
+        """
+        resource, run = checkpoint.resource, checkpoint.run
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                watermark = self._db.execute('SELECT next_watermark '
+                        'FROM checkpoints WHERE resource = ?',
+                        (resource, )).fetchone()[0]
+                for item in items:
+                    self._save_item(resource, run, getattr(item, 'raw', item))
+                    modified = item.get(modified_field) if modified_field \
+                        else None
+                    if modified and (watermark is None or
+                            u'{0}'.format(modified) > watermark):
+                        watermark = u'{0}'.format(modified)
+                self._db.execute('UPDATE checkpoints SET offset = ?, '
+                        'next_watermark = ?, pages = pages + 1 '
+                        'WHERE resource = ?', (next_offset, watermark,
+                        resource))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _save_item(self, resource, run, item):
+        item_id = u'{0}'.format(item['id'])
+        content = _canonical(item)
+        digest = hashlib.sha1(content).hexdigest()
+        row = self._db.execute('SELECT hash, changed_run, change FROM items '
+                'WHERE resource = ? AND id = ?', (resource, item_id)).fetchone()
+        if row is not None and row[0] == digest:
+            self._db.execute('UPDATE items SET run = ? '
+                    'WHERE resource = ? AND id = ?', (run, resource, item_id))
+            return
+        if row is None:
+            change = 'created'
+        elif row[1] == run:
+            # Changed again within the same run
+            change = row[2]
+        else:
+            change = 'updated'
+        self._db.execute('INSERT OR REPLACE INTO items (resource, id, hash, '
+                'data, run, changed_run, change) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (resource, item_id, digest,
+                sqlite3.Binary(zlib.compress(content)), run, run, change))
+
+    def complete(self, checkpoint, resumed=False, delete_unseen=True):
+        """Finishes a run, returning its SyncResult"""
+        resource, run = checkpoint.resource, checkpoint.run
+        with self._lock:
+            deleted = []
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                if delete_unseen:
+                    deleted = [row[0] for row in self._db.execute(
+                            'SELECT id FROM items WHERE resource = ? '
+                            'AND run < ?', (resource, run))]
+                    self._db.execute('DELETE FROM items WHERE resource = ? '
+                            'AND run < ?', (resource, run))
+                self._db.execute('UPDATE checkpoints SET complete = 1 '
+                        'WHERE resource = ?', (resource, ))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            changes = {'created': [], 'updated': []}
+            for item_id, change in self._db.execute('SELECT id, change '
+                    'FROM items WHERE resource = ? AND changed_run = ? '
+                    'ORDER BY rowid', (resource, run)):
+                changes[change].append(item_id)
+            unchanged = self._db.execute('SELECT COUNT(*) FROM items '
+                    'WHERE resource = ? AND run = ? AND changed_run < ?',
+                    (resource, run, run)).fetchone()[0]
+            pages = self._db.execute('SELECT pages FROM checkpoints '
+                    'WHERE resource = ?', (resource, )).fetchone()[0]
+        return SyncResult(resource, changes['created'], changes['updated'],
+                deleted, unchanged, pages, resumed)
+
+    def reset(self, resource):
+        """Forgets the snapshot and checkpoint of a listing"""
+        with self._lock:
+            self._db.execute('DELETE FROM items WHERE resource = ?',
+                    (resource, ))
+            self._db.execute('DELETE FROM checkpoints WHERE resource = ?',
+                    (resource, ))
+
+
+def _canonical(item):
+    """Stable serialization of an item, so equal items hash the same"""
+    return _json.dumps(item, sort_keys=True, separators=(',', ':')).encode(
+            'utf8')
+
+
+def _loads(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf8'))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Offline tests of the asyncio client against the local stub API (Python 3.5+)
+"""
+import logging; log = logging.getLogger(__name__)
+
+import asyncio
+import unittest
+
+import ticketbis
+from ticketbis.aio import AsyncSingleFlight, AsyncTicketbis
+from ticketbis.benchmarks.server import StubServer, ACCESS_TOKEN
+from ticketbis.ratelimit import RateLimiter
+from ticketbis.retry import RetryPolicy
+from ticketbis.tokens import TokenManager
+
+
+class AsyncStubTestCase(unittest.TestCase):
+    total = 25
+
+    def setUp(self):
+        self.server = StubServer(total=self.total, seed=0).start()
+        self.loop = asyncio.new_event_loop()
+        self.clients = []
+        self.api = self.client()
+
+    def tearDown(self):
+        for client in self.clients:
+            self.wait(client.close())
+        self.loop.close()
+        self.server.stop()
+
+    def client(self, **kwargs):
+        options = dict(access_token='token', site='ticketbisES',
+                api_endpoint=self.server.url,
+                retry_policy=RetryPolicy(backoff=0.001))
+        options.update(kwargs)
+        client = AsyncTicketbis(**options)
+        self.clients.append(client)
+        return client
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+
+async def collect(items):
+    return [item async for item in items]
+
+
+class AsyncRequestsTestCase(AsyncStubTestCase):
+
+    def test_get(self):
+        api = self.api
+
+        async def main():
+            response = await api.events(3)
+            assert response['id'] == 3
+            assert api.rate_remaining is not None
+            response = await api.events(params={'max': 10, 'offset': 20})
+            assert [r['id'] for r in response] == list(range(20, 25))
+            assert api.total_count == self.total
+            assert api.page_offset == 20
+        self.wait(main())
+        assert self.api.site == 'ticketbisES'
+        # The meta of a response is only seen by the coroutine getting it
+        assert self.api.total_count is None
+
+    def test_pagination(self):
+        ids = [r['id'] for r in self.wait(collect(self.api.categories.events(
+                1, auto_pagination=True, params={'max': 4})))]
+        assert ids == list(range(self.total))
+
+    def test_concurrent_pagination(self):
+        api = self.client(pagination_workers=3)
+        ids = [r['id'] for r in self.wait(collect(api.events(
+                auto_pagination=True, params={'max': 4})))]
+        assert ids == list(range(self.total))
+        assert self.server.hits['/events'] == 7
+
+    def test_streamed_pagination(self):
+        api = self.client(stream=True)
+        ids = [r['id'] for r in self.wait(collect(api.events(
+                auto_pagination=True, params={'max': 4})))]
+        assert ids == list(range(self.total))
+
+    def test_multi(self):
+        api = self.api
+
+        async def main():
+            for event_id in (1, 2, self.total):
+                await api.events(event_id, multi=True)
+            return await collect(api.multi())
+        responses = self.wait(main())
+        assert [r['id'] for r in responses[:2]] == [1, 2]
+        assert isinstance(responses[2], ticketbis.ParamError)
+
+    def test_concurrent_multi(self):
+        api = self.client(multi_workers=3)
+
+        async def main():
+            for event_id in range(23):
+                await api.events(event_id, multi=True)
+            assert api.multi.num_required_api_calls == 5
+            responses = await collect(api.multi())
+            assert len(api.multi) == 0
+            return responses
+        responses = self.wait(main())
+        assert [r['id'] for r in responses] == list(range(23))
+        assert self.server.hits == {'/multi': 5}
+
+    def test_auto_batch(self):
+        api = self.client(auto_batch=True)
+
+        async def main():
+            return await asyncio.gather(api.events(1), api.events(2),
+                    api.venues(4), api.events(self.total),
+                    return_exceptions=True)
+        responses = self.wait(main())
+        assert [r['id'] for r in responses[:3]] == [1, 2, 4]
+        assert isinstance(responses[3], ticketbis.ParamError)
+        assert self.server.hits == {'/multi': 1}
+
+        async def listing():
+            response = await api.events(params={'max': 10})
+            assert api.total_count == self.total
+            return response
+        # Listings are sent apart
+        assert len(self.wait(listing())) == 10
+        assert self.server.hits == {'/multi': 1, '/events': 1}
+
+    def test_fan_out(self):
+        sites = ['ticketbisES', 'ticketbisPT']
+        results = self.wait(self.api.fan_out(lambda client: client.events(
+                auto_pagination=True), sites=sites))
+        assert list(results) == sites
+        assert [len(r) for r in results.values()] == [self.total] * 2
+        results = self.wait(self.api.fan_out(lambda client: client.events(
+                self.total), sites=sites))
+        assert all(isinstance(r, ticketbis.ParamError)
+                for r in results.values())
+
+    def test_post_and_put(self):
+        response = self.wait(self.api.events.create({'name': u'New'}))
+        assert response['name'] == u'New'
+        response = self.wait(self.api.events.update({'id': 4,
+                'name': u'Updated'}))
+        assert response == {'id': 4, 'name': u'Updated'}
+
+    def test_bulk(self):
+        records = [{'name': u'Event {0}'.format(i)} for i in range(12)]
+        for workers in (0, 4):
+            responses = self.wait(collect(self.api.events.bulk_create(
+                    records, workers=workers)))
+            assert [r['name'] for r in responses] == \
+                [r['name'] for r in records]
+        updates = [{'id': i, 'name': u'Updated'} for i in range(12)]
+        responses = self.wait(collect(self.api.venues.bulk_update(updates,
+                workers=3, start=5)))
+        assert [r['id'] for r in responses] == list(range(5, 12))
+        assert '/venues/4' not in self.server.hits
+
+    def test_rate_limited(self):
+        self.server.rate_limit = 5
+        self.server.rate_window = 0.5
+        api = self.client(rate_limiter=RateLimiter(window=0.5))
+        for _ in range(12):
+            self.wait(api.events(1))
+        # None was rejected and retried
+        assert self.server.hits == {'/events/1': 12}
+
+
+class AsyncFailuresTestCase(AsyncStubTestCase):
+
+    def test_not_found(self):
+        self.assertRaises(ticketbis.ParamError, self.wait,
+                self.api.events(self.total))
+
+    def test_retries(self):
+        self.server.error_rate = 0.5
+        api = self.client(retry_policy=RetryPolicy(max_attempts=20,
+                backoff=0.001))
+        ids = [r['id'] for r in self.wait(collect(api.events(
+                auto_pagination=True)))]
+        assert ids == list(range(self.total))
+
+    def test_non_retryable(self):
+        self.server.error_rate = 1
+        self.server.error_type = 'not_authorized'
+        self.assertRaises(ticketbis.NotAuthorized, self.wait,
+                self.api.events())
+        assert self.server.hits['/events'] == 1
+
+    def test_bulk_failures(self):
+        self.server.error_rate = 0.5
+        self.server.error_type = 'param_error'
+        records = [{'id': i, 'name': u'Updated'} for i in range(20)]
+        responses = self.wait(collect(self.api.events.bulk_update(records,
+                workers=4)))
+        failed = [response for response in responses
+                if isinstance(response, ticketbis.ParamError)]
+        assert 0 < len(failed) < len(records)
+
+
+class AsyncOAuthTestCase(AsyncStubTestCase):
+
+    def test_request_token(self):
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret',
+                grant_type=ticketbis.CLIENT_CRED_GRANT_TYPE)
+        data = self.wait(api.oauth.request_token())
+        assert data['access_token'] == ACCESS_TOKEN
+        assert data['expires_in'] > 0
+        assert self.wait(api.oauth.get_token()).startswith(ACCESS_TOKEN)
+        # No code, no request
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', redirect_uri='http://localhost')
+        assert self.wait(api.oauth.request_token()) is None
+        assert self.server.hits == {'/oauth/token/': 2}
+
+    def test_token_manager(self):
+        manager = TokenManager('id', 'secret', api_endpoint=self.server.url,
+                background=False)
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', token_manager=manager)
+        # Requested on a thread by the first request
+        assert self.server.hits == {}
+        assert self.wait(api.events(1))['id'] == 1
+        assert api.base_requester.oauth_token == ACCESS_TOKEN
+        assert self.server.hits == {'/oauth/token/': 1, '/events/1': 1}
+
+
+class AsyncSingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_leader_cancelled(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 42
+
+        async def main():
+            leader = asyncio.ensure_future(single_flight.do('key', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do('key', fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            # The call goes on for the follower, which wasn't cancelled
+            assert await follower == (42, True)
+            assert leader.cancelled()
+            assert calls == [1]
+            assert len(single_flight) == 0
+        self.loop.run_until_complete(main())
+
+    def test_failure_shared(self):
+        single_flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('shared')
+
+        async def main():
+            results = await asyncio.gather(single_flight.do('key', fail),
+                    single_flight.do('key', fail), return_exceptions=True)
+            assert [str(r) for r in results] == ['shared', 'shared']
+        self.loop.run_until_complete(main())
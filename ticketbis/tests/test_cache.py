@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import binascii
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import ticketbis
+from ticketbis.cache import (CacheEntry, MmapBackend, ResponseCache,
+        SQLiteBackend)
+
+# Run by another process, sharing the cache file given
+WRITER = '''
+import sys
+from ticketbis.cache import {0}
+backend = {0}(sys.argv[1])
+backend.set('shared', b'from another process')
+backend.delete('deleted')
+backend.close()
+'''
+
+
+class BackendTestCase(object):
+    """Tests of the backends persisting entries in a file"""
+    backend_class = None
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache')
+        self.backends = []
+
+    def tearDown(self):
+        for backend in self.backends:
+            backend.close()
+        shutil.rmtree(self.dir)
+
+    def backend(self, **kwargs):
+        backend = self.backend_class(self.path, **kwargs)
+        self.backends.append(backend)
+        return backend
+
+    def test_set_delete_and_clear(self):
+        backend = self.backend()
+        backend.set('a', b'1')
+        backend.set('b', b'2')
+        backend.set('a', b'3')
+        assert backend.get('a') == b'3'
+        backend.delete('a')
+        assert backend.get('a') is None
+        assert len(backend) == 1
+        backend.clear()
+        assert backend.get('b') is None
+        assert len(backend) == 0
+
+    def test_reopened(self):
+        backend = self.backend()
+        backend.set('a', b'1')
+        backend.close()
+        self.backends.remove(backend)
+        assert self.backend().get('a') == b'1'
+
+    def test_shared_between_processes(self):
+        backend = self.backend()
+        backend.set('deleted', b'soon')
+        assert backend.get('deleted') == b'soon'
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c',
+                WRITER.format(self.backend_class.__name__), self.path],
+                env=env)
+        assert backend.get('shared') == b'from another process'
+        assert backend.get('deleted') is None
+
+    def test_response_cache(self):
+        cache = ResponseCache(backend=self.backend())
+        key = cache.key('https://api/events', {'max': 1}, {})
+        cache.store(key, 60, {'headers': {'ETag': '"1"'}, 'data': [1]})
+        entry = ResponseCache(backend=self.backend()).lookup(key)
+        assert entry.data == [1]
+        assert entry.etag == '"1"'
+        assert entry.is_fresh()
+
+    def test_closed_with_client(self):
+        backend = self.backend()
+        api = ticketbis.Ticketbis(access_token='token',
+                cache=ResponseCache(backend=backend))
+        api.close()
+        assert self.is_closed(backend)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def test_keys(self):
+        cache = ResponseCache()
+        url = 'https://api/events'
+        headers = {'X-ticketbis-site': 'ticketbisES',
+                'Authorization': 'Bearer one'}
+        key = cache.key(url, {'max': 1}, headers)
+        assert key == cache.key(url, {'max': 1}, dict(headers))
+        assert key != cache.key(url, {'max': 2}, headers)
+        assert key != cache.key(url, {'max': 1},
+                dict(headers, **{'X-ticketbis-site': 'ticketbisFR'}))
+        # Responses of one token are never served to another
+        assert key != cache.key(url, {'max': 1},
+                dict(headers, Authorization='Bearer two'))
+        assert 'one' not in key
+
+    def test_kept_in_memory(self):
+        cache = ResponseCache()
+        cache.store('key', 60, {'headers': {'ETag': '"1"'}, 'data': [1]})
+        loads, CacheEntry.loads = CacheEntry.__dict__['loads'], None
+        try:
+            # Neither decompressed nor parsed
+            entry = cache.lookup('key')
+        finally:
+            CacheEntry.loads = loads
+        assert entry.data == [1]
+        assert entry.etag == '"1"'
+        # Updating an entry looked up doesn't change the cached one
+        entry.expires = 0
+        assert cache.lookup('key').is_fresh()
+
+
+class SQLiteBackendTestCase(BackendTestCase, unittest.TestCase):
+    backend_class = SQLiteBackend
+
+    def is_closed(self, backend):
+        try:
+            backend._db.execute('SELECT 1')
+        except sqlite3.ProgrammingError:
+            return True
+        return False
+
+    def test_least_recently_used_evicted(self):
+        backend = self.backend(max_entries=3)
+        for key in 'abc':
+            backend.set(key, key.encode('utf8'))
+            time.sleep(0.01)
+        backend.get('a')
+        backend.set('d', b'd')
+        assert len(backend) == 3
+        assert backend.get('b') is None
+        assert backend.get('a') == b'a'
+
+
+class MmapBackendTestCase(BackendTestCase, unittest.TestCase):
+    backend_class = MmapBackend
+
+    def is_closed(self, backend):
+        return backend._file.closed and backend._lock_file.closed
+
+    def test_oldest_evicted(self):
+        backend = self.backend(max_size=16 * 1024)
+        for i in range(200):
+            backend.set('key{0}'.format(i), b'x' * 1024)
+            assert os.path.getsize(self.path) <= 16 * 1024
+        assert backend.get('key199') == b'x' * 1024
+        assert backend.get('key0') is None
+        assert 0 < len(backend) < 16
+
+    def test_expired_dropped_on_compaction(self):
+        backend = self.backend(max_size=4 * 1024)
+        # Random data, which can't be compressed
+        data = binascii.hexlify(os.urandom(512)).decode('ascii')
+        backend.set('expired', CacheEntry({}, data, time.time() - 1).dumps())
+        backend.set('fresh', CacheEntry({}, 'y', time.time() + 60).dumps())
+        backend.set('big', os.urandom(3584))
+        assert backend.get('expired') is None
+        assert backend.get('fresh') is not None
+        assert backend.get('big') is not None
+
+    def test_compacted_by_another_instance(self):
+        reader = self.backend(max_size=8 * 1024)
+        writer = self.backend(max_size=8 * 1024)
+        reader.set('a', b'1')
+        for _ in range(20):
+            writer.set('b', b'z' * 1024)
+        assert os.path.getsize(self.path) < 8 * 1024
+        assert reader.get('a') == b'1'
+        assert reader.get('b') == b'z' * 1024
+        reader.set('c', b'3')
+        assert writer.get('c') == b'3'
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import ticketbis
+from ticketbis.metrics import Metrics, StatsdExporter, active_timings
+from ticketbis.retry import RetryPolicy
+
+from .test_stub import StubEndpointTestCase
+
+
+class MetricsTestCase(StubEndpointTestCase):
+
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        self.lines = []
+        self.metrics = Metrics(exporters=[
+            StatsdExporter(send=self.lines.append)])
+        self.api = self.client(metrics=self.metrics)
+
+    def test_requests(self):
+        self.api.events(1)
+        self.api.venues(1)
+        assert self.metrics.counter('requests', 'events') == 1
+        assert self.metrics.counter('requests') == 2
+        histogram = self.metrics.histogram('request_seconds', 'venues')
+        assert histogram.count == 1
+        for phase in ('dns', 'connect', 'first_byte', 'body', 'decode'):
+            assert self.metrics.histogram(phase + '_seconds', 'events')
+
+    def test_hooks(self):
+        infos = []
+        self.metrics.before_request.append(
+            lambda info: info.headers.update({'X-Trace': '1'}))
+        self.metrics.after_request.append(infos.append)
+        self.api.categories.events(1)
+        assert infos[0].endpoint == 'categories'
+        assert infos[0].headers['X-Trace'] == '1'
+        assert infos[0].error is None
+        assert infos[0].duration >= sum(infos[0].timings.values()) * 0.99
+
+    def test_unexpected_error(self):
+        def loads(content):
+            raise RuntimeError('Unexpected')
+        api = self.client(metrics=self.metrics, json_loads=loads)
+        self.assertRaises(RuntimeError, api.events, 1)
+        # The timings of the failed attempt aren't left behind
+        assert active_timings() is None
+
+    def test_retries(self):
+        self.server.error_rate = 1
+        api = self.client(metrics=self.metrics,
+                retry_policy=RetryPolicy(max_attempts=3, backoff=0.001))
+        self.assertRaises(ticketbis.ServerError, api.events)
+        assert self.metrics.counter('requests', 'events') == 3
+        assert self.metrics.counter('errors', 'events') == 3
+        assert self.metrics.counter('retries', 'events') == 2
+
+    def test_cache(self):
+        api = self.client(metrics=self.metrics,
+                cache=ticketbis.ResponseCache(ttl=60))
+        api.events(1)
+        api.events(1)
+        assert self.metrics.counter('cache_misses', 'events') == 1
+        assert self.metrics.counter('cache_hits', 'events') == 1
+
+    def test_exporters(self):
+        self.api.events(1)
+        assert 'ticketbis.events.requests:1|c' in self.lines
+        text = self.metrics.prometheus()
+        assert 'ticketbis_requests_total{endpoint="events"} 1' in text
+        assert 'ticketbis_request_seconds_count{endpoint="events"} 1' in text
+
+    def test_not_attached(self):
+        api = self.client()
+        api.events(1)
+        assert api.metrics is None
+        assert not self.metrics.counters
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import pickle
+import unittest
+from datetime import datetime
+
+from ticketbis.models import Event, Venue, parse_date
+
+EVENT = {
+    'id': 1,
+    'name': u'Concert',
+    'start_date': '2016-05-20T21:00:00Z',
+    'venue': {'id': 2, 'name': u'Stadium'},
+    'site': 'ticketbisES',
+    'unknown_field': [1, 2],
+}
+
+
+class ModelsTestCase(unittest.TestCase):
+
+    def test_fields(self):
+        event = Event(EVENT)
+        assert event.id == 1
+        assert event.name == u'Concert'
+        assert event.end_date is None
+        assert event.unknown_field == [1, 2]
+        self.assertRaises(AttributeError, getattr, event, 'not_a_key')
+
+    def test_lazy_parsing(self):
+        event = Event(EVENT)
+        assert event.start_date == datetime(2016, 5, 20, 21, 0)
+        assert event.start_date is event.start_date
+        assert isinstance(event.venue, Venue)
+        assert event.venue.name == u'Stadium'
+
+    def test_dict_access(self):
+        event = Event(EVENT)
+        assert event['start_date'] == EVENT['start_date']
+        assert event.get('end_date') is None
+        assert 'unknown_field' in event
+        assert 'end_date' not in event
+        self.assertRaises(KeyError, lambda: event['end_date'])
+
+    def test_raw(self):
+        event = Event(EVENT)
+        event.start_date
+        assert event.raw == EVENT
+        assert event == EVENT
+        assert pickle.loads(pickle.dumps(event)) == event
+
+    def test_no_instance_dict(self):
+        assert not hasattr(Event(EVENT), '__dict__')
+
+    def test_parse_date(self):
+        assert parse_date('2016-05-20') == datetime(2016, 5, 20)
+        assert parse_date('2016-05-20T21:00:00+02:00') == \
+            datetime(2016, 5, 20, 21, 0)
+        assert parse_date('not a date') == 'not a date'
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import time
+import unittest
+
+import ticketbis
+from ticketbis.ratelimit import RateLimiter
+
+from .test_stub import StubEndpointTestCase
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def test_blocking_wait(self):
+        limiter = RateLimiter(limit=2, window=0.2)
+        assert limiter.acquire() == 0
+        assert limiter.acquire() == 0
+        started = time.time()
+        wait = limiter.acquire()
+        assert 0.05 < wait <= 0.1
+        assert time.time() - started >= wait
+        # Waiting callers queue up behind each other
+        assert 0.05 < limiter.reserve() <= 0.1
+        assert 0.15 < limiter.reserve() <= 0.2
+
+    def test_non_blocking(self):
+        limiter = RateLimiter(limit=1, window=10)
+        limiter.acquire()
+        with limiter.blocking(False):
+            self.assertRaises(ticketbis.RateLimitExceeded, limiter.acquire)
+        # Failed callers don't take a token
+        assert limiter.tokens > -0.01
+        limiter = RateLimiter(limit=1, window=10, block=False)
+        limiter.acquire()
+        self.assertRaises(ticketbis.RateLimitExceeded, limiter.reserve)
+
+    def test_timeout(self):
+        limiter = RateLimiter(limit=1, window=10, timeout=1)
+        limiter.acquire()
+        self.assertRaises(ticketbis.RateLimitExceeded, limiter.reserve)
+        with limiter.blocking(timeout=20):
+            assert 9 < limiter.reserve() <= 10
+
+    def test_synced_from_headers(self):
+        limiter = RateLimiter(window=10)
+        # Nothing is throttled until the limit is known
+        assert limiter.reserve() == 0
+        limiter.update({'X-RateLimit-Limit': '100',
+                'X-RateLimit-Remaining': '3'})
+        assert limiter.limit == 100
+        assert 3 <= limiter.tokens < 3.1
+        limiter.update({'X-RateLimit-Limit': '100'})
+        assert limiter.tokens < 3.1
+
+    def test_nothing_left(self):
+        limiter = RateLimiter(window=10)
+        limiter.update({'X-RateLimit-Limit': '100',
+                'X-RateLimit-Remaining': '0', 'Retry-After': '5'})
+        time.sleep(0.05)
+        # Not refilled until the API window resets
+        assert limiter.tokens == 0
+        assert 4.9 < limiter.reserve() <= 5
+        limiter.update({'X-RateLimit-Limit': '100',
+                'X-RateLimit-Remaining': '0',
+                'X-RateLimit-Reset': '{0}'.format(time.time() + 2)})
+        assert 1.9 < limiter.reserve() <= 2
+        # A whole window if the API doesn't tell
+        limiter.update({'X-RateLimit-Limit': '100',
+                'X-RateLimit-Remaining': '0'})
+        assert 9.9 < limiter.reserve() <= 10
+        limiter.update({'X-RateLimit-Limit': '100',
+                'X-RateLimit-Remaining': '50'})
+        assert limiter.reserve() == 0
+
+    def test_window_reset(self):
+        limiter = RateLimiter(window=10)
+        limiter.update({'X-RateLimit-Limit': '5',
+                'X-RateLimit-Remaining': '0', 'Retry-After': '0.1'})
+        time.sleep(0.15)
+        assert 4.9 < limiter.tokens <= 5
+
+
+class RateLimitedClientTestCase(StubEndpointTestCase):
+
+    def test_server_limit_never_reached(self):
+        self.server.rate_limit = 5
+        self.server.rate_window = 0.5
+        api = self.client(rate_limiter=RateLimiter(window=0.5))
+        for _ in range(12):
+            api.events(1)
+        # None was rejected and retried
+        assert self.server.hits == {'/events/1': 12}
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import time
+import unittest
+
+import ticketbis
+from ticketbis.retry import RetryPolicy
+
+from .test_stub import StubEndpointTestCase
+
+
+def error(cls, retry_after=None):
+    exc = cls(u'Failed')
+    if retry_after is not None:
+        exc.headers = {'Retry-After': retry_after}
+    return exc
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def test_retry_after(self):
+        policy = RetryPolicy()
+        started = time.time()
+        assert policy.delay('GET', 1, error(ticketbis.RateLimitExceeded,
+                '12'), started) == 12
+        # Raised rather than waiting longer than max_backoff
+        assert policy.delay('GET', 1, error(ticketbis.RateLimitExceeded,
+                '3500'), started) is None
+        assert RetryPolicy(max_backoff=3600).delay('GET', 1,
+                error(ticketbis.RateLimitExceeded, '3500'), started) == 3500
+
+    def test_non_retryable(self):
+        policy = RetryPolicy()
+        started = time.time()
+        for method in ('GET', 'PUT'):
+            assert policy.delay(method, 1, error(ticketbis.PreconditionFailed),
+                    started) is None
+        assert policy.delay('GET', 1, error(ticketbis.ServerError),
+                started) is not None
+        assert policy.delay('POST', 1, error(ticketbis.ServerError),
+                started) is None
+
+
+class RetriedClientTestCase(StubEndpointTestCase):
+
+    def test_long_retry_after(self):
+        self.server.rate_limit = 1
+        api = self.client(retry_policy=RetryPolicy())
+        api.events()
+        started = time.time()
+        # The rest of the hourly window isn't waited for
+        self.assertRaises(ticketbis.RateLimitExceeded, api.events)
+        assert time.time() - started < 1
+        assert self.server.hits == {'/events': 2}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+from datetime import date, datetime
+
+from ticketbis.models import Event
+from ticketbis.store import CatalogueStore
+
+from .test_stub import StubEndpointTestCase
+
+
+class StoreTestCase(StubEndpointTestCase):
+    total = 60
+
+    def setUp(self):
+        super(StoreTestCase, self).setUp()
+        self.store = CatalogueStore()
+        self.api = self.client(catalogue=self.store)
+
+    def tearDown(self):
+        self.store.close()
+        super(StoreTestCase, self).tearDown()
+
+    def test_listing_upserted(self):
+        events = list(self.api.events(auto_pagination=True))
+        assert len(self.store) == self.total
+        assert self.store.get('events', 7) == events[7]
+        # Queried offline from then on
+        hits = dict(self.server.hits)
+        events = self.store.events(category_id=3)
+        assert [e['id'] for e in events] == [3, 53]
+        assert self.store.count('events', city=['Madrid', 'Paris']) == 20
+        assert self.store.count('events', venue_id=7, site='ticketbisES') == 1
+        assert self.server.hits == hits
+
+    def test_date_ranges(self):
+        list(self.api.events(auto_pagination=True))
+        # Events 2, 14, 26... start in March, on different days
+        march = self.store.events(start=date(2016, 3, 1), end=date(2016, 4, 1))
+        assert [e['id'] for e in march] == [2, 38, 14, 50, 26]
+        days = self.store.events(start=datetime(2016, 3, 3, 21),
+                end='2016-03-27T00:00:00Z')
+        assert [e['id'] for e in days] == [2, 38, 14, 50]
+        ordered = self.store.events(limit=3)
+        assert [e['start_date'] for e in ordered] == \
+            sorted(e['start_date'] for e in ordered)
+        assert ordered[0]['start_date'].startswith('2016-01-01')
+
+    def test_single_results_and_sub_resources(self):
+        self.api.venues(5)
+        self.api.categories.events(2, params={'max': 4})
+        assert self.store.get('venues', 5)['name'] == u'Venue 5'
+        assert self.store.count('events') == 4
+        # Sites aren't catalogued unless fetched through their endpoint
+        assert self.store.count('sites') == 0
+
+    def test_upsert_and_delete(self):
+        self.store.upsert('events', [{'id': 1, 'name': u'One',
+                'category': {'id': 9}, 'venue': {'id': 4, 'city': 'Bilbao'},
+                'start_date': '2016-05-01T20:00:00+02:00'}])
+        assert self.store.count('events', category_id=9, venue_id=4,
+                city='Bilbao', start=date(2016, 5, 1)) == 1
+        self.store.upsert('events', Event({'id': 1, 'name': u'Renamed'}))
+        assert self.store.get('events', '1') == {'id': 1, 'name': u'Renamed'}
+        self.store.delete('events', [1])
+        assert self.store.get('events', 1) is None
+
+    def test_models(self):
+        store = CatalogueStore(models=True)
+        store.upsert('events', {'id': 1, 'start_date': '2016-05-01T20:00:00Z'})
+        assert store.events()[0].start_date == datetime(2016, 5, 1, 20)
+        store.close()
+
+    def test_batched(self):
+        api = self.client(catalogue=self.store, auto_batch=True)
+        futures = [api.events(i) for i in range(3)]
+        assert [f.result()['id'] for f in futures] == [0, 1, 2]
+        api.close()
+        assert self.store.count('events') == 3
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Offline tests against the local stub API (see ticketbis.benchmarks.server)
+"""
+import logging; log = logging.getLogger(__name__)
+
+import subprocess
+import sys
+import threading
+import unittest
+
+try:
+    import h2
+    import httpx
+except ImportError:
+    h2 = None
+
+import ticketbis
+from ticketbis.benchmarks.server import StubServer, StubTransport, ACCESS_TOKEN
+from ticketbis.retry import RetryPolicy
+
+
+class StubEndpointTestCase(unittest.TestCase):
+    total = 25
+
+    def setUp(self):
+        self.server = StubServer(total=self.total, seed=0).start()
+        self.api = self.client()
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def client(self, **kwargs):
+        options = dict(access_token='token', site='ticketbisES',
+                api_endpoint=self.server.url,
+                retry_policy=RetryPolicy(backoff=0.001))
+        options.update(kwargs)
+        return ticketbis.Ticketbis(**options)
+
+
+class StubRequestsTestCase(StubEndpointTestCase):
+
+    def test_get(self):
+        response = self.api.events(3)
+        assert response['id'] == 3
+        assert self.api.site == 'ticketbisES'
+        assert self.api.rate_remaining is not None
+
+    def test_listing(self):
+        response = self.api.events(params={'max': 10, 'offset': 20})
+        assert [r['id'] for r in response] == list(range(20, 25))
+        assert self.api.total_count == self.total
+        assert self.api.page_offset == 20
+
+    def test_pagination(self):
+        ids = [r['id'] for r in self.api.categories.events(1,
+                auto_pagination=True, params={'max': 4})]
+        assert ids == list(range(self.total))
+
+    def test_concurrent_pagination(self):
+        api = self.client(pagination_workers=3)
+        ids = [r['id'] for r in api.events(auto_pagination=True,
+                params={'max': 4})]
+        assert ids == list(range(self.total))
+
+    def test_streamed_pagination(self):
+        api = self.client(stream=True)
+        ids = [r['id'] for r in api.events(auto_pagination=True,
+                params={'max': 4})]
+        assert ids == list(range(self.total))
+
+    def test_multi(self):
+        for event_id in (1, 2, self.total):
+            self.api.events(event_id, multi=True)
+        responses = list(self.api.multi())
+        assert [r['id'] for r in responses[:2]] == [1, 2]
+        assert isinstance(responses[2], ticketbis.ParamError)
+
+    def test_concurrent_multi(self):
+        api = self.client(multi_workers=3)
+        for event_id in range(23):
+            api.events(event_id, multi=True)
+        assert api.multi.num_required_api_calls == 5
+        assert api.multi.num_required_rounds == 2
+        assert [r['id'] for r in api.multi()] == list(range(23))
+        assert len(api.multi) == 0
+        api.close()
+        # Chunks not sent yet stay queued when the responses aren't read
+        api = self.client(multi_workers=1)
+        for event_id in range(23):
+            api.events(event_id, multi=True)
+        self.server.latency = 0.05
+        responses = api.multi()
+        assert next(responses)['id'] == 0
+        responses.close()
+        # The first chunk was read and the second one was being sent
+        assert len(api.multi) == 13
+        assert [r['id'] for r in api.multi()] == list(range(10, 23))
+        api.close()
+
+    def test_auto_batch(self):
+        api = self.client(auto_batch=True, batch_window=0.05)
+        futures = [api.events(i) for i in (1, 2, self.total)]
+        futures.append(api.venues(4))
+        assert [f.result()['id'] for f in futures[:2]] == [1, 2]
+        self.assertRaises(ticketbis.ParamError, futures[2].result)
+        assert futures[3].result()['address'] == u'4 Main Street'
+        assert self.server.hits == {'/multi': 1}
+        # A full batch doesn't wait for the window
+        futures = [api.events(i) for i in range(ticketbis.MAX_MULTI_REQUESTS)]
+        assert [f.result()['id'] for f in futures] == \
+            list(range(ticketbis.MAX_MULTI_REQUESTS))
+        # Neither are listings, which keep their pagination metadata
+        ids = [r['id'] for r in api.events(auto_pagination=True)]
+        assert ids == list(range(self.total))
+        response = api.events(params={'max': 10, 'offset': 20})
+        assert [r['id'] for r in response] == list(range(20, 25))
+        assert api.total_count == self.total
+        assert api.page_offset == 20
+        assert len(api.categories.events(1)) == 10
+        api.close()
+
+    def test_shared_between_threads(self):
+        results, errors = {}, []
+
+        def worker(n):
+            try:
+                ids = [r['id'] for r in self.api.events(auto_pagination=True,
+                        params={'max': n})]
+                self.api.events(params={'max': n, 'offset': n})
+                assert self.api.page_max == n
+                assert self.api.last_meta.page_offset == n
+                for event_id in range(n):
+                    self.api.events(event_id, multi=True)
+                results[n] = (ids, [r['id'] for r in self.api.multi()])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n, ))
+                for n in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        for n, (ids, multi_ids) in results.items():
+            assert ids == list(range(self.total))
+            assert multi_ids == list(range(n))
+
+    def test_coalescing(self):
+        self.server.latency = 0.2
+        api = self.client(coalesce=True, metrics=ticketbis.Metrics())
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                api.events(7))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [r['id'] for r in results] == [7] * 8
+        assert self.server.hits['/events/7'] == 1
+        assert api.metrics.counter('coalesced') == 7
+        assert len(api.base_requester.single_flight) == 0
+        # Nothing is shared once the request is done
+        api.events(7)
+        assert self.server.hits['/events/7'] == 2
+
+    def test_lazy_site(self):
+        api = self.client(site=None, access_token='lazy-site-token')
+        assert self.server.hits == {}
+        assert api.site == 'ticketbisES'
+        assert self.server.hits == {'/sites': 1}
+        # Known by clients with the same token and lang from then on
+        api = self.client(site=None, access_token='lazy-site-token')
+        assert api.site == 'ticketbisES'
+        assert self.server.hits == {'/sites': 1}
+
+    def test_lazy_endpoints(self):
+        assert 'events' not in self.api.__dict__
+        assert self.api.events is self.api.events
+        assert self.api.events.requester is self.api.base_requester
+        self.assertRaises(AttributeError, getattr, self.api, 'unknown')
+
+    def test_fan_out(self):
+        api = self.client(site=None, access_token='fan-out-token')
+        langs = ['fr', 'de', 'it']
+        results = api.fan_out(lambda client: (client.events(1)['id'],
+                client.site), langs=langs)
+        assert list(results) == langs
+        assert results['de'] == (1, 'ticketbisDE')
+        assert '/sites' not in self.server.hits
+        # Known by clients with the same token and lang from then on
+        assert self.client(site=None, access_token='fan-out-token',
+                lang='fr').site == 'ticketbisFR'
+        assert '/sites' not in self.server.hits
+        api.close()
+
+        sites = ['ticketbisES', 'ticketbisPT']
+        results = self.api.fan_out(lambda client: client.events(
+                auto_pagination=True), sites=sites, workers=0)
+        assert [len(r) for r in results.values()] == [self.total] * 2
+        results = self.api.fan_out(lambda client: client.events(self.total),
+                sites=sites)
+        assert all(isinstance(r, ticketbis.ParamError)
+                for r in results.values())
+
+    def test_localized(self):
+        api = self.client(auto_batch=True)
+        client = api.localized(site='ticketbisFR')
+        assert client.base_requester.transport is api.base_requester.transport
+        assert client.events.requester is client.base_requester
+        assert client.events(2)['id'] == 2
+        assert client.last_meta.site == 'ticketbisFR'
+        client.close()
+        # The connections stay open for the client it comes from
+        assert api.events(2).result()['id'] == 2
+        assert api.site == 'ticketbisES'
+        api.close()
+
+    def test_json_loads(self):
+        bodies = []
+
+        def loads(content):
+            bodies.append(content)
+            return ticketbis.json.loads(content)
+        api = self.client(json_loads=loads)
+        assert api.events(2)['id'] == 2
+        assert len(bodies) == 1
+
+    def test_lazy_imports(self):
+        statement = ('import sys, ticketbis; print(" ".join(m for m in '
+                '("requests", "aiohttp", "inspect") if m in sys.modules))')
+        output = subprocess.check_output([sys.executable, '-c', statement])
+        assert output.strip() == b''
+
+    def test_compression(self):
+        self.server.compression = True
+        api = self.client(compression='identity')
+        api.events(params={'max': 20})
+        identity = self.server.bytes_sent
+        self.server.reset()
+        api = self.client(compression=True, compress_min_size=100)
+        assert [e['id'] for e in api.events(auto_pagination=True,
+                params={'max': 20})] == list(range(self.total))
+        assert self.server.bytes_sent < identity / 2
+        # Only long bodies are compressed
+        record = {'id': 1, 'name': u'Event ' * 50}
+        assert api.events.update(record) == record
+        assert 0 < self.server.bytes_received < 100
+        assert api.events.update({'id': 1}) == {'id': 1}
+
+    def test_stub_transport(self):
+        stub = StubServer(total=self.total)
+        api = self.client(api_endpoint=ticketbis.API_ENDPOINT,
+                transport=StubTransport(stub), stream=True)
+        assert len(list(api.events(auto_pagination=True))) == self.total
+        self.assertRaises(ticketbis.ParamError, api.events, self.total)
+        assert stub.hits == {'/events': 3, '/events/25': 1}
+        assert self.server.hits == {}
+
+    @unittest.skipIf(h2 is None, 'httpx[http2] is not installed')
+    def test_http2_transport(self):
+        from ticketbis.transports import HTTP2Transport
+        with StubServer(total=400, http2=True) as server:
+            transport = HTTP2Transport(http1=False)
+            response = transport.request('GET', server.url + 'events/1')
+            assert response.http_version == 'HTTP/2'
+            api = self.client(api_endpoint=server.url, transport=transport,
+                    pagination_workers=4)
+            # Pages larger than the flow control window
+            assert len(list(api.events(auto_pagination=True,
+                    params={'max': 200}))) == 400
+            assert api.events.update({'id': 1}) == {'id': 1}
+            self.assertRaises(ticketbis.ParamError, api.events, 400)
+            api.close()
+        api = self.client(api_endpoint='http://127.0.0.1:1/',
+                transport=HTTP2Transport())
+        self.assertRaises(ticketbis.TicketbisException, api.events, 1)
+
+    @unittest.skipIf(h2 is None, 'httpx[http2] is not installed')
+    def test_http2_fallback(self):
+        from ticketbis.transports import HTTP2Transport
+        # Negotiated over TLS only, so plain http is spoken HTTP/1.1
+        transport = HTTP2Transport()
+        response = transport.request('GET', self.server.url + 'events/1')
+        assert response.http_version == 'HTTP/1.1'
+        api = self.client(transport=transport)
+        assert api.events(1)['id'] == 1
+        api.close()
+
+    def test_post_and_put(self):
+        response = self.api.events.create({'name': u'New'})
+        assert response['name'] == u'New'
+        response = self.api.events.update({'id': 4, 'name': u'Updated'})
+        assert response == {'id': 4, 'name': u'Updated'}
+
+    def test_bulk(self):
+        records = [{'name': u'Event {0}'.format(i)} for i in range(12)]
+        for workers in (0, 4):
+            responses = list(self.api.events.bulk_create(records,
+                    workers=workers))
+            assert [r['name'] for r in responses] == \
+                [r['name'] for r in records]
+        updates = [{'id': i, 'name': u'Updated'} for i in range(12)]
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', bulk_workers=3)
+        responses = list(api.venues.bulk_update(updates, start=5))
+        assert [r['id'] for r in responses] == list(range(5, 12))
+        assert self.server.hits['/venues/11'] == 1
+        assert '/venues/4' not in self.server.hits
+        # Credentials are added to a copy of the records
+        assert 'client_id' not in updates[0]
+
+    def test_get_token(self):
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', redirect_uri='http://localhost')
+        assert api.oauth.get_token(u'code') == ACCESS_TOKEN
+
+    def test_models(self):
+        api = self.client(models=True)
+        event = api.events(3)
+        assert isinstance(event, ticketbis.Event)
+        assert event.start_date.month == 4
+
+
+class StubFailuresTestCase(StubEndpointTestCase):
+
+    def test_retries(self):
+        self.server.error_rate = 0.5
+        api = self.client(retry_policy=RetryPolicy(max_attempts=20,
+                backoff=0.001))
+        ids = [r['id'] for r in api.events(auto_pagination=True)]
+        assert ids == list(range(self.total))
+        assert self.server.hits['/events'] > 3
+
+    def test_non_retryable(self):
+        self.server.error_rate = 1
+        self.server.error_type = 'not_authorized'
+        self.assertRaises(ticketbis.NotAuthorized, self.api.events)
+        assert self.server.hits['/events'] == 1
+
+    def test_server_rate_limit(self):
+        self.server.rate_limit = 2
+        # Retry-After tells to wait for the rest of the window
+        api = self.client(retry_policy=RetryPolicy(max_attempts=1))
+        api.events()
+        api.events()
+        self.assertRaises(ticketbis.RateLimitExceeded, api.events)
+        # Answered like the API does, as injected errors are
+        response = api.base_requester.transport.request('GET',
+                self.server.url + 'events')
+        assert response.status_code == 429
+
+    def test_bulk_failures(self):
+        self.server.error_rate = 0.5
+        self.server.error_type = 'param_error'
+        records = [{'id': i, 'name': u'Updated'} for i in range(20)]
+        responses = list(self.api.events.bulk_update(records, workers=4))
+        failed = [record for record, response in zip(records, responses)
+                if isinstance(response, ticketbis.ParamError)]
+        assert 0 < len(failed) < len(records)
+        # Only the failed records are sent again
+        self.server.error_rate = 0
+        responses = list(self.api.events.bulk_update(failed, workers=4))
+        assert [r['id'] for r in responses] == [r['id'] for r in failed]
+
+    def test_coalesced_failure(self):
+        self.server.latency = 0.2
+        self.server.error_rate = 1
+        self.server.error_type = 'not_authorized'
+        api = self.client(coalesce=True)
+        errors = []
+
+        def worker():
+            try:
+                api.events(7)
+            except ticketbis.NotAuthorized as e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(errors) == 4
+        assert self.server.hits['/events/7'] == 1
+
+    def test_revalidation(self):
+        api = self.client(cache=ticketbis.ResponseCache(ttl=0))
+        first = api.events(1)
+        assert api.events(1) == first
+        assert self.server.hits['/events/1'] == 2
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+import logging; log = logging.getLogger(__name__)
+
+import os
+import shutil
+import tempfile
+
+from ticketbis.sync import CatalogueSync
+
+from .test_stub import StubEndpointTestCase
+
+
+class SyncTestCase(StubEndpointTestCase):
+
+    def setUp(self):
+        super(SyncTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.sync = CatalogueSync(self.api,
+                os.path.join(self.tmpdir, 'catalogue.db'), page_size=10)
+
+    def tearDown(self):
+        self.sync.close()
+        shutil.rmtree(self.tmpdir)
+        super(SyncTestCase, self).tearDown()
+
+    def test_first_run(self):
+        result = self.sync.events()
+        assert len(result.created) == self.total
+        assert result.pages == 3
+        assert self.sync.get('events', 3)['name'] == u'Event 3'
+        assert len(list(self.sync.items('events'))) == self.total
+
+    def test_changes(self):
+        self.sync.events()
+        self.server.overrides[('events', 4)] = {'name': u'Renamed'}
+        self.server.total -= 1
+        result = self.sync.events()
+        assert result.created == []
+        assert result.updated == ['4']
+        assert result.deleted == [str(self.total - 1)]
+        assert result.unchanged == self.total - 2
+        assert self.sync.get('events', 4)['name'] == u'Renamed'
+
+    def test_resume(self):
+        calls = []
+
+        def failing(params):
+            calls.append(params['offset'])
+            if len(calls) == 2:
+                raise IOError('Connection lost')
+            return self.api.events(params=params)
+
+        self.assertRaises(IOError, self.sync.run, 'events', failing)
+        result = self.sync.events()
+        assert result.resumed
+        assert len(result.created) == self.total
+        assert self.server.hits['/events'] == 3
+
+    def test_watermark(self):
+        sync = CatalogueSync(self.api, os.path.join(self.tmpdir, 'since.db'),
+                page_size=10, since_param='updated_since',
+                modified_field='start_date')
+        sync.venues()
+        sync.events()
+        requests = []
+
+        def fetch(params):
+            requests.append(params)
+            return self.api.events(params=params)
+        sync.run('events', fetch)
+        assert requests[0]['updated_since'] == max(
+            self.server.item('events', i)['start_date']
+            for i in range(self.total))
+        # Venues have no start_date, they keep being listed in full
+        assert sync.store.checkpoint('venues').watermark is None
+        sync.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Offline tests of ticketbis.tokens against the local stub API
+"""
+import logging; log = logging.getLogger(__name__)
+
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from ticketbis.benchmarks.server import ACCESS_TOKEN
+from ticketbis.tests.test_stub import StubEndpointTestCase
+from ticketbis.tokens import TokenManager
+
+
+class TokenManagerTestCase(StubEndpointTestCase):
+
+    def setUp(self):
+        super(TokenManagerTestCase, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close()
+        shutil.rmtree(self.tmp)
+        super(TokenManagerTestCase, self).tearDown()
+
+    def manager(self, **kwargs):
+        manager = TokenManager('id', 'secret', api_endpoint=self.server.url,
+                **kwargs)
+        self.managers.append(manager)
+        return manager
+
+    def test_cached(self):
+        manager = self.manager()
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(
+                manager.token())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert tokens == [ACCESS_TOKEN] * 8
+        assert self.server.hits['/oauth/token/'] == 1
+
+    def test_background_refresh(self):
+        self.server.token_lifetime = 0.2
+        manager = self.manager()
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', token_manager=manager)
+        # Requested by the first request, not when the client is built
+        assert self.server.hits == {}
+        assert api.events(1)['id'] == 1
+        assert api.base_requester.oauth_token == ACCESS_TOKEN
+        time.sleep(0.3)
+        # Refreshed halfway through its lifetime, the client got it
+        assert self.server.hits['/oauth/token/'] >= 2
+        assert api.base_requester.oauth_token == manager.access_token
+        assert manager.access_token != ACCESS_TOKEN
+
+    def test_clients_not_kept(self):
+        manager = self.manager(background=False)
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', token_manager=manager)
+        api.events(1)
+        other = self.client(access_token=None, client_id='id',
+                client_secret='secret', token_manager=manager)
+        other.events(1)
+        assert len(manager._listeners) == 2
+        # Clients nobody uses anymore are neither kept nor told new tokens
+        del other
+        gc.collect()
+        manager.refresh(stale=ACCESS_TOKEN)
+        assert len(manager._listeners) == 1
+        assert api.base_requester.oauth_token == manager.access_token
+        api.close()
+        assert manager._listeners == []
+
+    def test_renewed_on_invalid_auth(self):
+        manager = self.manager(background=False)
+        api = self.client(access_token=None, client_id='id',
+                client_secret='secret', token_manager=manager)
+        self.server.revoked.add(ACCESS_TOKEN)
+        assert api.events(1)['id'] == 1
+        assert self.server.hits['/events/1'] == 2
+        assert api.base_requester.oauth_token == self.server.tokens[1]
+
+    def test_shared_file(self):
+        path = os.path.join(self.tmp, 'token.json')
+        first = self.manager(path=path).token()
+        assert self.manager(path=path).token() == first
+        assert self.server.hits['/oauth/token/'] == 1
+        if os.name == 'posix':
+            assert os.stat(path).st_mode & 0o777 == 0o600
+        # A process seeing the token rejected gets a new one for everybody
+        renewed = self.manager(path=path).refresh(stale=first)
+        assert renewed != first
+        assert self.manager(path=path).token() == renewed
+        assert self.server.hits['/oauth/token/'] == 2
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Output of the query string encoder against the one it replaced
+"""
+import logging; log = logging.getLogger(__name__)
+
+import unittest
+from collections import OrderedDict
+
+from ticketbis import _ticketbis_urlencode
+from ticketbis.benchmarks.urlencode import QUERIES, legacy_urlencode
+
+VALUES = [
+    u'', u'plain', u'with space', u'a&b=c', u'/events/1,/events/2',
+    u'1+1', u'~tilde', u'-_.', u'100%', u'?#[]@!$\'()*;:', u'"<>\\^`{|}',
+    u'Málaga', u'São Paulo', u'日本', u'emoji \U0001f3ab', u'\x00\n\t',
+    u'2016-01-01T00:00:00Z', b'bytes', 0, -1, 42, 2 ** 70, 1.5, -0.0,
+    True, False, None,
+]
+
+SEQUENCES = [
+    [], [1, 2, 3], (u'a b', u'c/d', u'e,f'), [u'Málaga', 7, None],
+    {u'x': 1}, b'ab',
+]
+
+
+class UrlencodeTestCase(unittest.TestCase):
+
+    def assert_same(self, query, **kwargs):
+        assert _ticketbis_urlencode(query, **kwargs) == \
+            legacy_urlencode(query, **kwargs), (query, kwargs)
+
+    def test_values(self):
+        for safe_chars in ('&/,+', '/', ''):
+            for value in VALUES:
+                for doseq in (0, 1):
+                    self.assert_same({u'key': value}, doseq=doseq,
+                            safe_chars=safe_chars)
+                    self.assert_same([(value, value)], doseq=doseq,
+                            safe_chars=safe_chars)
+
+    def test_sequences(self):
+        for value in SEQUENCES:
+            for doseq in (0, 1):
+                self.assert_same(OrderedDict([('a', value), ('b', 2)]),
+                        doseq=doseq)
+
+    def test_queries(self):
+        for query in QUERIES.values():
+            self.assert_same(query)
+            # Again, through the cache
+            self.assert_same(query)
+        self.assert_same({})
+        self.assert_same([])
+
+    def test_invalid(self):
+        for query in (None, 1, ['a', 'b']):
+            self.assertRaises(TypeError, _ticketbis_urlencode, query)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Client credentials tokens, cached and refreshed before they expire
+
+A TokenManager fetches a token once and keeps it, along with its expiry,
+for every client it is given to. The token is refreshed in the background
+before it expires, and clients get the new one automatically:
+
+    tokens = TokenManager(CLIENT_ID, CLIENT_SECRET)
+    client = Ticketbis(client_id=CLIENT_ID, client_secret=CLIENT_SECRET,
+            token_manager=tokens)
+
+Concurrent refreshes collapse into a single token request. Given a path,
+the token is kept in a file shared by every worker process of the host, so
+only one of them requests it:
+
+    tokens = TokenManager(CLIENT_ID, CLIENT_SECRET,
+            path='/var/run/ticketbis/token.json')
+
+Requests failing with InvalidAuth refresh the token and are sent once more.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import os
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+from ticketbis import (API_ENDPOINT, CLIENT_CRED_GRANT_TYPE, Ticketbis,
+        TicketbisException, json)
+from ticketbis.cache import _FileLock
+
+# Seconds before expiring a token gets refreshed, at most half its lifetime
+DEFAULT_REFRESH_MARGIN = 300
+
+# Seconds before a failed background refresh is tried again
+REFRESH_RETRY_DELAY = 30
+
+# expires_at and refresh_at are timestamps, None if the token doesn't expire
+Token = namedtuple('Token', ('access_token', 'expires_at', 'refresh_at'))
+
+
+class TokenManager(object):
+    """Cached client credentials token shared by clients and processes"""
+
+    def __init__(self, client_id, client_secret, api_endpoint=API_ENDPOINT,
+            scope='read write', path=None, refresh_margin=DEFAULT_REFRESH_MARGIN,
+            background=True):
+        """
+        Tokens are requested to api_endpoint for scope, and kept in the file
+        at path if given. Unless background is False, tokens are refreshed
+        by a daemon thread refresh_margin seconds before expiring, instead of
+        by the first caller needing a new one.
+        """
+        self.oauth = Ticketbis.OAuth(api_endpoint, client_id, client_secret,
+                None, CLIENT_CRED_GRANT_TYPE)
+        self.scope = scope
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.background = background
+        self._token = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._timer = None
+
+    @property
+    def access_token(self):
+        """Current token, without refreshing it"""
+        token = self._token
+        return token.access_token if token is not None else None
+
+    def token(self):
+        """Returns a valid access token, requesting one if needed"""
+        token = self._token
+        if token is None or _is_due(token):
+            return self.refresh(stale=token)
+        return token.access_token
+
+    def refresh(self, stale=None):
+        """
+        Requests a new token, unless one other than stale (a Token or an
+        access token) has been got meanwhile by another thread or process.
+        Returns the access token.
+        """
+        if isinstance(stale, Token):
+            stale = stale.access_token
+        with self._lock:
+            token = self._token
+            if token is None or token.access_token == stale or \
+                    _is_due(token):
+                token = self._shared_token(stale)
+                self._set(token)
+        return token.access_token
+
+    def subscribe(self, listener):
+        """
+        Calls listener with every new access token. Bound methods are only
+        weakly referenced, so clients nobody uses anymore stop getting them.
+        """
+        self._listeners.append(_WeakListener(listener))
+
+    def unsubscribe(self, listener):
+        self._listeners = [l for l in self._listeners
+                if l.alive() and not l.matches(listener)]
+
+    def close(self):
+        """Stops refreshing in the background"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _shared_token(self, stale):
+        """The token in the shared file if still good, a new one otherwise"""
+        if self.path is None:
+            return self._request()
+        with open(self.path + '.lock', 'a') as lock_file:
+            with _FileLock(lock_file, exclusive=True):
+                token = self._load()
+                if token is None or token.access_token == stale or \
+                        _is_due(token):
+                    token = self._request()
+                    self._save(token)
+                return token
+
+    def _request(self):
+        data = self.oauth.request_token(scope=self.scope)
+        now = time.time()
+        expires_at = refresh_at = None
+        if data.get('expires_in'):
+            lifetime = float(data['expires_in'])
+            expires_at = now + lifetime
+            refresh_at = expires_at - min(self.refresh_margin, lifetime / 2)
+        log.debug(u'Got a new token, expiring in %s seconds',
+                data.get('expires_in'))
+        return Token(data['access_token'], expires_at, refresh_at)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('client_id') != self.oauth.client_id:
+            return None
+        return Token(data['access_token'], data.get('expires_at'),
+                data.get('refresh_at'))
+
+    def _save(self, token):
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        # The token is a secret, only readable by its owner from the start
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({
+                'client_id': self.oauth.client_id,
+                'access_token': token.access_token,
+                'expires_at': token.expires_at,
+                'refresh_at': token.refresh_at,
+            }))
+        os.rename(tmp_path, self.path)
+
+    def _set(self, token):
+        """Keeps a token, telling listeners if it is new"""
+        previous, self._token = self._token, token
+        if self.background and token.refresh_at is not None:
+            self._schedule(token.refresh_at - time.time())
+        if previous is None or previous.access_token != token.access_token:
+            self._listeners = [l for l in self._listeners if l.alive()]
+            for listener in list(self._listeners):
+                listener(token.access_token)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0, delay), self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh(stale=self._token)
+        except TicketbisException as e:
+            log.warning(u'Could not refresh the token, trying again in %ds: '
+                    u'%s', REFRESH_RETRY_DELAY, e)
+            with self._lock:
+                self._schedule(REFRESH_RETRY_DELAY)
+
+
+class _WeakListener(object):
+    """Bound method referencing its object weakly, or any other callable"""
+
+    def __init__(self, listener):
+        if getattr(listener, '__func__', None) is None:
+            self.func, self.ref = listener, None
+        else:
+            self.func = listener.__func__
+            self.ref = weakref.ref(listener.__self__)
+
+    def target(self):
+        """The listener, None once its object is gone"""
+        if self.ref is None:
+            return self.func
+        obj = self.ref()
+        return None if obj is None else self.func.__get__(obj, type(obj))
+
+    def alive(self):
+        return self.target() is not None
+
+    def matches(self, listener):
+        return self.target() == listener
+
+    def __call__(self, access_token):
+        target = self.target()
+        if target is not None:
+            target(access_token)
+
+
+def _is_due(token):
+    """Whether a token should be refreshed already"""
+    return token.refresh_at is not None and time.time() >= token.refresh_at
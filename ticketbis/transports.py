@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# (c) 2015 Ticketbis
+"""
+Transports sending the requests of a client
+
+Clients send their requests through a pooled requests session by default.
+Any other transport can be given instead, i.e. HTTP2Transport, which
+multiplexes every request to a host over a single HTTP/2 connection shared by
+all the threads of the client (requires httpx[http2]):
+
+    client = Ticketbis(access_token=TOKEN, transport=HTTP2Transport(),
+            pagination_workers=8)
+
+A transport has a request method making a request and returning its
+response, and a close method. Responses have status_code, headers, content
+and text, or iter_content(chunk_size) and close() when streamed. The
+exceptions raised by requests that can't be made are listed in its errors
+attribute, and are raised as TicketbisException like any other error.
+ticketbis.benchmarks.server.StubTransport answers from the stub API without
+opening a socket.
+"""
+import logging; log = logging.getLogger(__name__)
+
+import ticketbis
+from ticketbis import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE
+
+
+class Transport(object):
+    """Base transport, see the module docstring"""
+    # Exceptions of requests that couldn't be made
+    errors = ()
+
+    def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        """
+        Makes a request, query being its encoded query string. Streamed
+        responses are read by the caller and closed once done.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases every pooled connection"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    """Keep-alive connections pooled by a requests session, the default"""
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            adapter_class=None, session=None):
+        """
+        Requests are sent through session if given (the requests module for
+        one-off connections), or a new session pooling pool_maxsize
+        connections per host for up to pool_connections hosts, mounted on
+        adapter_class.
+        """
+        import requests
+        self.errors = (requests.exceptions.RequestException, )
+        if session is None:
+            session = requests.Session()
+            adapter_class = adapter_class or requests.adapters.HTTPAdapter
+            adapter = adapter_class(pool_connections=pool_connections,
+                    pool_maxsize=pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if not keep_alive:
+                session.headers['Connection'] = 'close'
+        self.session = session
+
+    def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        return self.session.request(method, url, headers=headers,
+                params=query, data=data, files=files,
+                verify=ticketbis.VERIFY_SSL, auth=auth, stream=stream)
+
+    def close(self):
+        close = getattr(self.session, 'close', None)
+        # The requests module has nothing to release
+        if close is not None:
+            close()
+
+
+class HTTP2Transport(Transport):
+    """
+    Requests multiplexed over one HTTP/2 connection per host, shared by
+    every thread of the client. Hosts without HTTP/2 are spoken HTTP/1.1.
+    """
+
+    def __init__(self, pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            timeout=None, http1=True, client=None):
+        """
+        Requests are sent through an httpx client, created with HTTP/2
+        unless given. HTTP/2 is negotiated over TLS, falling back to
+        HTTP/1.1, unless http1 is False: then it is spoken right away, plain
+        http urls included (prior knowledge). Up to pool_maxsize HTTP/1.1
+        connections are kept per host. Requests time out after timeout
+        seconds, never by default.
+        """
+        import httpx
+        self.errors = (httpx.HTTPError, httpx.StreamError)
+        if client is None:
+            client = httpx.Client(http1=http1, http2=True,
+                    verify=ticketbis.VERIFY_SSL,
+                    timeout=timeout, limits=httpx.Limits(
+                        max_connections=None,
+                        max_keepalive_connections=pool_maxsize if keep_alive
+                        else 0))
+        self.client = client
+
+    def request(self, method, url, headers=None, query=None, data=None,
+            files=None, auth=None, stream=False):
+        if query:
+            url = '{0}?{1}'.format(url, query)
+        # Forms are encoded by httpx, JSON bodies are sent as they are
+        if files or isinstance(data, dict):
+            request = self.client.build_request(method, url, headers=headers,
+                    data=data, files=files)
+        else:
+            request = self.client.build_request(method, url, headers=headers,
+                    content=data)
+        return _HTTPXResponse(self.client.send(request, auth=auth,
+                stream=stream))
+
+    def close(self):
+        self.client.close()
+
+
+class _HTTPXResponse(object):
+    """httpx response as requests' ones are read"""
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.http_version = response.http_version
+
+    @property
+    def content(self):
+        return self.response.content
+
+    @property
+    def text(self):
+        return self.response.text
+
+    def iter_content(self, chunk_size=None):
+        return self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()